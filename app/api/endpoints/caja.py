@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, status
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
+from app.core.config import settings
 from app.utils.common_utils import handle_api_errors
-from app.services.caja_service import fverape_service
+from app.utils.http_cache import cache_http, invalidar_tablas
+from app.services.caja_service import fverape_service, caja_cache
 from app.models.pos_models import CajeroData
 from typing import Optional
 
@@ -15,11 +17,13 @@ class CajaVerificacionResponse(CajeroData):
 
 @router.get("/caja/verificar_apertura", response_model=Optional[CajaVerificacionResponse], tags=["Caja"])
 @handle_api_errors
+@cache_http(tablas=("cjp_recaja", "prp_person", "dep_descri"), modelo=CajaVerificacionResponse, ttl=settings.CAJA_CACHE_TTL)
 async def verificar_apertura_caja(
+    request: Request,
     codigo_caja: int = Query(1, description="Código de la caja a verificar (grrecaja.cjp_ccaj)"),
     codigo_almacen: int = Query(1, description="Código de almacén (grgenera.rgp_calm)"),
     prueba_factura: str = Query("N", description="Indicador de prueba (gxprufac: N, S, F). Omite la verificación si es diferente de 'N'."),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Migración de FUNCTION fverape. 
@@ -48,4 +52,19 @@ async def verificar_apertura_caja(
             cjp_ccaj=codigo_caja,
             **cajero_data.model_dump()
         )
-    return None
\ No newline at end of file
+    return None
+
+
+@router.post("/caja/invalidar", tags=["Caja"])
+@handle_api_errors
+async def invalidar_caja(
+    codigo_caja: Optional[int] = Query(None, description="Código de la caja abierta/cerrada (todas si se omite)"),
+    codigo_almacen: Optional[int] = Query(None, description="Código de almacén (todos si se omite)")
+):
+    """
+    Debe llamarse al abrir o cerrar una caja (o cambiar su cajero) para que
+    la próxima verificación consulte de nuevo la base de datos.
+    """
+    invalidadas = caja_cache.invalidar(rgp_calm=codigo_almacen, cjp_ccaj=codigo_caja)
+    invalidar_tablas("cjp_recaja")
+    return {"invalidadas": invalidadas, **caja_cache.estadisticas()}
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Query, Request, status
+from fastapi.responses import StreamingResponse
+from app.utils.api_helpers import raise_api_error
+from app.utils.common_utils import handle_api_errors
+from app.services.exportacion_service import (
+    FormatoExportacion, MEDIA_TYPES, fexporta_transacciones, fexporta_inventario
+)
+from datetime import date
+from typing import Optional
+
+router = APIRouter()
+
+
+def _respuesta(request: Request, cuerpo_fn, formato: FormatoExportacion, nombre: str) -> StreamingResponse:
+    """StreamingResponse con gzip si el cliente lo acepta (Accept-Encoding)."""
+    comprimir = "gzip" in request.headers.get("accept-encoding", "")
+    extension = "csv" if formato == 'csv' else "ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{nombre}.{extension}"'}
+    if comprimir:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(cuerpo_fn(comprimir), media_type=MEDIA_TYPES[formato], headers=headers)
+
+
+@router.get("/exportar/transacciones", tags=["Exportar"])
+@handle_api_errors
+async def exportar_transacciones(
+    request: Request,
+    formato: FormatoExportacion = Query('ndjson', description="ndjson (una línea JSON por fila) o csv"),
+    desde: Optional[date] = Query(None, description="Fecha inicial (trp_ftra >=)"),
+    hasta: Optional[date] = Query(None, description="Fecha final (trp_ftra <=)"),
+    codigo_almacen: Optional[int] = Query(None, description="Almacén (trp_calm); todos si se omite")
+):
+    """
+    Exporta las líneas de trp_tranin con un cursor del lado del servidor:
+    las filas se envían a medida que llegan, con memoria constante.
+    """
+    if desde and hasta and desde > hasta:
+        raise_api_error("La fecha inicial es posterior a la final.", status.HTTP_400_BAD_REQUEST)
+
+    return _respuesta(
+        request,
+        lambda comprimir: fexporta_transacciones(formato, comprimir, desde, hasta, codigo_almacen),
+        formato,
+        "transacciones"
+    )
+
+
+@router.get("/exportar/inventario", tags=["Exportar"])
+@handle_api_errors
+async def exportar_inventario(
+    request: Request,
+    formato: FormatoExportacion = Query('ndjson', description="ndjson (una línea JSON por fila) o csv"),
+    codigo_almacen: Optional[int] = Query(None, description="Almacén (ppp_calm); todos si se omite")
+):
+    """Exporta existencias y costo (ppp_propvt) por almacén y producto, en streaming."""
+    return _respuesta(
+        request,
+        lambda comprimir: fexporta_inventario(formato, comprimir, codigo_almacen),
+        formato,
+        "inventario"
+    )
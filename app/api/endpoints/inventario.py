@@ -1,33 +1,31 @@
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, Query, Request, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.utils.common_utils import handle_api_errors
 from app.services.inventario_service import finvpro_service, fdesglos_service
-from app.models.pos_models import InvProResult
+from app.services.receta_service import receta_cache
+from app.db.unidad_trabajo import fobtiene_uow
+from app.utils.json_rapido import frespuesta
+from app.utils.idempotencia import idempotente
+from app.models.pos_models import InvProResult, DesglosResult
 from decimal import Decimal
-from typing import Tuple
+from typing import Optional, Tuple
 
 router = APIRouter()
 
-class DesglosResult(BaseModel):
-    """Modelo de respuesta para el desglose de recetas."""
-    costo_materia_prima: float
-    costo_suministros: float
-    costo_mano_obra: float
-    cantidad_vendida: float
-    codigo_producto: int
-    
-    
+
 @router.post("/inventario/desglose_venta", response_model=DesglosResult, tags=["Inventario"])
 @handle_api_errors
+@idempotente("desglose_venta", modelo=DesglosResult)
 async def procesar_desglose_venta(
+    request: Request,
     codigo_producto: int = Query(..., description="Código del producto (lxcpro)"),
     cantidad: float = Query(..., description="Cantidad a vender (licantid)"),
     tipo_venta: int = Query(961, description="Tipo de Venta (lxtven, ej: 961=Mesa)"),
     codigo_almacen: int = Query(1, description="Código de almacén (rgp_calm)"),
     incluir_suministros: str = Query('S', description="Incluir suministros en el desglose (lxincsum: S/N)"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Migración de FUNCTION fdesglos. 
@@ -48,25 +46,27 @@ async def procesar_desglose_venta(
     )
     
     # Retornar los costos
-    return DesglosResult(
+    return frespuesta(DesglosResult(
         costo_materia_prima=float(costo_totales[0]),
         costo_suministros=float(costo_totales[1]),
         costo_mano_obra=float(costo_totales[2]),
         cantidad_vendida=cantidad,
         codigo_producto=codigo_producto
-    )
+    ))
 
     
 @router.post("/inventario/actualizar", response_model=InvProResult, tags=["Inventario"])
 @handle_api_errors
+@idempotente("inventario_actualizar", modelo=InvProResult)
 async def actualizar_inventario(
+    request: Request,
     codigo_producto: int = Query(..., description="Código del producto (lxcpro)"),
     cantidad_movida: float = Query(..., description="Cantidad a mover (lxcannue)"),
     # lxmodulo: -1 para Venta/Salida, 1 para Entrada/Compra
     modulo: int = Query(-1, description="Módulo de movimiento (-1=Salida/Venta, 1=Entrada/Compra)"),
     codigo_almacen: int = Query(1, description="Código de almacén (rgp_calm)"),
     calcula_costo: str = Query('S', description="Calcular costo promedio (licalcos: S/N)"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Migración de FUNCTION finvpro. (Se mantiene para ajustes manuales y pruebas)
@@ -79,12 +79,39 @@ async def actualizar_inventario(
     # El servicio espera el parámetro lxpar como 'A' o 'E' 
     lxpar_literal = 'A' if modulo > 0 else 'E' 
     
-    return await finvpro_service(
-        lxcpro=codigo_producto,
-        lxcannue=lxcannue_decimal,
-        lxmodulo=modulo,
-        rgp_calm=codigo_almacen,
-        db=db,
-        lxpar=lxpar_literal,
-        licalcos=calcula_costo
-    )
\ No newline at end of file
+    async def unidad():
+        return await finvpro_service(
+            lxcpro=codigo_producto,
+            lxcannue=lxcannue_decimal,
+            lxmodulo=modulo,
+            rgp_calm=codigo_almacen,
+            db=db,
+            lxpar=lxpar_literal,
+            licalcos=calcula_costo
+        )
+
+    # finvpro no hace commit propio: la transacción (con reintentos) se cierra aquí
+    return frespuesta(await fobtiene_uow(db).ejecutar(unidad, "finvpro"))
+
+
+@router.get("/inventario/recetas/cache", tags=["Inventario"])
+@handle_api_errors
+async def estadisticas_cache_recetas():
+    """
+    Estadísticas de la caché de recetas compiladas (aciertos, fallos, entradas).
+    """
+    return receta_cache.estadisticas()
+
+
+@router.delete("/inventario/recetas/cache", tags=["Inventario"])
+@handle_api_errors
+async def invalidar_cache_recetas(
+    codigo_producto: Optional[int] = Query(None, description="Invalida las recetas que usan este producto (fop_cpro/fop_cfor)"),
+    tipo_venta: Optional[int] = Query(None, description="Invalida solo este tipo de venta (fop_tven)")
+):
+    """
+    Invalida recetas compiladas tras editar fop_compro o inp_produc.
+    Sin parámetros vacía toda la caché.
+    """
+    invalidadas = receta_cache.invalidar(lxcpro=codigo_producto, lxtven=tipo_venta)
+    return {"invalidadas": invalidadas}
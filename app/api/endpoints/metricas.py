@@ -0,0 +1,127 @@
+from fastapi import APIRouter, Response
+from app.core.config import settings
+from app.core.instrumentacion import estadisticas_endpoints
+from app.core.metricas import Histograma
+from app.db.reintentos import estadisticas_reintentos
+from app.db.unidad_trabajo import estadisticas_commit
+from app.db.database import engine, async_engine
+from app.db.pool_stats import espera_pool
+from app.services.historial_service import historial_diferido
+from typing import Dict, List
+
+router = APIRouter()
+
+CONTENT_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def fetiquetas(etiquetas: Dict[str, object]) -> str:
+    pares = []
+    for nombre, valor in etiquetas.items():
+        valor = str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pares.append(f'{nombre}="{valor}"')
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def fnumero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Exposicion:
+    """Texto en formato de exposición de Prometheus (0.0.4)."""
+
+    def __init__(self):
+        self.lineas: List[str] = []
+
+    def metrica(self, nombre: str, tipo: str, ayuda: str) -> None:
+        self.lineas.append(f"# HELP {nombre} {ayuda}")
+        self.lineas.append(f"# TYPE {nombre} {tipo}")
+
+    def valor(self, nombre: str, etiquetas: Dict[str, object], valor: float) -> None:
+        self.lineas.append(f"{nombre}{fetiquetas(etiquetas)} {fnumero(valor)}")
+
+    def histograma(self, nombre: str, etiquetas: Dict[str, object], histograma: Histograma, escala: float = 1.0) -> None:
+        """Los histogramas internos están en ms: escala=0.001 los exporta en segundos."""
+        limites, acumulados, suma, total = histograma.instantanea()
+        for limite, acumulado in zip(limites, acumulados):
+            self.valor(f"{nombre}_bucket", {**etiquetas, "le": fnumero(limite * escala)}, acumulado)
+        self.valor(f"{nombre}_bucket", {**etiquetas, "le": "+Inf"}, acumulados[-1])
+        self.valor(f"{nombre}_sum", etiquetas, suma * escala)
+        self.valor(f"{nombre}_count", etiquetas, total)
+
+    def texto(self) -> str:
+        return "\n".join(self.lineas) + "\n"
+
+
+def fexposicion() -> str:
+    exp = Exposicion()
+    endpoints = estadisticas_endpoints.endpoints()
+
+    exp.metrica("pos_solicitudes_total", "counter", "Solicitudes HTTP por endpoint y código de estado.")
+    for endpoint, metricas in endpoints.items():
+        for estado, conteo in sorted(metricas.estados.items()):
+            exp.valor("pos_solicitudes_total", {"endpoint": endpoint, "estado": estado}, conteo)
+
+    exp.metrica("pos_solicitud_duracion_segundos", "histogram", "Latencia de la solicitud hasta el último byte de la respuesta.")
+    for endpoint, metricas in endpoints.items():
+        exp.histograma("pos_solicitud_duracion_segundos", {"endpoint": endpoint}, metricas.latencia, 0.001)
+
+    exp.metrica("pos_solicitud_sql_segundos", "histogram", "Tiempo total en sentencias SQL por solicitud.")
+    for endpoint, metricas in endpoints.items():
+        exp.histograma("pos_solicitud_sql_segundos", {"endpoint": endpoint}, metricas.sql, 0.001)
+
+    exp.metrica("pos_solicitud_sentencias_sql", "histogram", "Sentencias SQL ejecutadas por solicitud.")
+    for endpoint, metricas in endpoints.items():
+        exp.histograma("pos_solicitud_sentencias_sql", {"endpoint": endpoint}, metricas.sentencias)
+
+    exp.metrica("pos_solicitud_bloqueo_segundos", "histogram", "Espera de bloqueos de fila (FOR UPDATE) por solicitud.")
+    for endpoint, metricas in endpoints.items():
+        exp.histograma("pos_solicitud_bloqueo_segundos", {"endpoint": endpoint}, metricas.bloqueo, 0.001)
+
+    exp.metrica("pos_bloqueo_espera_segundos", "histogram", "Espera de cada SELECT ... FOR UPDATE (finvpro, desglose).")
+    for nombre, histograma in estadisticas_endpoints.bloqueos().items():
+        exp.histograma("pos_bloqueo_espera_segundos", {"bloqueo": nombre}, histograma, 0.001)
+
+    exp.metrica("pos_commit_duracion_segundos", "histogram", "Latencia del COMMIT de la unidad de trabajo.")
+    for endpoint, histograma in estadisticas_commit.latencias().items():
+        exp.histograma("pos_commit_duracion_segundos", {"endpoint": endpoint}, histograma, 0.001)
+
+    exp.metrica("pos_transacciones_total", "counter", "Commits, rollbacks y savepoints de la unidad de trabajo.")
+    for endpoint, contadores in estadisticas_commit.contadores().items():
+        for evento, conteo in contadores.items():
+            exp.valor("pos_transacciones_total", {"endpoint": endpoint, "evento": evento}, conteo)
+
+    exp.metrica("pos_unidad_trabajo_total", "counter", "Ejecuciones y reintentos (deadlock/serialización) por unidad de trabajo.")
+    for nombre, contadores in estadisticas_reintentos.resumen().items():
+        for evento, conteo in contadores.items():
+            exp.valor("pos_unidad_trabajo_total", {"unidad": nombre, "evento": evento}, conteo)
+
+    exp.metrica("pos_pool_espera_segundos", "histogram", "Tiempo para obtener una conexión del pool.")
+    for motor, histograma in espera_pool.items():
+        exp.histograma("pos_pool_espera_segundos", {"motor": motor}, histograma, 0.001)
+
+    exp.metrica("pos_pool_conexiones", "gauge", "Conexiones del pool en uso y libres.")
+    for motor, pool in (("async", async_engine.pool), ("sync", engine.pool)):
+        exp.valor("pos_pool_conexiones", {"motor": motor, "estado": "en_uso"}, pool.checkedout())
+        exp.valor("pos_pool_conexiones", {"motor": motor, "estado": "libres"}, pool.checkedin())
+
+    if settings.HISTORIAL_DIFERIDO:
+        historial = historial_diferido.estadisticas()
+        exp.metrica("pos_historial_pendientes", "gauge", "Filas de trt_tranin pendientes en el diario diferido.")
+        exp.valor("pos_historial_pendientes", {}, historial["pendientes"] or 0)
+        exp.metrica("pos_historial_retraso_segundos", "gauge", "Antigüedad de la fila pendiente más antigua.")
+        exp.valor("pos_historial_retraso_segundos", {}, historial["retraso_s"])
+        exp.metrica("pos_historial_filas_total", "counter", "Filas de trt_tranin diferidas por destino.")
+        for evento in ("encoladas", "vaciadas", "sincronas", "recuperadas", "descartadas"):
+            exp.valor("pos_historial_filas_total", {"evento": evento}, historial[evento])
+
+    return exp.texto()
+
+
+@router.get("/metrics", tags=["Sistema"], include_in_schema=False)
+async def metrics():
+    """
+    Métricas de este worker en formato Prometheus: latencia, SQL y espera de
+    bloqueos por endpoint, COMMIT, reintentos y pool de conexiones. Con varios
+    workers cada uno expone las suyas (Prometheus las suma por instancia).
+    """
+    return Response(fexposicion(), media_type=CONTENT_TYPE_PROMETHEUS)
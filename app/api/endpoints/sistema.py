@@ -0,0 +1,165 @@
+from fastapi import APIRouter, Query
+from app.utils.api_helpers import raise_api_error
+from app.utils.common_utils import handle_api_errors
+from app.db.reintentos import estadisticas_reintentos
+from app.db.unidad_trabajo import estadisticas_commit
+from app.db.database import engine, async_engine
+from app.db.pool_stats import festado_pool
+from app.db.perfil_sql import perfil_sql
+from app.services.historial_service import historial_diferido
+from app.utils.idempotencia import almacen_idempotencia
+from app.services.catalogo_service import catalogo_cache
+from app.utils.http_cache import respuesta_cache
+from app.services.referencia_service import referencia_store
+from app.utils.cache_utils import tablas_texto
+from typing import Literal, Optional
+
+router = APIRouter()
+
+
+@router.get("/sistema/reintentos", tags=["Sistema"])
+@handle_api_errors
+async def estadisticas_de_reintentos():
+    """
+    Ejecuciones, reintentos (deadlock/serialización) y reintentos agotados
+    por unidad de trabajo (fdesglos, ticket, finvpro, ftransac).
+    """
+    return estadisticas_reintentos.resumen()
+
+
+@router.get("/sistema/unidad_trabajo", tags=["Sistema"])
+@handle_api_errors
+async def estadisticas_unidad_trabajo():
+    """
+    Commits, rollbacks y savepoints por endpoint, con el histograma
+    de la latencia del COMMIT.
+    """
+    return estadisticas_commit.resumen()
+
+
+@router.get("/sistema/pool", tags=["Sistema"])
+@handle_api_errors
+async def estado_pool_conexiones():
+    """
+    Estado de los pools de conexiones de este worker (en uso, libres, overflow)
+    e histograma del tiempo de espera para obtener una conexión.
+    """
+    return {
+        "async": festado_pool("async", async_engine.pool),
+        "sync": festado_pool("sync", engine.pool),
+    }
+
+
+@router.get("/sistema/catalogo", tags=["Sistema"])
+@handle_api_errors
+async def estado_catalogo():
+    """
+    Catálogos de productos en memoria: productos, antigüedad de la última
+    carga completa, productos pendientes de refrescar y memoria aproximada.
+    """
+    return catalogo_cache.estadisticas()
+
+
+@router.post("/sistema/catalogo/recargar", tags=["Sistema"])
+@handle_api_errors
+async def recargar_catalogo(
+    codigo_almacen: Optional[int] = Query(None, description="Almacén a recargar (todos si se omite)")
+):
+    """Descarta el catálogo en memoria; se recarga completo en la próxima consulta."""
+    catalogo_cache.invalidar(codigo_almacen)
+    return {"success": True}
+
+
+@router.get("/sistema/cache_http", tags=["Sistema"])
+@handle_api_errors
+async def estado_cache_http():
+    """Respuestas en caché (ETag/304): entradas, aciertos, fallos y 304 servidos."""
+    return respuesta_cache.estadisticas()
+
+
+@router.post("/sistema/cache_http/invalidar", tags=["Sistema"])
+@handle_api_errors
+async def invalidar_cache_http(
+    tabla: Optional[str] = Query(None, description="Tabla modificada (ej: tip_tipven). Todas si se omite.")
+):
+    """
+    Invalida las respuestas que dependen de la tabla. Para cambios hechos
+    fuera de esta API (ej: edición de tipos de venta).
+    """
+    invalidadas = respuesta_cache.invalidar_tablas(*([tabla] if tabla else []))
+    return {"invalidadas": invalidadas}
+
+
+@router.get("/sistema/referencia", tags=["Sistema"])
+@handle_api_errors
+async def estado_referencia():
+    """Versión y fecha de carga de los datos de referencia (tip_tipven, dep_descri)."""
+    return referencia_store.estado()
+
+
+@router.post("/sistema/referencia/recargar", tags=["Sistema"])
+@handle_api_errors
+async def recargar_referencia():
+    """Recarga inmediata de los datos de referencia (tras editar tipos de venta o descripciones)."""
+    await referencia_store.recargar()
+    return referencia_store.estado()
+
+
+@router.get("/sistema/textos", tags=["Sistema"])
+@handle_api_errors
+async def estado_textos():
+    """Tablas de textos (textos/*.tbl) cargadas, con sus líneas, y recargas por cambio de archivo."""
+    return tablas_texto.estadisticas()
+
+
+@router.get("/sistema/sql", tags=["Sistema"])
+@handle_api_errors
+async def perfil_sentencias_sql(
+    orden: Literal['total_ms', 'p95_ms', 'max_ms', 'conteo', 'lentas'] = Query('total_ms'),
+    limite: int = Query(20, ge=1, le=500)
+):
+    """
+    Sentencias SQL de este worker agrupadas por huella (literales y parámetros
+    normalizados): conteo, tiempo total, p50/p95 recientes, máximo y la última
+    ejecución lenta con la forma de sus parámetros.
+    """
+    return {"desde": perfil_sql.inicio.isoformat(), "sentencias": perfil_sql.top(orden, limite)}
+
+
+@router.get("/sistema/sql/{huella}", tags=["Sistema"])
+@handle_api_errors
+async def detalle_sentencia_sql(huella: str):
+    """Detalle de una huella, con el último plan capturado (SQL_EXPLAIN)."""
+    detalle = perfil_sql.detalle(huella)
+    if detalle is None:
+        raise_api_error(f"No hay estadísticas para la huella {huella}.", 404)
+    return detalle
+
+
+@router.post("/sistema/sql/reiniciar", tags=["Sistema"])
+@handle_api_errors
+async def reiniciar_perfil_sql():
+    """Descarta el perfil acumulado (ej: antes de una prueba de carga)."""
+    perfil_sql.reiniciar()
+    return {"success": True}
+
+
+@router.get("/sistema/historial", tags=["Sistema"])
+@handle_api_errors
+async def estado_historial_diferido():
+    """
+    Escritura diferida de trt_tranin: filas pendientes en el diario, retraso
+    de la más antigua, encoladas, vaciadas e insertadas en la transacción
+    por contrapresión.
+    """
+    return historial_diferido.estadisticas()
+
+
+@router.get("/sistema/idempotencia", tags=["Sistema"])
+@handle_api_errors
+async def estado_idempotencia():
+    """
+    Claves de idempotencia en curso y, en este worker, solicitudes ejecutadas,
+    respuestas repetidas, esperas de duplicados y claves rechazadas (422).
+    """
+    return almacen_idempotencia.estadisticas()
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, status, HTTPException # <-- ¡HTTPException CORREGIDO!
+from fastapi import APIRouter, Depends, Request, status, HTTPException # <-- ¡HTTPException CORREGIDO!
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
+from app.db.unidad_trabajo import fobtiene_uow
 from app.utils.common_utils import handle_api_errors
-from app.services.transac_service import ftransac_service
+from app.utils.idempotencia import idempotente
+from app.services.transac_service import ftransac_service, ftransac_bulk_service
 from app.models.pos_models import TranInLine
 from decimal import Decimal
 from typing import List
@@ -20,22 +22,24 @@ class TranInResponse(BaseModel):
 
 @router.post("/transacciones/registrar_linea", response_model=TranInResponse, tags=["Transacciones"])
 @handle_api_errors
+@idempotente("registrar_linea", modelo=TranInResponse)
 async def registrar_linea_transaccion(
+    request: Request,
     linea_data: TranInLine,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Migración de FUNCTION ftransac. 
     Registra una línea de transacción completa en trp_tranin y trt_tranin.
     """
     
+    async def unidad():
+        return await ftransac_service(data=linea_data, db=db)
+
     try:
-        # Nota: Asumimos que esta llamada a ftransac_service no necesita un db.begin() 
-        # porque la transacción final (db.commit()) se hace después.
-        exito = await ftransac_service(data=linea_data, db=db)
-        
-        # Hacemos el commit final (que en el 4GL era externo)
-        db.commit()
+        # El commit final (que en el 4GL era externo) lo hace la unidad de trabajo,
+        # con ROLLBACK automático si algo falla
+        exito = await fobtiene_uow(db).ejecutar(unidad, "ftransac")
 
         if exito:
             return TranInResponse(
@@ -50,9 +54,41 @@ async def registrar_linea_transaccion(
             )
             
     except Exception as e:
-        db.rollback() # Aseguramos el rollback si algo falló en la base de datos
         # El error de la BD será atrapado aquí y devuelto como 500
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fatal durante la inserción: {e}"
-        )
\ No newline at end of file
+        )
+
+
+@router.post("/transacciones/registrar_lineas", response_model=TranInResponse, tags=["Transacciones"])
+@handle_api_errors
+@idempotente("registrar_lineas", modelo=TranInResponse)
+async def registrar_lineas_transaccion(
+    request: Request,
+    lineas: List[TranInLine],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Versión masiva de ftransac (reprocesos de cierre, cargas de fin de día).
+    Registra todas las líneas en trp_tranin y trt_tranin con inserciones de
+    varias filas y un solo commit.
+    """
+    
+    async def unidad():
+        return await ftransac_bulk_service(lineas=lineas, db=db)
+
+    try:
+        num_lineas = await fobtiene_uow(db).ejecutar(unidad, "ftransac_masivo")
+
+        return TranInResponse(
+            success=True,
+            message="Líneas de transacción registradas correctamente.",
+            num_lineas=num_lineas
+        )
+            
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fatal durante la inserción: {e}"
+        )
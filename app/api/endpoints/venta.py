@@ -1,15 +1,29 @@
-from fastapi import APIRouter, Depends, Query, status
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi import APIRouter, Depends, Query, Request, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.utils.common_utils import handle_api_errors
-from app.services.venta_service import get_venta_config
-from app.models.pos_models import VentaConfigResponse
+from app.utils.http_cache import cache_http
+from app.utils.json_rapido import frespuesta
+from app.utils.idempotencia import idempotente
+from app.services.venta_service import get_venta_config, fticket_service
+from app.models.pos_models import VentaConfigResponse, TicketVenta, DesglosResult
+from typing import List
 
 router = APIRouter()
 
+# Modelo de respuesta del registro de un ticket completo
+class TicketVentaResponse(BaseModel):
+    success: bool
+    message: str
+    num_lineas: int
+    lineas: List[DesglosResult]
+
 @router.get("/venta/configuracion", response_model=VentaConfigResponse, tags=["Ventas"])
 @handle_api_errors
+@cache_http(tablas=("tip_tipven",), modelo=VentaConfigResponse)
 async def configuracion_venta(
+    request: Request,
     tipo_venta: int = Query(..., description="Código de tipo de venta (960-964). Corresponde a 'par' en ftitulff."),
     # Estos dos parámetros simulan las variables globales
     # Asumimos que rgp_calm siempre es 1 para la prueba inicial
@@ -17,7 +31,7 @@ async def configuracion_venta(
     codigo_almacen: int = Query(1, description="Código de Almacén (grgenera.rgp_calm)"),
     tipo_sociedad: int = Query(1, description="Tipo de Sociedad (grgener1.rgp_csoc, ej: 1=Restaurante, 3=Distribuidor)"),
     prueba_factura: str = Query("N", description="Indicador de prueba de factura (N, S, F). Corresponde a 'gxprufac'."),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Migración de FUNCTION ftitulff. 
@@ -31,4 +45,37 @@ async def configuracion_venta(
         gxprufac=prueba_factura,
         rgp_csoc=tipo_sociedad,
         db=db
-    )
\ No newline at end of file
+    )
+
+
+@router.post("/venta/ticket", response_model=TicketVentaResponse, tags=["Ventas"])
+@handle_api_errors
+@idempotente("ticket", modelo=TicketVentaResponse)
+async def registrar_ticket_venta(
+    request: Request,
+    ticket: TicketVenta,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Desglose (fdesglos) y registro (ftransac) de todas las líneas de un ticket
+    en una sola llamada y una sola transacción. Reemplaza las llamadas por línea
+    a /inventario/desglose_venta y /transacciones/registrar_linea.
+    """
+
+    resultado = await fticket_service(ticket=ticket, db=db)
+
+    return frespuesta(TicketVentaResponse(
+        success=True,
+        message="Ticket registrado correctamente.",
+        num_lineas=len(resultado),
+        lineas=[
+            DesglosResult(
+                costo_materia_prima=float(costos[0]),
+                costo_suministros=float(costos[1]),
+                costo_mano_obra=float(costos[2]),
+                cantidad_vendida=float(linea.trp_qtra),
+                codigo_producto=linea.trp_cpro
+            )
+            for linea, costos in resultado
+        ]
+    ))
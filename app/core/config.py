@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Literal
 import os
 
 class Settings(BaseSettings):
@@ -10,6 +11,72 @@ class Settings(BaseSettings):
     # ¡Lee la URL de la base de datos!
     DATABASE_URL: str
 
+    # Pool de conexiones (por worker de uvicorn y por motor sync/async)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30          # segundos esperando una conexión libre
+    DB_POOL_RECYCLE: int = 1800        # segundos; menor que el corte de inactividad del servidor
+    DB_POOL_PRE_PING: bool = True      # verifica la conexión antes de entregarla
+    DB_STATEMENT_TIMEOUT_MS: int = 0   # statement_timeout de PostgreSQL; 0 = sin límite
+    ARRANQUE_CONEXIONES: int = 2       # conexiones que se abren en el calentamiento (máx. DB_POOL_SIZE)
+
+    # Caché de recetas compiladas (segundos). 0 = desactivada (consulta recursiva)
+    RECETAS_CACHE_TTL: int = 300
+
+    # Caché HTTP (ETag/304) de endpoints de solo lectura
+    HTTP_CACHE_TTL: int = 300
+    HTTP_CACHE_MAX_ENTRADAS: int = 2048
+
+    # Respuestas serializadas directamente a bytes (orjson si está instalado),
+    # sin revalidar contra response_model los resultados de los servicios.
+    # Opcional: activar después de medir con benchmarks/bench_json.py
+    JSON_RAPIDO: bool = False
+
+    # Vida de las cajas verificadas en caché (fverape y la respuesta HTTP de
+    # /caja/verificar_apertura); 0 = sin caché
+    CAJA_CACHE_TTL: int = 15
+
+    # Recarga en segundo plano de tip_tipven / dep_descri
+    REFERENCIA_REFRESCO_SEGUNDOS: int = 600
+
+    # Catálogo de productos en memoria para /listado/productos
+    CATALOGO_CACHE: bool = True
+    CATALOGO_REFRESCO_SEGUNDOS: int = 300
+
+    # Reintentos de transacciones abortadas por deadlock/serialización
+    DB_REINTENTOS_MAX: int = 3
+    DB_REINTENTOS_ESPERA_MS: int = 50
+    DB_REINTENTOS_ESPERA_MAX_MS: int = 1000
+
+    # Perfil de sentencias SQL (app/db/perfil_sql.py): p50/p95 sobre las últimas
+    # SQL_PERFIL_VENTANA ejecuciones; log de las que pasan de SQL_LENTA_MS (0 = sin log)
+    SQL_PERFIL: bool = True
+    SQL_PERFIL_VENTANA: int = 1024
+    SQL_LENTA_MS: int = 500
+    # EXPLAIN (ANALYZE, BUFFERS) de los SELECT lentos, en una conexión aparte
+    SQL_EXPLAIN: bool = False
+    SQL_EXPLAIN_INTERVALO_SEGUNDOS: int = 600   # por huella
+    SQL_EXPLAIN_TIMEOUT_MS: int = 10000
+
+    # Escritura diferida de trt_tranin: la copia histórica se anota en un diario
+    # SQLite local antes del COMMIT (con un token en hdt_tokens dentro de la
+    # transacción) y se inserta en lotes después (historial_service)
+    HISTORIAL_DIFERIDO: bool = False
+    HISTORIAL_COLA_RUTA: str = "historial_trt.sqlite3"
+    HISTORIAL_COLA_MAX: int = 50000      # filas pendientes; pasado el límite se inserta en la transacción
+    HISTORIAL_LOTE: int = 1000
+    HISTORIAL_INTERVALO_MS: int = 200    # espera del vaciador cuando el diario está vacío
+
+    # Claves de idempotencia (Idempotency-Key) de los POST de venta e inventario:
+    # respuestas en PostgreSQL (idp_claves); las claves en curso, en un SQLite local
+    IDEMPOTENCIA_RUTA: str = "idempotencia.sqlite3"
+    IDEMPOTENCIA_TTL: int = 86400              # segundos que se guarda la respuesta
+    IDEMPOTENCIA_ESPERA_SEGUNDOS: int = 30     # espera de un duplicado mientras el original sigue en curso
+    IDEMPOTENCIA_EN_CURSO_SEGUNDOS: int = 120  # vida de un 'en curso' (worker caído a mitad de la solicitud)
+
+    # Motor del costeo por lotes (costeo_service): numpy, decimal o verificar (ambos + comparación)
+    COSTEO_MOTOR: Literal['numpy', 'decimal', 'verificar'] = 'numpy'
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,151 @@
+from app.core.metricas import Histograma
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+import threading
+import time
+
+# Límites del histograma de sentencias SQL por solicitud (cantidad, no ms)
+LIMITES_SENTENCIAS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# Ruta usada cuando la solicitud no coincidió con ningún endpoint (evita
+# una serie por cada URL inválida)
+SIN_RUTA = "sin_ruta"
+
+
+class MedicionSolicitud:
+    """Lo que consume una solicitud en la BD: sentencias, tiempo SQL y espera de bloqueos."""
+
+    __slots__ = ("sentencias", "sql_ms", "bloqueo_ms")
+
+    def __init__(self):
+        self.sentencias = 0
+        self.sql_ms = 0.0
+        self.bloqueo_ms = 0.0
+
+
+# Medición de la solicitud en curso. Es un objeto mutable: las tareas y los
+# hilos (to_thread) que copian el contexto siguen sumando en el mismo.
+medicion_actual: ContextVar[Optional[MedicionSolicitud]] = ContextVar("medicion_actual", default=None)
+
+
+class MetricasEndpoint:
+    def __init__(self):
+        self.latencia = Histograma()
+        self.sql = Histograma()
+        self.bloqueo = Histograma()
+        self.sentencias = Histograma(LIMITES_SENTENCIAS)
+        self.estados: Dict[int, int] = {}
+
+
+class EstadisticasEndpoints:
+    """Latencia, SQL y espera de bloqueos por endpoint ("METHOD /ruta") de este worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, MetricasEndpoint] = {}
+        self._bloqueos: Dict[str, Histograma] = {}
+
+    def registrar(self, endpoint: str, estado: int, latencia_ms: float, medicion: MedicionSolicitud) -> None:
+        with self._lock:
+            metricas = self._endpoints.get(endpoint)
+            if metricas is None:
+                metricas = self._endpoints[endpoint] = MetricasEndpoint()
+            metricas.estados[estado] = metricas.estados.get(estado, 0) + 1
+        metricas.latencia.observar(latencia_ms)
+        metricas.sql.observar(medicion.sql_ms)
+        metricas.bloqueo.observar(medicion.bloqueo_ms)
+        metricas.sentencias.observar(medicion.sentencias)
+
+    def registrar_bloqueo(self, nombre: str, espera_ms: float) -> None:
+        with self._lock:
+            histograma = self._bloqueos.get(nombre)
+            if histograma is None:
+                histograma = self._bloqueos[nombre] = Histograma()
+        histograma.observar(espera_ms)
+
+    def endpoints(self) -> Dict[str, MetricasEndpoint]:
+        with self._lock:
+            return dict(self._endpoints)
+
+    def bloqueos(self) -> Dict[str, Histograma]:
+        with self._lock:
+            return dict(self._bloqueos)
+
+
+estadisticas_endpoints = EstadisticasEndpoints()
+
+
+@contextmanager
+def fmide_bloqueo(nombre: str) -> Iterator[None]:
+    """
+    Mide la espera de un SELECT ... FOR UPDATE (el tiempo de la sentencia, que
+    en contención es casi todo espera del bloqueo). Ej:
+
+        with fmide_bloqueo("finvpro"):
+            row = (await db.execute(query, params)).fetchone()
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        espera_ms = (time.perf_counter() - inicio) * 1000
+        estadisticas_endpoints.registrar_bloqueo(nombre, espera_ms)
+        medicion = medicion_actual.get()
+        if medicion is not None:
+            medicion.bloqueo_ms += espera_ms
+
+
+def fregistra_eventos_sql(engine) -> None:
+    """Cuenta las sentencias y su tiempo en la medición de la solicitud en curso."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._inicio_medicion = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def despues(conn, cursor, statement, parameters, context, executemany):
+        medicion = medicion_actual.get()
+        inicio = getattr(context, "_inicio_medicion", None)
+        if medicion is None or inicio is None:
+            return
+        medicion.sentencias += 1
+        medicion.sql_ms += (time.perf_counter() - inicio) * 1000
+
+
+class MetricasMiddleware:
+    """
+    Middleware ASGI: abre la medición de cada solicitud HTTP y al terminar de
+    enviar la respuesta la registra bajo la ruta del endpoint (la plantilla,
+    ej. "GET /api/listado/{list_name}", no la URL concreta).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicion = MedicionSolicitud()
+        token = medicion_actual.set(medicion)
+        estado = 500
+        inicio = time.perf_counter()
+
+        async def send_medido(message):
+            nonlocal estado
+            if message["type"] == "http.response.start":
+                estado = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            medicion_actual.reset(token)
+            ruta = scope.get("route")
+            endpoint = f"{scope['method']} {ruta.path}" if ruta is not None else SIN_RUTA
+            estadisticas_endpoints.registrar(endpoint, estado, latencia_ms, medicion)
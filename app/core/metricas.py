@@ -0,0 +1,50 @@
+import bisect
+import itertools
+import threading
+from typing import List, Sequence, Tuple
+
+# Límites por defecto de los histogramas de latencia (milisegundos)
+LIMITES_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histograma:
+    """Histograma acumulativo de latencias en milisegundos (seguro entre hilos)."""
+
+    def __init__(self, limites: Sequence[float] = LIMITES_MS):
+        self.limites = tuple(limites)
+        self._conteos = [0] * (len(self.limites) + 1)  # último = +Inf
+        self._suma = 0.0
+        self._total = 0
+        self._maximo = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor_ms: float) -> None:
+        indice = bisect.bisect_left(self.limites, valor_ms)
+        with self._lock:
+            self._conteos[indice] += 1
+            self._suma += valor_ms
+            self._total += 1
+            if valor_ms > self._maximo:
+                self._maximo = valor_ms
+
+    def instantanea(self) -> Tuple[Tuple[float, ...], List[int], float, int]:
+        """(límites, conteos acumulados por límite + el de +Inf, suma, total) para exportar."""
+        with self._lock:
+            acumulados = list(itertools.accumulate(self._conteos))
+            return self.limites, acumulados, self._suma, self._total
+
+    def resumen(self) -> dict:
+        with self._lock:
+            acumulado = 0
+            buckets = {}
+            for limite, conteo in zip(self.limites, self._conteos):
+                acumulado += conteo
+                buckets[f"le_{limite}"] = acumulado
+            buckets["le_inf"] = acumulado + self._conteos[-1]
+            return {
+                "total": self._total,
+                "suma_ms": round(self._suma, 3),
+                "media_ms": round(self._suma / self._total, 3) if self._total else 0.0,
+                "max_ms": round(self._maximo, 3),
+                "buckets": buckets,
+            }
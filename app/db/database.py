@@ -1,7 +1,12 @@
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from app.core.config import settings
+from app.db.pool_stats import QueuePoolMedido, AsyncAdaptedQueuePoolMedido
+from app.core.instrumentacion import fregistra_eventos_sql
+from app.db.perfil_sql import perfil_sql
 
 # Importaciones y configuración para forzar la lectura correcta de DECIMAL
 import psycopg2.extensions
@@ -32,15 +37,53 @@ try:
 except IndexError:
     host = None
 
-# 2. Creamos el motor de la BD
+# 2. Opciones del pool de conexiones (ver Settings). El pre-ping y el recycle
+#    evitan que la primera solicitud tras un periodo inactivo falle porque el
+#    servidor cerró la conexión.
+pool_options = {
+    'pool_size': settings.DB_POOL_SIZE,
+    'max_overflow': settings.DB_MAX_OVERFLOW,
+    'pool_timeout': settings.DB_POOL_TIMEOUT,
+    'pool_recycle': settings.DB_POOL_RECYCLE,
+    'pool_pre_ping': settings.DB_POOL_PRE_PING,
+}
+
+connect_args = {'host': host} if host else {}
+async_connect_args = dict(connect_args)
+if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+    connect_args['options'] = f'-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}'
+    async_connect_args['server_settings'] = {'statement_timeout': str(settings.DB_STATEMENT_TIMEOUT_MS)}
+
+# 3. Creamos el motor de la BD
 engine = create_engine(
     # Usamos el dialecto explícito para evitar el problema de socket/red
     settings.DATABASE_URL.replace('postgresql://', 'postgresql+psycopg2://'),
-    connect_args={'host': host} if host else {}
+    connect_args=connect_args,
+    poolclass=QueuePoolMedido,
+    **pool_options
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 4. Motor asíncrono (asyncpg) para los endpoints: no bloquea el event loop.
+#    asyncpg ya devuelve NUMERIC como Decimal, no necesita el cast de arriba.
+async_engine = create_async_engine(
+    settings.DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://'),
+    connect_args=async_connect_args,
+    poolclass=AsyncAdaptedQueuePoolMedido,
+    **pool_options
+)
+
+# 5. Sentencias y tiempo SQL por solicitud (ver app/core/instrumentacion.py)
+fregistra_eventos_sql(engine)
+fregistra_eventos_sql(async_engine.sync_engine)
+perfil_sql.registrar(engine, "sync")
+perfil_sql.registrar(async_engine.sync_engine, "async")
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -52,4 +95,16 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db(request: Request):
+    """
+    Versión asíncrona de get_db: abre una AsyncSession por solicitud
+    y la cierra al terminar. Guarda la ruta del endpoint para las
+    estadísticas de la unidad de trabajo (app/db/unidad_trabajo.py).
+    """
+    async with AsyncSessionLocal() as db:
+        ruta = request.scope.get("route")
+        db.info["endpoint"] = f"{request.method} {ruta.path if ruta else request.url.path}"
+        yield db
@@ -0,0 +1,246 @@
+from app.core.config import settings
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Huellas distintas que se guardan; las nuevas, pasado el límite, se agrupan aquí
+MAX_HUELLAS = 1000
+HUELLA_OTRAS = "otras"
+
+# Texto normalizado que se guarda por huella (las listas de columnas largas se truncan)
+MAX_SQL = 600
+
+# Planes pendientes de capturar; si la cola está llena el pedido se descarta
+MAX_COLA_EXPLAIN = 16
+
+# --- Normalización (huella) ---
+COMENTARIO = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+CADENA = re.compile(r"'(?:[^']|'')*'")
+MARCADOR = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+")
+NUMERO = re.compile(r"(?<![\w.$])\d+(?:\.\d+)?\b")
+LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+ESPACIOS = re.compile(r"\s+")
+
+# EXPLAIN ANALYZE ejecuta la sentencia: solo SELECT que no bloquean ni modifican nada
+SELECT = re.compile(r"\s*select\b", re.I)
+NO_EXPLICABLE = re.compile(r"\bfor\s+(?:update|share|no\s+key\s+update|key\s+share)\b|\b(?:nextval|setval)\s*\(", re.I)
+
+
+@lru_cache(maxsize=4096)
+def fhuella(statement: str) -> Tuple[str, str]:
+    """
+    (huella, sql normalizado). Los literales y parámetros pasan a '?' y las
+    listas (?, ?, ...) a (?...): la misma consulta con otros valores o con
+    otra cantidad de elementos da la misma huella.
+    """
+    sql = COMENTARIO.sub(" ", statement)
+    sql = CADENA.sub("?", sql)
+    sql = MARCADOR.sub("?", sql)
+    sql = NUMERO.sub("?", sql)
+    sql = LISTA.sub("(?...)", sql)
+    sql = ESPACIOS.sub(" ", sql).strip()
+    return hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12], sql[:MAX_SQL]
+
+
+def fforma(valor) -> str:
+    """Forma de un parámetro (tipo y tamaño, sin el valor)."""
+    if valor is None:
+        return "null"
+    if isinstance(valor, (list, tuple)):
+        tipos = sorted({type(v).__name__ for v in valor})
+        return f"{'|'.join(tipos) or 'vacía'}[{len(valor)}]"
+    if isinstance(valor, (str, bytes)):
+        return f"{type(valor).__name__}({len(valor)})"
+    return type(valor).__name__
+
+
+def fformas(parametros, executemany: bool):
+    if executemany and parametros:
+        return {"filas": len(parametros), "primera": fformas(parametros[0], False)}
+    if isinstance(parametros, dict):
+        return {nombre: fforma(valor) for nombre, valor in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        return [fforma(valor) for valor in parametros]
+    return fforma(parametros)
+
+
+class EstadisticasSentencia:
+    def __init__(self, huella: str, sql: str, motor: str, ventana: int):
+        self.huella = huella
+        self.sql = sql
+        self.motor = motor
+        self.conteo = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.lentas = 0
+        self.recientes: Deque[float] = deque(maxlen=ventana)
+        self.ultima_lenta: Optional[dict] = None
+        self.plan: Optional[dict] = None
+        self.plan_pedido = 0.0  # monotonic del último EXPLAIN encolado
+
+    def resumen(self) -> dict:
+        recientes = sorted(self.recientes)
+
+        def percentil(p: float) -> float:
+            return round(recientes[int(round(p * (len(recientes) - 1)))], 3) if recientes else 0.0
+
+        return {
+            "huella": self.huella,
+            "motor": self.motor,
+            "sql": self.sql,
+            "conteo": self.conteo,
+            "total_ms": round(self.total_ms, 3),
+            "media_ms": round(self.total_ms / self.conteo, 3) if self.conteo else 0.0,
+            "p50_ms": percentil(0.50),
+            "p95_ms": percentil(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "lentas": self.lentas,
+            "ultima_lenta": self.ultima_lenta,
+            "tiene_plan": self.plan is not None,
+        }
+
+
+class PerfilSQL:
+    """
+    Perfil por sentencia de este worker: cada sentencia ejecutada en los motores
+    registrados se agrupa por huella, con conteo, tiempo total, máximo y p50/p95
+    de las últimas SQL_PERFIL_VENTANA ejecuciones. Las que pasan de SQL_LENTA_MS
+    se registran en el log con la forma de sus parámetros y, con SQL_EXPLAIN,
+    se encola su EXPLAIN (ANALYZE, BUFFERS) en una conexión aparte (solo SELECT
+    del motor async, como máximo una vez por intervalo y huella).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sentencias: Dict[str, EstadisticasSentencia] = {}
+        self._cola: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.inicio = datetime.now()
+
+    def registrar(self, engine, motor: str) -> None:
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def antes(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context._inicio_perfil = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def despues(conn, cursor, statement, parameters, context, executemany):
+            inicio = getattr(context, "_inicio_perfil", None)
+            if inicio is None or not context.execution_options.get("perfil_sql", True):
+                return
+            self.observar(motor, statement, parameters, executemany, (time.perf_counter() - inicio) * 1000)
+
+    def observar(self, motor: str, statement: str, parameters, executemany: bool, ms: float) -> None:
+        if not settings.SQL_PERFIL:
+            return
+        huella, sql = fhuella(statement)
+        with self._lock:
+            stats = self._sentencias.get(huella)
+            if stats is None:
+                if len(self._sentencias) >= MAX_HUELLAS:
+                    huella, sql = HUELLA_OTRAS, HUELLA_OTRAS
+                    stats = self._sentencias.get(huella)
+                if stats is None:
+                    stats = self._sentencias[huella] = EstadisticasSentencia(huella, sql, motor, settings.SQL_PERFIL_VENTANA)
+            stats.conteo += 1
+            stats.total_ms += ms
+            stats.recientes.append(ms)
+            if ms > stats.max_ms:
+                stats.max_ms = ms
+            lenta = settings.SQL_LENTA_MS > 0 and ms >= settings.SQL_LENTA_MS
+            if lenta:
+                stats.lentas += 1
+                formas = fformas(parameters, executemany)
+                stats.ultima_lenta = {"ms": round(ms, 3), "fecha": datetime.now().isoformat(), "parametros": formas}
+                pedir_plan = self._pedir_plan(stats, motor, statement, executemany)
+
+        if lenta:
+            logger.warning(f"SQL lenta {ms:.1f} ms [{huella}] {sql[:200]} parametros={formas}")
+            if pedir_plan:
+                self._loop.call_soon_threadsafe(self._encolar, huella, statement, parameters)
+
+    def _pedir_plan(self, stats: EstadisticasSentencia, motor: str, statement: str, executemany: bool) -> bool:
+        if self._cola is None or motor != "async" or executemany:
+            return False
+        if not SELECT.match(statement) or NO_EXPLICABLE.search(statement):
+            return False
+        ahora = time.monotonic()
+        if stats.plan_pedido and ahora - stats.plan_pedido < settings.SQL_EXPLAIN_INTERVALO_SEGUNDOS:
+            return False
+        stats.plan_pedido = ahora
+        return True
+
+    def _encolar(self, huella: str, statement: str, parameters) -> None:
+        try:
+            self._cola.put_nowait((huella, statement, parameters))
+        except asyncio.QueueFull:
+            pass
+
+    async def _explain(self, async_engine, statement: str, parameters) -> str:
+        async with async_engine.connect() as conn:
+            conn = await conn.execution_options(perfil_sql=False)
+            try:
+                if settings.SQL_EXPLAIN_TIMEOUT_MS > 0:
+                    await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.SQL_EXPLAIN_TIMEOUT_MS)}")
+                resultado = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                return "\n".join(row[0] for row in resultado)
+            finally:
+                await conn.rollback()
+
+    async def ciclo_explain(self, async_engine) -> None:
+        """Tarea de fondo: captura los planes de las sentencias lentas encoladas."""
+        self._loop = asyncio.get_running_loop()
+        self._cola = asyncio.Queue(MAX_COLA_EXPLAIN)
+        try:
+            while True:
+                huella, statement, parameters = await self._cola.get()
+                inicio = time.perf_counter()
+                try:
+                    plan = await self._explain(async_engine, statement, parameters)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    plan = f"ERROR: {e}"
+                    logger.warning(f"EXPLAIN de [{huella}] falló: {e}")
+                with self._lock:
+                    stats = self._sentencias.get(huella)
+                    if stats is not None:
+                        stats.plan = {
+                            "fecha": datetime.now().isoformat(),
+                            "ms": round((time.perf_counter() - inicio) * 1000, 3),
+                            "plan": plan,
+                        }
+        finally:
+            self._cola = None
+
+    def top(self, orden: str = "total_ms", limite: int = 20) -> List[dict]:
+        with self._lock:
+            resumenes = [stats.resumen() for stats in self._sentencias.values()]
+        resumenes.sort(key=lambda r: r[orden], reverse=True)
+        return resumenes[:limite]
+
+    def detalle(self, huella: str) -> Optional[dict]:
+        with self._lock:
+            stats = self._sentencias.get(huella)
+            if stats is None:
+                return None
+            return {**stats.resumen(), "plan": stats.plan}
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._sentencias.clear()
+            self.inicio = datetime.now()
+
+
+perfil_sql = PerfilSQL()
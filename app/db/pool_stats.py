@@ -0,0 +1,46 @@
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app.core.metricas import Histograma
+import time
+
+# Tiempo que tarda cada solicitud en obtener una conexión del pool
+# (espera en la cola + conexión nueva + pre-ping), por motor.
+espera_pool = {
+    "sync": Histograma(),
+    "async": Histograma(),
+}
+
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que registra el tiempo de obtención de cada conexión."""
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            espera_pool["sync"].observar((time.perf_counter() - inicio) * 1000)
+
+
+class AsyncAdaptedQueuePoolMedido(AsyncAdaptedQueuePool):
+    """Versión para el motor asíncrono (asyncpg)."""
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            espera_pool["async"].observar((time.perf_counter() - inicio) * 1000)
+
+
+def festado_pool(nombre: str, pool: QueuePool) -> dict:
+    """Estado actual del pool: conexiones en uso, libres y overflow."""
+    return {
+        "tamano": pool.size(),
+        "en_uso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        # overflow() es negativo mientras no se hayan abierto todas las conexiones base
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+        "timeout_s": pool.timeout(),
+        "espera_ms": espera_pool[nombre].resumen(),
+    }
@@ -0,0 +1,54 @@
+from sqlalchemy.exc import DBAPIError
+from app.core.config import settings
+from typing import Dict
+import asyncio
+import random
+import threading
+
+# SQLSTATE de PostgreSQL que indican que la transacción completa puede repetirse
+# 40001 = serialization_failure, 40P01 = deadlock_detected
+SQLSTATE_REINTENTABLES = {"40001", "40P01"}
+
+
+def es_error_reintentable(exc: BaseException) -> bool:
+    """
+    True si la excepción de la BD es un deadlock o un fallo de serialización,
+    aunque venga envuelta (p. ej. en la HTTPException de un endpoint).
+    """
+    vistas = set()
+    while exc is not None and id(exc) not in vistas:
+        vistas.add(id(exc))
+        if isinstance(exc, DBAPIError):
+            orig = exc.orig
+            sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+            return sqlstate in SQLSTATE_REINTENTABLES
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+async def fespera_reintento(intento: int) -> None:
+    """Espera exponencial acotada (con jitter) antes del reintento número 'intento'."""
+    espera = min(settings.DB_REINTENTOS_ESPERA_MS * (2 ** (intento - 1)), settings.DB_REINTENTOS_ESPERA_MAX_MS)
+    await asyncio.sleep(random.uniform(espera / 2, espera) / 1000)
+
+
+class EstadisticasReintentos:
+    """Contadores de ejecuciones y reintentos por unidad de trabajo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores: Dict[str, Dict[str, int]] = {}
+
+    def registrar(self, nombre: str, evento: str) -> None:
+        with self._lock:
+            contadores = self._contadores.setdefault(
+                nombre, {"ejecuciones": 0, "reintentos": 0, "agotados": 0}
+            )
+            contadores[evento] += 1
+
+    def resumen(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {nombre: dict(contadores) for nombre, contadores in self._contadores.items()}
+
+
+estadisticas_reintentos = EstadisticasReintentos()
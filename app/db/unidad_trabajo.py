@@ -0,0 +1,175 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metricas import Histograma
+from app.db.reintentos import es_error_reintentable, fespera_reintento, estadisticas_reintentos
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class EstadisticasCommit:
+    """Latencia de COMMIT, commits y rollbacks por endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias: Dict[str, Histograma] = {}
+        self._contadores: Dict[str, Dict[str, int]] = {}
+
+    def registrar(self, endpoint: str, evento: str, latencia_ms: Optional[float] = None) -> None:
+        with self._lock:
+            contadores = self._contadores.setdefault(endpoint, {"commits": 0, "rollbacks": 0, "savepoints": 0})
+            contadores[evento] += 1
+            if latencia_ms is not None:
+                histograma = self._latencias.setdefault(endpoint, Histograma())
+        if latencia_ms is not None:
+            histograma.observar(latencia_ms)
+
+    def contadores(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {endpoint: dict(contadores) for endpoint, contadores in self._contadores.items()}
+
+    def latencias(self) -> Dict[str, Histograma]:
+        with self._lock:
+            return dict(self._latencias)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                endpoint: {**contadores, "commit_ms": self._latencias[endpoint].resumen() if endpoint in self._latencias else None}
+                for endpoint, contadores in self._contadores.items()
+            }
+
+
+estadisticas_commit = EstadisticasCommit()
+
+
+class UnidadTrabajo:
+    """
+    Transacción única por solicitud sobre la AsyncSession de get_async_db.
+
+    - La primera llamada a ejecutar() es la transacción externa: al terminar
+      hace un solo COMMIT (o ROLLBACK) y, si la BD la aborta por deadlock o
+      serialización, la repite completa con espera exponencial.
+    - Las llamadas anidadas (un servicio que usa otro) corren dentro de un
+      SAVEPOINT y no confirman nada por su cuenta.
+    - al_confirmar() registra acciones para después del COMMIT (invalidar cachés)
+      y al_deshacer() acciones para después de un ROLLBACK (del intento o del
+      SAVEPOINT donde se registraron). Si falla el COMMIT mismo no se sabe si
+      se confirmó, así que no se ejecuta ninguna de las dos.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.endpoint = db.info.get("endpoint", "-")
+        self._activa = False
+        self._al_confirmar: List[Callable[[], None]] = []
+        self._al_deshacer: List[Callable[[], None]] = []
+
+    @property
+    def activa(self) -> bool:
+        """True dentro de ejecutar(): el COMMIT lo hará la unidad de trabajo."""
+        return self._activa
+
+    def al_confirmar(self, accion: Callable[[], None]) -> None:
+        """
+        Ejecuta 'accion' solo si la transacción externa se confirma.
+        Fuera de ejecutar() (el llamador maneja su propio commit) se ejecuta de inmediato.
+        """
+        if not self._activa:
+            accion()
+            return
+        self._al_confirmar.append(accion)
+
+    def al_deshacer(self, accion: Callable[[], None]) -> None:
+        """Ejecuta 'accion' si se deshace lo hecho desde ahora. Fuera de ejecutar() no hace nada."""
+        if self._activa:
+            self._al_deshacer.append(accion)
+
+    def _deshacer_desde(self, confirmar: int, deshacer: int) -> None:
+        """Descarta las acciones registradas desde la marca y ejecuta las de ROLLBACK."""
+        del self._al_confirmar[confirmar:]
+        acciones = self._al_deshacer[deshacer:]
+        del self._al_deshacer[deshacer:]
+        self._ejecuta_acciones(acciones, "ROLLBACK")
+
+    def _ejecuta_acciones(self, acciones: List[Callable[[], None]], momento: str) -> None:
+        for accion in acciones:
+            try:
+                accion()
+            except Exception:
+                logger.exception(f"Error en acción posterior al {momento} ({self.endpoint})")
+
+    async def ejecutar(
+        self,
+        unidad: Callable[[], Awaitable[T]],
+        nombre: str,
+        max_intentos: Optional[int] = None
+    ) -> T:
+        if self._activa:
+            # Anidada: SAVEPOINT dentro de la transacción en curso
+            estadisticas_commit.registrar(self.endpoint, "savepoints")
+            marca = (len(self._al_confirmar), len(self._al_deshacer))
+            try:
+                async with self.db.begin_nested():
+                    return await unidad()
+            except BaseException:
+                self._deshacer_desde(*marca)
+                raise
+
+        max_intentos = max_intentos or settings.DB_REINTENTOS_MAX
+        estadisticas_reintentos.registrar(nombre, "ejecuciones")
+        intento = 1
+        while True:
+            self._activa = True
+            self._al_confirmar = []
+            self._al_deshacer = []
+            en_commit = False
+            try:
+                resultado = await unidad()
+                en_commit = True
+                await self._confirmar()
+                return resultado
+
+            except Exception as e:
+                await self.db.rollback()
+                estadisticas_commit.registrar(self.endpoint, "rollbacks")
+                if en_commit:
+                    # Resultado del COMMIT incierto: ni confirmar ni deshacer
+                    self._al_confirmar, self._al_deshacer = [], []
+                else:
+                    self._deshacer_desde(0, 0)
+                if not es_error_reintentable(e):
+                    raise e
+                if intento >= max_intentos:
+                    estadisticas_reintentos.registrar(nombre, "agotados")
+                    logger.error(f"{nombre}: conflicto de bloqueo tras {intento} intentos: {getattr(e, 'orig', e)}")
+                    raise e
+
+                estadisticas_reintentos.registrar(nombre, "reintentos")
+                logger.warning(f"{nombre}: conflicto de bloqueo (intento {intento}), reintentando: {getattr(e, 'orig', e)}")
+                await fespera_reintento(intento)
+                intento += 1
+
+            finally:
+                self._activa = False
+
+    async def _confirmar(self) -> None:
+        inicio = time.perf_counter()
+        await self.db.commit()
+        estadisticas_commit.registrar(self.endpoint, "commits", (time.perf_counter() - inicio) * 1000)
+
+        acciones, self._al_confirmar, self._al_deshacer = self._al_confirmar, [], []
+        self._ejecuta_acciones(acciones, "COMMIT")
+
+
+def fobtiene_uow(db: AsyncSession) -> UnidadTrabajo:
+    """Unidad de trabajo de la sesión (una por solicitud; se crea al primer uso)."""
+    uow = db.info.get("uow")
+    if uow is None:
+        uow = db.info["uow"] = UnidadTrabajo(db)
+    return uow
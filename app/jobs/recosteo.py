@@ -0,0 +1,503 @@
+"""
+Recosteo nocturno: reconstruye ppp_propvt.ppp_qinv / ppp_vcos a partir del
+historial de trt_tranin.
+
+Recorre trt_tranin en orden (trp_ftra, trp_horrec, trp_nlin) con un cursor del
+lado del servidor, aplica en memoria las reglas de finvpro por (almacén,
+producto) partiendo de inventario y costo en cero, y escribe el resultado con
+UPDATEs masivos. La memoria depende del número de productos, no de las filas
+del historial.
+
+- Entradas (trp_ctran en --entradas): finvpro con lxmodulo = 1, lxpar = 'A'
+  (recalcula el costo promedio).
+- Demás movimientos: salida con lxmodulo = -1, lxpar = 'E'. Si el producto
+  tiene receta para trp_tven, se descuentan sus ingredientes hoja como en el
+  desglose de la venta (fop_icom = 'S' se omite con --sin-suministros).
+- Solo se actualizan filas existentes de ppp_propvt; los productos sin
+  historial no se tocan.
+- --motor (COSTEO_MOTOR por defecto): numpy = punto fijo vectorizado;
+  decimal = fcalcula_costo movimiento por movimiento; verificar = punto fijo
+  comparado con fcalcula_costo, registrando las diferencias y usando
+  fcalcula_costo en esas filas.
+
+Uso:
+    python -m app.jobs.recosteo --entradas 1,2 --dry-run --diff diferencias.csv
+    python -m app.jobs.recosteo --entradas 1,2 --almacen 1
+    python -m app.jobs.recosteo --entradas 1,2 --dry-run --motor verificar
+"""
+from sqlalchemy.sql import text
+from app.core.config import settings
+from app.db.database import engine
+from app.services.inventario_service import CostosConfig, get_costos_config, fcalcula_costo, round_decimal
+from app.services.receta_service import fcompila_receta, findexa_aristas, RecetaCompilada
+from app.services.costeo_service import (
+    np, LoteCosto, MovimientoCosto, ESCALA_CANTIDAD, ESCALA_COSTO, DECIMALES_COSTO, LIMITE_ENTRADA,
+    ResultadoCosto, fcostea_enteros
+)
+from fastapi import HTTPException
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterator, List, Literal, Optional, Tuple
+import argparse
+import csv
+import logging
+import sys
+import time
+
+logger = logging.getLogger("recosteo")
+
+# qtra_escalada: trp_qtra en punto fijo (NULL si no es representable), calculada
+# en el servidor para no convertir cada Decimal en Python
+HISTORIA_QUERY = text(f"""
+    SELECT trp_calm, trp_cpro, trp_ctran, trp_tven, trp_qtra,
+           CASE WHEN trp_qtra * {10 ** ESCALA_CANTIDAD} = trunc(trp_qtra * {10 ** ESCALA_CANTIDAD})
+                 AND abs(trp_qtra) < {LIMITE_ENTRADA // 10 ** ESCALA_CANTIDAD}
+                THEN CAST(trp_qtra * {10 ** ESCALA_CANTIDAD} AS BIGINT) END AS qtra_escalada
+    FROM trt_tranin
+    WHERE CAST(:almacen AS INTEGER) IS NULL OR trp_calm = :almacen
+    ORDER BY trp_ftra, trp_horrec, trp_nlin
+""")
+
+ARISTAS_QUERY = text("""
+    SELECT T1.fop_tven, T1.fop_cpro, T1.fop_cfor, T1.fop_qfor, T1.fop_icom, T2.inp_itpr
+    FROM fop_compro AS T1
+    JOIN inp_produc AS T2 ON T1.fop_cfor = T2.inp_cpro
+""")
+
+COSTOS_ESTIMADOS_QUERY = text("""
+    SELECT cop_calm, cop_cpro, cop_vcos
+    FROM cop_costos
+    WHERE CAST(:almacen AS INTEGER) IS NULL OR cop_calm = :almacen
+""")
+
+INVENTARIO_QUERY = text("""
+    SELECT ppp_calm, ppp_cpro, ppp_qinv, ppp_vcos
+    FROM ppp_propvt
+    WHERE CAST(:almacen AS INTEGER) IS NULL OR ppp_calm = :almacen
+""")
+
+ESCRIBE_INVENTARIO_QUERY = text("""
+    UPDATE ppp_propvt AS P
+    SET ppp_qinv = V.ppp_qinv,
+        ppp_vcos = V.ppp_vcos
+    FROM UNNEST(
+        CAST(:almacenes AS INTEGER[]),
+        CAST(:productos AS INTEGER[]),
+        CAST(:cantidades AS NUMERIC[]),
+        CAST(:costos AS NUMERIC[])
+    ) AS V(ppp_calm, ppp_cpro, ppp_qinv, ppp_vcos)
+    WHERE P.ppp_calm = V.ppp_calm AND P.ppp_cpro = V.ppp_cpro
+""")
+
+LOTE_ESCRITURA = 5000
+
+# Oleadas con menos movimientos que esto se aplican movimiento por movimiento
+OLEADA_MINIMA = 64
+
+
+def fescalado(valor: Decimal, decimales: int) -> Optional[int]:
+    """Entero escalado si valor es representable en el punto fijo; None si no."""
+    escalado = valor.scaleb(decimales)
+    entero = int(escalado)
+    if escalado != entero or not -LIMITE_ENTRADA < entero < LIMITE_ENTRADA:
+        return None
+    return entero
+
+
+class Recosteo:
+    """
+    Estado del recosteo: un índice por (ppp_calm, ppp_cpro) y arreglos de punto
+    fijo con la cantidad y el costo de cada producto. Los productos con algún
+    valor fuera del punto fijo pasan a estado Decimal (fcalcula_costo) hasta el
+    final del recorrido.
+    """
+
+    def __init__(
+        self,
+        entradas: FrozenSet[int],
+        ignorar: FrozenSet[int] = frozenset(),
+        lxincsum: Literal['S', 'N'] = 'S',
+        config: Optional[CostosConfig] = None,
+        motor: Optional[Literal['numpy', 'decimal', 'verificar']] = None
+    ):
+        self.entradas = entradas
+        self.ignorar = ignorar
+        self.lxincsum = lxincsum
+        self.config = config or get_costos_config()
+        self.motor = motor or settings.COSTEO_MOTOR
+
+        self.indice: Dict[Tuple[int, int], int] = {}
+        self.claves: List[Tuple[int, int]] = []
+        self.canact = np.zeros(1024, dtype=np.int64)
+        self.cosact = np.zeros(1024, dtype=np.int64)
+        self.cosest = np.zeros(1024, dtype=np.int64)
+        self.decimales: Dict[int, Tuple[Decimal, Decimal]] = {}
+
+        self.costos_estimados: Dict[Tuple[int, int], Decimal] = {}
+        self.aristas: Dict[int, Dict[int, List]] = {}   # {fop_tven: {fop_cpro: líneas}}
+        self.recetas: Dict[Tuple[int, int], Optional[RecetaCompilada]] = {}
+
+        self.filas = 0
+        self.movimientos = 0
+        self.omitidas = 0
+        self.oleadas = 0
+        self.diferencias = 0
+
+    # --- Datos de referencia ---
+
+    def carga_referencias(self, conn, almacen: Optional[int]) -> None:
+        for row in conn.execute(COSTOS_ESTIMADOS_QUERY, {'almacen': almacen}):
+            if row.cop_vcos is not None:
+                self.costos_estimados[(row.cop_calm, row.cop_cpro)] = Decimal(str(row.cop_vcos))
+        por_tven: Dict[int, List] = {}
+        for row in conn.execute(ARISTAS_QUERY):
+            por_tven.setdefault(row.fop_tven, []).append(row)
+        self.aristas = {tven: findexa_aristas(aristas) for tven, aristas in por_tven.items()}
+
+    def receta(self, lxcpro: int, lxtven: int) -> Optional[RecetaCompilada]:
+        """Receta compilada de lxcpro para lxtven, o None si el producto no tiene receta."""
+        clave = (lxcpro, lxtven)
+        if clave not in self.recetas:
+            componentes = self.aristas.get(lxtven, {})
+            if lxcpro in componentes:
+                self.recetas[clave] = fcompila_receta(lxcpro, componentes=componentes)
+            else:
+                self.recetas[clave] = None
+        return self.recetas[clave]
+
+    # --- Estado por producto ---
+
+    def posicion(self, clave: Tuple[int, int]) -> int:
+        pos = self.indice.get(clave)
+        if pos is not None:
+            return pos
+
+        pos = len(self.claves)
+        if pos == len(self.canact):
+            self.canact = np.resize(self.canact, 2 * pos)
+            self.cosact = np.resize(self.cosact, 2 * pos)
+            self.cosest = np.resize(self.cosest, 2 * pos)
+        self.indice[clave] = pos
+        self.claves.append(clave)
+        self.canact[pos] = 0
+        self.cosact[pos] = 0
+
+        lxcosest = self.costos_estimados.get(clave, Decimal('0.00'))
+        cosest = fescalado(lxcosest, ESCALA_COSTO)
+        self.cosest[pos] = cosest or 0
+        if cosest is None or self.motor == 'decimal':
+            self.decimales[pos] = (Decimal('0.00'), Decimal('0.00'))
+        return pos
+
+    def a_decimal(self, pos: int) -> None:
+        """Pasa el producto a estado Decimal (sale del punto fijo)."""
+        if pos not in self.decimales:
+            self.decimales[pos] = (
+                Decimal(int(self.canact[pos])).scaleb(-ESCALA_CANTIDAD),
+                Decimal(int(self.cosact[pos])).scaleb(-ESCALA_COSTO)
+            )
+
+    def estado(self, pos: int) -> Tuple[Decimal, Decimal]:
+        """(ppp_qinv, ppp_vcos) actuales del producto."""
+        if pos in self.decimales:
+            lxcanact, lxcosact = self.decimales[pos]
+        else:
+            lxcanact = Decimal(int(self.canact[pos])).scaleb(-ESCALA_CANTIDAD)
+            lxcosact = Decimal(int(self.cosact[pos])).scaleb(-ESCALA_COSTO)
+        return lxcanact, round_decimal(lxcosact)
+
+    # --- Recorrido ---
+
+    def procesa_lote(self, filas: List) -> None:
+        """
+        Aplica un lote del historial. Los movimientos se agrupan en oleadas:
+        la oleada k lleva el k-ésimo movimiento de cada producto dentro del lote,
+        así cada oleada se calcula vectorizada y el orden por producto se respeta.
+        Cuando las oleadas se vuelven pequeñas (pocos productos muy repetidos)
+        el resto del lote se aplica movimiento por movimiento.
+        """
+        posiciones: List[int] = []
+        cantidades: List[Decimal] = []
+        escaladas: List[Optional[int]] = []
+        modulos: List[int] = []
+
+        for row in filas:
+            if row.trp_ctran in self.ignorar or row.trp_qtra is None:
+                self.omitidas += 1
+                continue
+
+            if row.trp_ctran in self.entradas:
+                receta, lxmodulo = None, 1
+            else:
+                lxmodulo = -1
+                try:
+                    receta = self.receta(row.trp_cpro, row.trp_tven)
+                except HTTPException as e:
+                    logger.error(f"Fila omitida (producto {row.trp_cpro}, tven {row.trp_tven}): {e.detail}")
+                    self.omitidas += 1
+                    continue
+
+            if receta is None:
+                posiciones.append(self.posicion((row.trp_calm, row.trp_cpro)))
+                cantidades.append(row.trp_qtra)
+                escaladas.append(row.qtra_escalada)
+                modulos.append(lxmodulo)
+            else:
+                # Venta de una receta: se mueven sus ingredientes hoja (como fexplota_receta)
+                for lxcpro, cantidad in receta.cantidades(row.trp_qtra, self.lxincsum).items():
+                    posiciones.append(self.posicion((row.trp_calm, lxcpro)))
+                    cantidades.append(cantidad)
+                    escaladas.append(fescalado(cantidad, ESCALA_CANTIDAD))
+                    modulos.append(lxmodulo)
+
+        self.filas += len(filas)
+        self.movimientos += len(posiciones)
+        if not posiciones:
+            return
+
+        pos_arr = np.array(posiciones, dtype=np.int64)
+        mod_arr = np.array(modulos, dtype=np.int64)
+        inexacta = np.fromiter((e is None for e in escaladas), dtype=bool, count=len(escaladas))
+        can_arr = np.fromiter((e or 0 for e in escaladas), dtype=np.int64, count=len(escaladas))
+
+        # Ocurrencia de cada movimiento dentro de su producto (0, 1, 2, ...)
+        orden = np.argsort(pos_arr, kind='stable')
+        ordenadas = pos_arr[orden]
+        inicio_grupo = np.r_[True, ordenadas[1:] != ordenadas[:-1]]
+        primera = np.maximum.accumulate(np.where(inicio_grupo, np.arange(len(orden)), 0))
+        ocurrencia = np.empty(len(orden), dtype=np.int64)
+        ocurrencia[orden] = np.arange(len(orden)) - primera
+
+        # Movimientos agrupados por oleada
+        por_oleada = np.argsort(ocurrencia, kind='stable')
+        cortes = np.searchsorted(ocurrencia[por_oleada], np.arange(1, ocurrencia.max() + 1))
+        oleadas = np.split(por_oleada, cortes)
+        for k, oleada in enumerate(oleadas):
+            if len(oleada) < OLEADA_MINIMA:
+                self.aplica_secuencial(np.concatenate(oleadas[k:]).tolist(), pos_arr, cantidades, modulos)
+                break
+            self.aplica_oleada(pos_arr[oleada], can_arr[oleada], mod_arr[oleada], inexacta[oleada], oleada, cantidades)
+            self.oleadas += 1
+
+    def aplica_oleada(self, pos, cannue, modulo, inexacta, movimientos, cantidades: List[Decimal]) -> None:
+        """Un movimiento por producto: punto fijo para la mayoría, Decimal para el resto."""
+        # Cantidad fuera del punto fijo: el producto pasa a Decimal desde este movimiento
+        for pos_i in pos[inexacta].tolist():
+            self.a_decimal(pos_i)
+        en_decimal = np.fromiter((p in self.decimales for p in pos.tolist()), dtype=bool, count=len(pos)) \
+            if self.decimales else np.zeros(len(pos), dtype=bool)
+
+        fijo = ~en_decimal
+        if fijo.any():
+            p = pos[fijo]
+            lote = LoteCosto(
+                canact=self.canact[p], cosact=self.cosact[p], cosest=self.cosest[p],
+                cannue=cannue[fijo], modulo=modulo[fijo], calcula=modulo[fijo] > 0
+            )
+            centesimas, nueva, exacto = fcostea_enteros(lote, self.config)
+            ok = exacto & (np.abs(nueva) < LIMITE_ENTRADA) & (centesimas < LIMITE_ENTRADA // 100)
+            if self.motor == 'verificar':
+                ok &= self.verifica_oleada(lote, centesimas, nueva, ok)
+            self.canact[p[ok]] = nueva[ok]
+            self.cosact[p[ok]] = centesimas[ok] * 10 ** (ESCALA_COSTO - DECIMALES_COSTO)
+            for pos_i in p[~ok].tolist():
+                self.a_decimal(pos_i)
+            en_decimal[np.flatnonzero(fijo)[~ok]] = True
+
+        for i in np.flatnonzero(en_decimal).tolist():
+            self.aplica_decimal(int(pos[i]), cantidades[int(movimientos[i])], int(modulo[i]))
+
+    def verifica_oleada(self, lote: LoteCosto, centesimas, nueva, ok):
+        """
+        Modo verificar: compara cada resultado del punto fijo con fcalcula_costo.
+        Devuelve la máscara de filas que coinciden; las demás se recalculan con
+        fcalcula_costo.
+        """
+        coincide = np.ones(len(ok), dtype=bool)
+        for i in np.flatnonzero(ok).tolist():
+            movimiento = MovimientoCosto(
+                Decimal(int(lote.canact[i])).scaleb(-ESCALA_CANTIDAD),
+                Decimal(int(lote.cosact[i])).scaleb(-ESCALA_COSTO),
+                Decimal(int(lote.cosest[i])).scaleb(-ESCALA_COSTO),
+                Decimal(int(lote.cannue[i])).scaleb(-ESCALA_CANTIDAD),
+                int(lote.modulo[i]),
+                'A' if lote.modulo[i] > 0 else 'E'
+            )
+            esperado = ResultadoCosto(*fcalcula_costo(*movimiento, config=self.config))
+            if esperado.lxcosnue.scaleb(DECIMALES_COSTO) != int(centesimas[i]) \
+                    or esperado.cantidad.scaleb(ESCALA_CANTIDAD) != int(nueva[i]):
+                coincide[i] = False
+                self.diferencias += 1
+                if self.diferencias <= 20:
+                    logger.error(
+                        f"Diferencia entre motores: {movimiento} -> {esperado}, punto fijo "
+                        f"({Decimal(int(centesimas[i])).scaleb(-DECIMALES_COSTO)}, "
+                        f"{Decimal(int(nueva[i])).scaleb(-ESCALA_CANTIDAD)})"
+                    )
+        return coincide
+
+    def aplica_secuencial(self, movimientos: List[int], pos_arr, cantidades: List[Decimal], modulos: List[int]) -> None:
+        """Cola del lote: movimiento por movimiento con fcalcula_costo, devolviendo el resultado al punto fijo."""
+        for i in movimientos:
+            pos = int(pos_arr[i])
+            en_decimal = pos in self.decimales
+            if not en_decimal:
+                self.a_decimal(pos)
+            self.aplica_decimal(pos, cantidades[i], modulos[i])
+            if not en_decimal and self.motor != 'decimal':
+                lxcanact, lxcosact = self.decimales[pos]
+                canact = fescalado(lxcanact, ESCALA_CANTIDAD)
+                cosact = fescalado(lxcosact, ESCALA_COSTO)
+                if canact is not None and cosact is not None:
+                    del self.decimales[pos]
+                    self.canact[pos] = canact
+                    self.cosact[pos] = cosact
+
+    def aplica_decimal(self, pos: int, lxcannue: Decimal, lxmodulo: int) -> None:
+        """Un movimiento de un producto en estado Decimal (mismo cálculo que finvpro)."""
+        lxcanact, lxcosact = self.decimales[pos]
+        lxcosnue, nueva_cantidad = fcalcula_costo(
+            lxcanact, lxcosact,
+            self.costos_estimados.get(self.claves[pos], Decimal('0.00')),
+            lxcannue, lxmodulo,
+            'A' if lxmodulo > 0 else 'E', 'S', self.config
+        )
+        self.decimales[pos] = (nueva_cantidad, lxcosnue)
+
+    def resultados(self) -> Iterator[Tuple[Tuple[int, int], Decimal, Decimal]]:
+        """((ppp_calm, ppp_cpro), ppp_qinv, ppp_vcos) por producto, en orden de clave."""
+        for clave in sorted(self.indice):
+            yield (clave, *self.estado(self.indice[clave]))
+
+
+def frecorre_historia(recosteo: Recosteo, almacen: Optional[int], lote: int, progreso: int) -> None:
+    inicio = time.perf_counter()
+    siguiente_reporte = progreso
+    with engine.connect() as conn:
+        recosteo.carga_referencias(conn, almacen)
+        resultado = conn.execution_options(stream_results=True, yield_per=lote).execute(
+            HISTORIA_QUERY, {'almacen': almacen}
+        )
+        for filas in resultado.partitions():
+            recosteo.procesa_lote(filas)
+            if recosteo.filas >= siguiente_reporte:
+                siguiente_reporte += progreso
+                segundos = time.perf_counter() - inicio
+                logger.info(
+                    f"{recosteo.filas:,} filas ({recosteo.filas / segundos:,.0f}/s), "
+                    f"{len(recosteo.indice):,} productos, {len(recosteo.decimales):,} en Decimal"
+                )
+    logger.info(
+        f"Historial recorrido: {recosteo.filas:,} filas, {recosteo.movimientos:,} movimientos, "
+        f"{recosteo.omitidas:,} omitidas, {recosteo.oleadas:,} oleadas "
+        f"en {time.perf_counter() - inicio:.1f} s (motor {recosteo.motor})"
+    )
+    if recosteo.motor == 'verificar':
+        logger.info(f"Verificación: {recosteo.diferencias:,} movimientos difieren entre motores")
+
+
+def fcompara(recosteo: Recosteo, almacen: Optional[int], archivo_diff: Optional[str]) -> int:
+    """Modo dry-run: compara el recosteo con ppp_propvt sin escribir. Devuelve el número de diferencias."""
+    diferencias = 0
+    salida = open(archivo_diff, "w", newline="") if archivo_diff else None
+    escritor = csv.writer(salida) if salida else None
+    if escritor:
+        escritor.writerow(["ppp_calm", "ppp_cpro", "ppp_qinv", "qinv_recosteo", "ppp_vcos", "vcos_recosteo"])
+
+    try:
+        with engine.connect() as conn:
+            resultado = conn.execution_options(stream_results=True, yield_per=LOTE_ESCRITURA).execute(
+                INVENTARIO_QUERY, {'almacen': almacen}
+            )
+            for row in resultado:
+                pos = recosteo.indice.get((row.ppp_calm, row.ppp_cpro))
+                if pos is None:
+                    continue
+                ppp_qinv, ppp_vcos = recosteo.estado(pos)
+                qinv = Decimal(str(row.ppp_qinv)) if row.ppp_qinv is not None else Decimal('0')
+                vcos = Decimal(str(row.ppp_vcos)) if row.ppp_vcos is not None else Decimal('0')
+                if qinv == ppp_qinv and vcos == ppp_vcos:
+                    continue
+                diferencias += 1
+                if escritor:
+                    escritor.writerow([row.ppp_calm, row.ppp_cpro, qinv, ppp_qinv, vcos, ppp_vcos])
+                if diferencias <= 20:
+                    logger.info(
+                        f"  {row.ppp_calm}/{row.ppp_cpro}: qinv {qinv} -> {ppp_qinv}, vcos {vcos} -> {ppp_vcos}"
+                    )
+    finally:
+        if salida:
+            salida.close()
+
+    logger.info(f"Dry-run: {diferencias:,} productos difieren de ppp_propvt")
+    return diferencias
+
+
+def fescribe(recosteo: Recosteo) -> int:
+    """Escribe el recosteo en ppp_propvt con UPDATEs de LOTE_ESCRITURA filas en una sola transacción."""
+    actualizadas = 0
+    with engine.begin() as conn:
+        lote: List[Tuple[Tuple[int, int], Decimal, Decimal]] = []
+        for fila in recosteo.resultados():
+            lote.append(fila)
+            if len(lote) == LOTE_ESCRITURA:
+                actualizadas += _escribe_lote(conn, lote)
+                lote = []
+        if lote:
+            actualizadas += _escribe_lote(conn, lote)
+    logger.info(f"ppp_propvt: {actualizadas:,} filas actualizadas")
+    return actualizadas
+
+
+def _escribe_lote(conn, lote) -> int:
+    resultado = conn.execute(ESCRIBE_INVENTARIO_QUERY, {
+        'almacenes': [clave[0] for clave, _, _ in lote],
+        'productos': [clave[1] for clave, _, _ in lote],
+        'cantidades': [qinv for _, qinv, _ in lote],
+        'costos': [vcos for _, _, vcos in lote],
+    })
+    return resultado.rowcount
+
+
+def _codigos(valor: str) -> FrozenSet[int]:
+    return frozenset(int(codigo) for codigo in valor.split(",") if codigo.strip())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reconstruye ppp_propvt desde el historial de trt_tranin.")
+    parser.add_argument("--entradas", type=_codigos, required=True,
+                        help="Códigos trp_ctran de entrada (compras/ajustes), separados por coma")
+    parser.add_argument("--ignorar", type=_codigos, default=frozenset(),
+                        help="Códigos trp_ctran que no mueven inventario")
+    parser.add_argument("--almacen", type=int, default=None, help="Solo este almacén (trp_calm)")
+    parser.add_argument("--sin-suministros", action="store_true",
+                        help="Desglosa las recetas sin suministros (lxincsum = 'N')")
+    parser.add_argument("--lote", type=int, default=50000, help="Filas por lote del cursor")
+    parser.add_argument("--progreso", type=int, default=1000000, help="Reporta avance cada N filas")
+    parser.add_argument("--motor", choices=("numpy", "decimal", "verificar"), default=settings.COSTEO_MOTOR,
+                        help="Motor de costeo (COSTEO_MOTOR por defecto)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo compara con ppp_propvt, no escribe")
+    parser.add_argument("--diff", default=None, help="Archivo CSV con las diferencias (dry-run)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if np is None:
+        logger.error("El recosteo requiere numpy.")
+        return 2
+
+    recosteo = Recosteo(
+        entradas=args.entradas,
+        ignorar=args.ignorar,
+        lxincsum='N' if args.sin_suministros else 'S',
+        motor=args.motor
+    )
+    frecorre_historia(recosteo, args.almacen, args.lote, args.progreso)
+
+    if args.dry_run:
+        fcompara(recosteo, args.almacen, args.diff)
+    else:
+        fescribe(recosteo)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
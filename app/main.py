@@ -1,14 +1,52 @@
 from fastapi import FastAPI
-from app.api.endpoints import auth, listados, venta, caja, inventario, transacciones # <-- AHORA INCLUYE 'transacciones'
+from fastapi.responses import JSONResponse
+from app.api.endpoints import auth, listados, venta, caja, inventario, transacciones, sistema, exportar, metricas
+from app.core.instrumentacion import MetricasMiddleware
 from app.utils.api_helpers import raise_api_error
 from app.utils.cache_utils import gettxt
+from app.services.referencia_service import referencia_store
+from app.services.arranque_service import calentamiento
+from app.db.perfil_sql import perfil_sql
+from app.services.historial_service import historial_diferido
+from app.db.database import async_engine
+from app.core.config import settings
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import uvicorn
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque: calentamiento en segundo plano (conexiones, textos, referencia,
+    catálogos, sentencias) y luego recarga periódica de los datos de referencia.
+    El servidor acepta solicitudes de inmediato; /ready indica cuándo está caliente.
+    """
+    async def arranque():
+        await calentamiento.ejecutar()
+        # La carga inicial de referencia ya la hizo el calentamiento
+        await referencia_store.ciclo_refresco(settings.REFERENCIA_REFRESCO_SEGUNDOS, carga_inicial=False)
+
+    tareas = [asyncio.create_task(arranque())]
+    if settings.SQL_EXPLAIN:
+        tareas.append(asyncio.create_task(perfil_sql.ciclo_explain(async_engine)))
+    if settings.HISTORIAL_DIFERIDO:
+        # También vacía lo que quedó en el diario si el proceso anterior se cayó
+        tareas.append(asyncio.create_task(historial_diferido.ciclo_vaciado()))
+    yield
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
+    if settings.HISTORIAL_DIFERIDO:
+        await historial_diferido.cerrar()
+
+
 # Crea la aplicación principal de FastAPI
 app = FastAPI(
     title="API de POS - Migración 4GL",
-    description="Backend para el sistema POS de restaurante."
+    description="Backend para el sistema POS de restaurante.",
+    lifespan=lifespan
 )
 
 # Incluye los routers (endpoints) que creamos
@@ -18,6 +56,17 @@ app.include_router(venta.router, prefix="/api")
 app.include_router(caja.router, prefix="/api") 
 app.include_router(inventario.router, prefix="/api") 
 app.include_router(transacciones.router, prefix="/api") # <-- ¡CONEXIÓN FINAL DE TRANSACCIONES!
+app.include_router(sistema.router, prefix="/api")
+app.include_router(exportar.router, prefix="/api")
+app.include_router(metricas.router)
+
+# Latencia, SQL y espera de bloqueos por endpoint (expuestas en /metrics)
+app.add_middleware(MetricasMiddleware)
+
+@app.get("/ready", tags=["Sistema"])
+async def ready():
+    """Readiness para el balanceador: 200 cuando terminó el calentamiento, 503 mientras tanto."""
+    return JSONResponse(calentamiento.estado(), status_code=200 if calentamiento.listo else 503)
 
 # --- Endpoints de Prueba ---
 
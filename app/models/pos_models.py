@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
 from decimal import Decimal
 from datetime import date
 
@@ -33,6 +33,14 @@ class InvProResult(BaseModel):
     lxcosnue: Decimal
     lxtippro: int
 
+class DesglosResult(BaseModel):
+    """Modelo de respuesta para el desglose de recetas."""
+    costo_materia_prima: float
+    costo_suministros: float
+    costo_mano_obra: float
+    cantidad_vendida: float
+    codigo_producto: int
+
 class TranInLine(BaseModel):
     """
     Modelo que representa los 26 campos de la línea de transacción (ftransac).
@@ -66,4 +74,24 @@ class TranInLine(BaseModel):
     trp_horrec: str
     trp_cospro1: Decimal
     trp_cospro2: Decimal
-    trp_cospro3: Decimal
\ No newline at end of file
+    trp_cospro3: Decimal
+
+class TicketLinea(TranInLine):
+    """
+    Línea de un ticket de venta: trp_cospro1..3 se calculan en el desglose,
+    así que el cliente no tiene que enviarlos (si los envía se reemplazan).
+    """
+    trp_cospro1: Decimal = Decimal('0')
+    trp_cospro2: Decimal = Decimal('0')
+    trp_cospro3: Decimal = Decimal('0')
+
+class TicketVenta(BaseModel):
+    """
+    Ticket completo de venta: cada línea (trp_cpro, trp_qtra, trp_tven) se desglosa
+    y se registra en trp_tranin/trt_tranin dentro de una única transacción.
+    Los costos trp_cospro1..3 de cada línea se calculan en el desglose.
+    Todas las líneas deben ser del almacén del ticket (trp_calm = codigo_almacen).
+    """
+    codigo_almacen: int = 1             # Almacén del inventario (rgp_calm)
+    incluir_suministros: Literal['S', 'N'] = 'S' # lxincsum
+    lineas: List[TicketLinea]
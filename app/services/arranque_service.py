@@ -0,0 +1,173 @@
+from sqlalchemy.sql import text
+from app.core.config import settings
+from app.db.database import engine, async_engine, AsyncSessionLocal
+from app.utils.cache_utils import SYSTEM_DIR, tablas_texto
+from app.services.referencia_service import referencia_store
+from app.services.listado_service import LISTAS, fcompila_listados, fsentencias
+from app.services.catalogo_service import catalogo_cache
+from app.services import inventario_service, receta_service, caja_service
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PING_QUERY = text("SELECT 1")
+
+# Espera entre intentos mientras la BD no responde al arrancar
+ESPERA_REINTENTO_SEGUNDOS = 5
+
+# Parámetros que no encuentran filas: la sentencia se prepara y se ejecuta sin
+# leer ni modificar datos
+SIN_PRODUCTOS = {'rgp_calm': -1, 'productos': []}
+
+
+def fsentencias_calentamiento() -> List[Tuple[object, dict]]:
+    """
+    (sentencia, parámetros) de las consultas más usadas. Los INSERT de
+    trp_tranin/trt_tranin no se incluyen: escribirían filas, y con
+    insertmanyvalues su SQL depende del número de líneas.
+    """
+    ejecuciones = [
+        (inventario_service.DESGLOSE_QUERY, {
+            'lxcpro': -1, 'licantid': 0, 'lxtven': -1, 'lxincsum': 'S',
+            'max_nivel': inventario_service.MAX_NIVEL_RECETA
+        }),
+        (inventario_service.COSTOS_ESTIMADOS_QUERY, SIN_PRODUCTOS),
+        (inventario_service.BLOQUEO_INVENTARIO_QUERY, SIN_PRODUCTOS),
+        (inventario_service.ACTUALIZA_INVENTARIO_QUERY, {**SIN_PRODUCTOS, 'cantidades': [], 'costos': []}),
+        (receta_service.ARISTAS_RECETA_QUERY, {'lxcpro': -1, 'lxtven': -1}),
+        (caja_service.VERAPE_QUERY, {'rgp_calm': -1, 'cjp_ccaj': -1}),
+    ]
+    for nombre, lista in LISTAS.items():
+        sin_busqueda = fsentencias(nombre, False, lista.search_strategy, lista.order)
+        con_busqueda = fsentencias(nombre, True, lista.search_strategy, lista.order)
+        ejecuciones += [
+            (sin_busqueda.pagina, {'limit': 0, 'offset': 0}),
+            (sin_busqueda.primera, {'limit': 0}),
+            (con_busqueda.pagina, {'search': '', 'limit': 0, 'offset': 0}),
+        ]
+    return ejecuciones
+
+
+class Calentamiento:
+    """
+    Fase de calentamiento de un worker: abre conexiones del pool, carga las
+    tablas de textos, los datos de referencia y los catálogos, y ejecuta las
+    sentencias más usadas en cada conexión abierta (sentencias preparadas de
+    asyncpg y caché de compilación de SQLAlchemy). /ready responde 200 solo
+    cuando termina.
+    """
+
+    def __init__(self):
+        self.listo = False
+        self.inicio: Optional[datetime] = None
+        self.fin: Optional[datetime] = None
+        self.fases: Dict[str, dict] = {}
+
+    async def _fase(self, nombre: str, funcion: Callable[[], Awaitable[object]]) -> bool:
+        inicio = time.perf_counter()
+        try:
+            detalle = await funcion()
+            exito, error = True, None
+        except Exception as e:
+            detalle, exito, error = None, False, str(e)
+        ms = round((time.perf_counter() - inicio) * 1000, 1)
+        self.fases[nombre] = {"ms": ms, "ok": exito, "detalle": detalle, "error": error}
+        if exito:
+            logger.info(f"Calentamiento: {nombre} en {ms} ms ({detalle})")
+        else:
+            logger.warning(f"Calentamiento: {nombre} falló en {ms} ms: {error}")
+        return exito
+
+    async def _conexiones(self) -> str:
+        """Abre ARRANQUE_CONEXIONES conexiones a la vez en cada pool y las devuelve (quedan abiertas)."""
+        n = min(settings.ARRANQUE_CONEXIONES, settings.DB_POOL_SIZE)
+        async with AsyncExitStack() as pila:
+            conexiones = await asyncio.gather(*(
+                pila.enter_async_context(async_engine.connect()) for _ in range(n)
+            ))
+            for conexion in conexiones:
+                await conexion.execute(PING_QUERY)
+
+        def sync():
+            conexiones = [engine.connect() for _ in range(n)]
+            try:
+                for conexion in conexiones:
+                    conexion.execute(PING_QUERY)
+            finally:
+                for conexion in conexiones:
+                    conexion.close()
+        await asyncio.to_thread(sync)
+        return f"{n} async + {n} sync"
+
+    async def _textos(self) -> str:
+        tablas = sorted(f for f in os.listdir(SYSTEM_DIR) if f.endswith(".tbl")) if os.path.isdir(SYSTEM_DIR) else []
+        lineas = sum(len(tablas_texto.tabla(tabla).lineas) for tabla in tablas)
+        return f"{len(tablas)} tablas, {lineas} líneas"
+
+    async def _referencia(self) -> str:
+        snapshot = await referencia_store.recargar()
+        return f"versión {snapshot.version}"
+
+    async def _catalogos(self) -> str:
+        if not settings.CATALOGO_CACHE:
+            return "desactivado"
+        almacenes = sorted({lista.catalogo_almacen for lista in LISTAS.values() if lista.catalogo_almacen is not None})
+        async with AsyncSessionLocal() as db:
+            for almacen in almacenes:
+                await catalogo_cache.obtener(db, almacen)
+        return f"{len(almacenes)} almacenes"
+
+    async def _sentencias(self) -> str:
+        """
+        Ejecuta las sentencias frecuentes en las conexiones del pool: asyncpg
+        guarda la sentencia preparada por conexión, así que se abren las mismas
+        ARRANQUE_CONEXIONES a la vez. Todo va en una transacción que se deshace.
+        """
+        listas = fcompila_listados()
+        ejecuciones = fsentencias_calentamiento()
+        n = min(settings.ARRANQUE_CONEXIONES, settings.DB_POOL_SIZE)
+        async with AsyncExitStack() as pila:
+            conexiones = await asyncio.gather(*(
+                pila.enter_async_context(async_engine.connect()) for _ in range(n)
+            ))
+            for conexion in conexiones:
+                try:
+                    for sentencia, params in ejecuciones:
+                        await conexion.execute(sentencia, params)
+                finally:
+                    await conexion.rollback()
+        return f"{listas} listados, {len(ejecuciones)} sentencias en {n} conexiones"
+
+    async def ejecutar(self) -> None:
+        self.inicio = datetime.now()
+        inicio = time.perf_counter()
+
+        # Sin conexión a la BD el worker no está listo: se reintenta hasta lograrlo
+        while not await self._fase("conexiones", self._conexiones):
+            await asyncio.sleep(ESPERA_REINTENTO_SEGUNDOS)
+
+        await self._fase("textos", self._textos)
+        await self._fase("referencia", self._referencia)
+        await self._fase("catalogos", self._catalogos)
+        await self._fase("sentencias", self._sentencias)
+
+        self.fin = datetime.now()
+        self.listo = True
+        logger.info(f"Calentamiento completo en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    def estado(self) -> dict:
+        return {
+            "listo": self.listo,
+            "inicio": self.inicio.isoformat() if self.inicio else None,
+            "fin": self.fin.isoformat() if self.fin else None,
+            "fases": self.fases,
+        }
+
+
+calentamiento = Calentamiento()
@@ -1,49 +1,102 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text
 from app.utils.api_helpers import raise_api_error
 from fastapi import status
-from typing import Literal, Optional
+from typing import Dict, Optional, Tuple
 from app.models.pos_models import CajeroData # Necesitamos el modelo del Cajero
+from app.core.config import settings
+import threading
+import time
 
 
-async def fcodest_service(
-    lxpar: Literal['C', 'P'], 
-    lxpa1: int, 
-    db: Session
-) -> Optional[int]:
+# --- Verificación de apertura (fverape) ---
+
+# Las tres búsquedas de fverape (dep_descri -> cjp_recaja -> prp_person) en una
+# sola consulta (reemplaza a fcodest("C", 903)). Con LEFT JOIN se distingue en
+# qué paso falla, como las búsquedas separadas de 4GL:
+#   sin fila            -> el código 903 no está en dep_descri
+#   cjp_ccaj es NULL    -> la caja no tiene apertura (no hay fila en cjp_recaja)
+#   prp_cper es NULL    -> la caja no tiene cajero asignado (cjp_ccjr NULL o sin prp_person)
+VERAPE_QUERY = text("""
+    SELECT D.dep_cdes, R.cjp_ccaj, R.cjp_ccjr, P.prp_cper, P.prp_dper, P.prp_ccar
+    FROM dep_descri AS D
+    LEFT JOIN cjp_recaja AS R
+        ON R.cjp_iope = D.dep_cdes
+        AND R.cjp_calm = :rgp_calm
+        AND R.cjp_ccaj = :cjp_ccaj
+        AND R.cjp_iact = 'A' -- "A" de Activa
+    LEFT JOIN prp_person AS P
+        ON P.prp_calm = R.cjp_calm
+        AND P.prp_cper = R.cjp_ccjr
+        AND P.prp_ccar = 2 -- Código 2 para Cajero
+    WHERE D.dep_tdes = 'C' AND D.dep_cdes = 903 -- 903 = Estado de Caja
+    LIMIT 1
+""")
+
+
+class CajaCache:
     """
-    Migración de FUNCTION fcodest(lxpar, lxpa1).
-    Busca el código de descripción (dep_cdes) de la operación en dep_descri.
+    Cajas verificadas por (cjp_calm, cjp_ccaj) con vida corta. Solo se guardan
+    verificaciones exitosas: una caja recién abierta se ve de inmediato.
     """
-    
-    # Esta lógica es una migración directa del SELECT de fcodest en 4GL (dep_descri).
-    try:
-        query = text("""
-            SELECT dep_cdes
-            FROM dep_descri
-            WHERE dep_tdes = :lxpar
-            AND dep_cdes = :lxpa1
-        """)
-        
-        result = db.execute(query, {'lxpar': lxpar, 'lxpa1': lxpa1}).scalar_one_or_none()
-        
-        # Retornamos el código de operación o None si no se encuentra.
-        return result
-        
-    except Exception as e:
-        print(f"Error en fcodest al buscar código {lxpa1}: {e}")
-        return None 
+
+    def __init__(self, ttl_segundos: int):
+        self.ttl_segundos = ttl_segundos
+        self._cajas: Dict[Tuple[int, int], Tuple[float, CajeroData]] = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, rgp_calm: int, cjp_ccaj: int) -> Optional[CajeroData]:
+        with self._lock:
+            entrada = self._cajas.get((rgp_calm, cjp_ccaj))
+            if entrada is not None and entrada[0] > time.monotonic():
+                self.aciertos += 1
+                return entrada[1]
+            self._cajas.pop((rgp_calm, cjp_ccaj), None)
+            self.fallos += 1
+            return None
+
+    def guardar(self, rgp_calm: int, cjp_ccaj: int, cajero: CajeroData) -> None:
+        if self.ttl_segundos <= 0:
+            return
+        with self._lock:
+            self._cajas[(rgp_calm, cjp_ccaj)] = (time.monotonic() + self.ttl_segundos, cajero)
+
+    def invalidar(self, rgp_calm: Optional[int] = None, cjp_ccaj: Optional[int] = None) -> int:
+        """Llamar al abrir o cerrar una caja. Sin argumentos invalida todas."""
+        with self._lock:
+            claves = [
+                clave for clave in self._cajas
+                if (rgp_calm is None or clave[0] == rgp_calm) and (cjp_ccaj is None or clave[1] == cjp_ccaj)
+            ]
+            for clave in claves:
+                del self._cajas[clave]
+        return len(claves)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "cajas": len(self._cajas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "ttl_segundos": self.ttl_segundos,
+            }
+
+
+caja_cache = CajaCache(ttl_segundos=settings.CAJA_CACHE_TTL)
 
 
 async def fverape_service(
     cjp_ccaj: int,        # Código de caja (grrecaja.cjp_ccaj)
     rgp_calm: int,        # Código de almacén (grgenera.rgp_calm)
     gxprufac: str,        # Indicador de prueba (N/F/S)
-    db: Session
+    db: AsyncSession
 ) -> tuple[bool, str, Optional[CajeroData]]:
     """
     Migración de FUNCTION fverape().
     Verifica si la caja está abierta y si el cajero está asignado.
+    Una caja ya verificada se responde desde caja_cache durante CAJA_CACHE_TTL segundos.
     
     Returns:
         (bool) Éxito o fracaso, (str) Mensaje de error/éxito, (CajeroData) Datos del cajero.
@@ -56,69 +109,38 @@ async def fverape_service(
     if gxprufac != "N":
         # Retornamos éxito, simulando la omisión de verificación de BD.
         return True, "Modo de prueba activo.", CajeroData(prp_cper=0, prp_dper="PRUEBA", prp_ccar=0)
+
+    cajero_data = caja_cache.obtener(rgp_calm, cjp_ccaj)
+    if cajero_data is not None:
+        return True, "Caja verificada.", cajero_data
     
-    # 2. Búsqueda del Código de Apertura (fcodest)
-    # LET grrecaja.cjp_iope = fcodest("C", 903)
-    cjp_iope_estado = await fcodest_service('C', 903, db) # 903 = Estado de Caja
-    
-    if cjp_iope_estado is None:
-        raise_api_error("El código de operación de caja (903) no está definido en dep_descri.", status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-    # 3. Consulta de Registro de Caja (cjp_recaja)
-    # Busca la caja que está en estado 'A' (Abierta)
+    # 2. dep_descri (903) + cjp_recaja + prp_person en una sola consulta
     try:
-        query_apertura = text("""
-            SELECT cjp_cdin, cjp_ccjr
-            FROM cjp_recaja
-            WHERE cjp_calm = :rgp_calm
-            AND cjp_ccaj = :cjp_ccaj
-            AND cjp_iope = :cjp_iope_estado
-            AND cjp_iact = 'A' -- "A" de Activa
-        """)
-        apertura_result = db.execute(query_apertura, {
+        verape_result = (await db.execute(VERAPE_QUERY, {
             'rgp_calm': rgp_calm,
-            'cjp_ccaj': cjp_ccaj,
-            'cjp_iope_estado': cjp_iope_estado
-        }).fetchone()
+            'cjp_ccaj': cjp_ccaj
+        })).fetchone()
         
     except Exception as e:
-        print(f"Error BD en fverape al buscar cjp_recaja: {e}")
+        print(f"Error BD en fverape al verificar la caja {cjp_ccaj}: {e}")
         return False, "Error interno de base de datos.", None
     
+    if verape_result is None:
+        raise_api_error("El código de operación de caja (903) no está definido en dep_descri.", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     # IF STATUS = NOTFOUND THEN CALL fconfir("E","ESTA CAJA NO TIENE APERTURA")
-    if apertura_result is None:
+    if verape_result.cjp_ccaj is None:
         return False, "ESTA CAJA NO TIENE APERTURA", None
 
-    # Extraer datos:
-    cjp_ccjr = apertura_result.cjp_ccjr
-    
-    # 4. Consulta de Datos del Cajero (prp_person)
-    # Busca que el cajero asignado exista y tenga el cargo 2 (Cajero)
-    try:
-        query_cajero = text("""
-            SELECT prp_dper, prp_ccar
-            FROM prp_person
-            WHERE prp_calm = :rgp_calm
-            AND prp_cper = :cjp_ccjr
-            AND prp_ccar = 2 -- Código 2 para Cajero (como en tu 4GL)
-        """)
-        cajero_result = db.execute(query_cajero, {
-            'rgp_calm': rgp_calm,
-            'cjp_ccjr': cjp_ccjr
-        }).fetchone()
-        
-    except Exception as e:
-        print(f"Error BD en fverape al buscar prp_person: {e}")
-        return False, "Error interno de base de datos.", None
-
     # IF STATUS = NOTFOUND THEN CALL fconfir("E","ESTA CAJA NO TIENE CAJERO ASIGNADO")
-    if cajero_result is None:
+    if verape_result.prp_cper is None:
         return False, "ESTA CAJA NO TIENE CAJERO ASIGNADO", None
         
     # Éxito:
     cajero_data = CajeroData(
-        prp_cper=cjp_ccjr,
-        prp_dper=cajero_result.prp_dper,
-        prp_ccar=cajero_result.prp_ccar
+        prp_cper=verape_result.cjp_ccjr,
+        prp_dper=verape_result.prp_dper,
+        prp_ccar=verape_result.prp_ccar
     )
-    return True, "Caja verificada.", cajero_data
\ No newline at end of file
+    caja_cache.guardar(rgp_calm, cjp_ccaj, cajero_data)
+    return True, "Caja verificada.", cajero_data
@@ -0,0 +1,145 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+from app.core.config import settings
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import sys
+import time
+
+# --- Catálogo de productos en memoria por almacén (ppp_cpro / ppp_dpro) ---
+
+CATALOGO_QUERY = text("""
+    SELECT ppp_cpro, ppp_dpro
+    FROM ppp_propvt
+    WHERE ppp_calm = :rgp_calm
+""")
+
+
+def ftrigramas(texto: str) -> Set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class CatalogoAlmacen:
+    """
+    Foto inmutable del catálogo de un almacén: productos ordenados por código,
+    orden alterno por descripción e índice de trigramas para búsquedas por subcadena.
+    """
+
+    def __init__(self, rgp_calm: int, filas: Dict[int, str], cargado: float):
+        self.rgp_calm = rgp_calm
+        self.cargado = cargado   # time.monotonic() de la última carga completa
+        self.filas = filas       # {ppp_cpro: ppp_dpro}
+
+        # Posiciones ordenadas por ppp_cpro y por (ppp_dpro, ppp_cpro)
+        self.codigos: List[int] = sorted(filas)
+        self.descripciones: List[Optional[str]] = [filas[cpro] for cpro in self.codigos]
+        self._minusculas: List[str] = [(dpro or "").lower() for dpro in self.descripciones]
+        self.orden_dpro: List[int] = sorted(
+            range(len(self.codigos)), key=self.clave_dpro
+        )
+        # Rango de cada posición en el orden por descripción
+        self.rango_dpro: List[int] = [0] * len(self.codigos)
+        for rango, posicion in enumerate(self.orden_dpro):
+            self.rango_dpro[posicion] = rango
+
+        indice: Dict[str, List[int]] = {}
+        for posicion, dpro in enumerate(self._minusculas):
+            for trigrama in ftrigramas(dpro):
+                indice.setdefault(trigrama, []).append(posicion)
+        self._trigramas = indice
+
+    def clave_dpro(self, posicion: int) -> Tuple[bool, str, int]:
+        """Clave de ORDER BY ppp_dpro, ppp_cpro (los NULL van al final, como en PostgreSQL)."""
+        dpro = self.descripciones[posicion]
+        return (dpro is None, dpro or "", self.codigos[posicion])
+
+    def buscar(self, search: Optional[str], prefijo: bool = False) -> List[int]:
+        """
+        Posiciones (en orden de ppp_cpro) cuya descripción contiene search,
+        sin distinguir mayúsculas (equivalente a ILIKE '%search%' o 'search%').
+        """
+        if not search:
+            return list(range(len(self.codigos)))
+
+        termino = search.lower()
+        if prefijo:
+            return [i for i, dpro in enumerate(self._minusculas) if dpro.startswith(termino)]
+
+        candidatos: Iterable[int] = range(len(self.codigos))
+        trigramas = ftrigramas(termino)
+        if trigramas:
+            listas = sorted((self._trigramas.get(t, []) for t in trigramas), key=len)
+            if not listas[0]:
+                return []
+            comunes = set(listas[0])
+            for lista in listas[1:]:
+                comunes.intersection_update(lista)
+                if not comunes:
+                    return []
+            candidatos = sorted(comunes)
+
+        return [i for i in candidatos if termino in self._minusculas[i]]
+
+    def memoria_bytes(self) -> int:
+        """Tamaño aproximado en memoria de la foto (cadenas, listas e índice)."""
+        total = sys.getsizeof(self.filas) + sys.getsizeof(self.codigos)
+        total += sys.getsizeof(self.orden_dpro) + sys.getsizeof(self.rango_dpro)
+        total += sum(sys.getsizeof(d) + sys.getsizeof(m) for d, m in zip(self.descripciones, self._minusculas))
+        total += sys.getsizeof(self._trigramas)
+        total += sum(sys.getsizeof(t) + sys.getsizeof(p) for t, p in self._trigramas.items())
+        return total
+
+
+class CatalogoCache:
+    """
+    Catálogos por almacén (solo ppp_cpro/ppp_dpro). Se recargan completos cada
+    CATALOGO_REFRESCO_SEGUNDOS: hasta entonces un cambio de ppp_dpro o un alta o
+    baja en ppp_propvt no se ve (invalidar() fuerza la recarga). Los movimientos
+    de inventario no lo afectan: solo tocan ppp_qinv/ppp_vcos. Cada recarga arma
+    una foto nueva y la reemplaza de una vez.
+    """
+
+    def __init__(self, refresco_segundos: int):
+        self.refresco_segundos = refresco_segundos
+        self._catalogos: Dict[int, CatalogoAlmacen] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.cargas_completas = 0
+
+    def invalidar(self, rgp_calm: Optional[int] = None) -> None:
+        """Fuerza la recarga completa de un almacén (o de todos)."""
+        for calm in ([rgp_calm] if rgp_calm is not None else list(self._catalogos)):
+            self._catalogos.pop(calm, None)
+
+    async def obtener(self, db: AsyncSession, rgp_calm: int) -> CatalogoAlmacen:
+        catalogo = self._catalogos.get(rgp_calm)
+        if catalogo is not None and time.monotonic() - catalogo.cargado < self.refresco_segundos:
+            return catalogo
+
+        lock = self._locks.setdefault(rgp_calm, asyncio.Lock())
+        async with lock:
+            catalogo = self._catalogos.get(rgp_calm)
+            if catalogo is None or time.monotonic() - catalogo.cargado >= self.refresco_segundos:
+                result = await db.execute(CATALOGO_QUERY, {'rgp_calm': rgp_calm})
+                filas = {row.ppp_cpro: row.ppp_dpro for row in result}
+                catalogo = CatalogoAlmacen(rgp_calm, filas, cargado=time.monotonic())
+                self.cargas_completas += 1
+                self._catalogos[rgp_calm] = catalogo
+            return catalogo
+
+    def estadisticas(self) -> dict:
+        ahora = time.monotonic()
+        return {
+            "refresco_segundos": self.refresco_segundos,
+            "cargas_completas": self.cargas_completas,
+            "almacenes": {
+                calm: {
+                    "productos": len(catalogo.codigos),
+                    "edad_segundos": round(ahora - catalogo.cargado, 1),
+                    "memoria_bytes": catalogo.memoria_bytes(),
+                }
+                for calm, catalogo in self._catalogos.items()
+            },
+        }
+
+
+catalogo_cache = CatalogoCache(refresco_segundos=settings.CATALOGO_REFRESCO_SEGUNDOS)
@@ -0,0 +1,274 @@
+from app.services.inventario_service import CostosConfig, get_costos_config, fcalcula_costo
+from app.core.config import settings
+from decimal import Decimal
+from fractions import Fraction
+from typing import List, Literal, NamedTuple, Optional, Sequence, Tuple
+import logging
+
+try:
+    import numpy as np
+except ImportError: # numpy es opcional: sin él se usa el motor Decimal
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Punto fijo: cantidades y costos se llevan como enteros escalados (int64)
+ESCALA_CANTIDAD = 4
+ESCALA_COSTO = 4
+DECIMALES_COSTO = 2  # ROUND1 de finvpro
+
+# Límite de cada entrada escalada y de los productos costo * cantidad, de modo que
+# 2n + d nunca desborde int64. Las filas fuera de rango se calculan con Decimal.
+LIMITE_ENTRADA = 10 ** 15
+LIMITE_PRODUCTO = 2 * 10 ** 18
+
+
+class MovimientoCosto(NamedTuple):
+    """Entradas de finvpro para un producto (estado actual + movimiento)."""
+    lxcanact: Decimal
+    lxcosact: Decimal
+    lxcosest: Decimal
+    lxcannue: Decimal
+    lxmodulo: int
+    lxpar: Literal['A', 'E'] = 'A'
+    licalcos: Literal['S', 'N'] = 'S'
+
+
+class ResultadoCosto(NamedTuple):
+    lxcosnue: Decimal
+    cantidad: Decimal
+
+
+class DiferenciaCosto(NamedTuple):
+    posicion: int
+    movimiento: MovimientoCosto
+    decimal: ResultadoCosto
+    numpy: ResultadoCosto
+
+
+def fcostea_decimal(
+    movimientos: Sequence[MovimientoCosto],
+    config: Optional[CostosConfig] = None
+) -> List[ResultadoCosto]:
+    """Motor de finvpro: fcalcula_costo (Decimal) fila por fila."""
+    config = config or get_costos_config()
+    return [ResultadoCosto(*fcalcula_costo(*m, config=config)) for m in movimientos]
+
+
+def fcosto_exacto(m: MovimientoCosto, config: CostosConfig) -> ResultadoCosto:
+    """
+    Reglas de fcalcula_costo con el cociente exacto (Fraction) y un solo
+    ROUND_HALF_UP a centésimas. Diagnóstico secundario del modo verificar:
+    fcalcula_costo divide con 28 dígitos significativos y después redondea
+    (doble redondeo), y puede quedar un centavo arriba solo si lxcosact *
+    lxcanact (escalados) llega a ~10^25, muy por encima de LIMITE_PRODUCTO.
+    """
+    nueva = m.lxcanact + m.lxcannue * m.lxmodulo
+    if not (m.licalcos == 'S' and m.lxpar == 'A' and nueva > 0):
+        # Sin división: no hay doble redondeo
+        return ResultadoCosto(*fcalcula_costo(*m, config=config))
+
+    base = m.lxcanact + m.lxcannue
+    if base == 0:
+        # Mismo error que finvpro
+        return ResultadoCosto(*fcalcula_costo(*m, config=config))
+    cociente = Fraction(m.lxcosact) * Fraction(m.lxcanact) / Fraction(base)
+    if cociente < 0:
+        return ResultadoCosto(Decimal('0.00'), nueva)
+    n, d = (cociente * 10 ** DECIMALES_COSTO).as_integer_ratio()
+    return ResultadoCosto(Decimal((2 * n + d) // (2 * d)).scaleb(-DECIMALES_COSTO), nueva)
+
+
+def fcostea_exacto(
+    movimientos: Sequence[MovimientoCosto],
+    config: Optional[CostosConfig] = None
+) -> List[ResultadoCosto]:
+    """Referencia exacta del motor en punto fijo (fcosto_exacto fila por fila)."""
+    config = config or get_costos_config()
+    return [fcosto_exacto(m, config) for m in movimientos]
+
+
+class LoteCosto(NamedTuple):
+    """
+    Movimientos en punto fijo (arreglos int64 de igual largo). Cantidades con
+    ESCALA_CANTIDAD decimales y costos con ESCALA_COSTO; 'calcula' marca las
+    filas con licalcos = 'S' y lxpar = 'A'. Los procesos masivos lo arman
+    directamente desde SQL (columna * 10^escala) sin pasar por Decimal.
+    """
+    canact: "np.ndarray"
+    cosact: "np.ndarray"
+    cosest: "np.ndarray"
+    cannue: "np.ndarray"
+    modulo: "np.ndarray"
+    calcula: "np.ndarray"
+
+
+def fescala(valores: Sequence[Decimal], decimales: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Decimal -> entero escalado. Devuelve (enteros, exacto); exacto marca lo representable."""
+    escalados = [valor.scaleb(decimales) for valor in valores]
+    enteros = [int(escalado) for escalado in escalados]
+    exacto = np.fromiter(
+        (escalado == entero and -LIMITE_ENTRADA < entero < LIMITE_ENTRADA
+         for escalado, entero in zip(escalados, enteros)),
+        dtype=bool, count=len(enteros)
+    )
+    return np.fromiter(
+        (entero if exacto_i else 0 for entero, exacto_i in zip(enteros, exacto.tolist())),
+        dtype=np.int64, count=len(enteros)
+    ), exacto
+
+
+def flote_movimientos(movimientos: Sequence[MovimientoCosto]) -> Tuple[LoteCosto, "np.ndarray"]:
+    """Convierte movimientos Decimal a LoteCosto. Devuelve (lote, exacto)."""
+    canact, ok_canact = fescala([m.lxcanact for m in movimientos], ESCALA_CANTIDAD)
+    cosact, ok_cosact = fescala([m.lxcosact for m in movimientos], ESCALA_COSTO)
+    cosest, ok_cosest = fescala([m.lxcosest for m in movimientos], ESCALA_COSTO)
+    cannue, ok_cannue = fescala([m.lxcannue for m in movimientos], ESCALA_CANTIDAD)
+    modulo = np.fromiter((m.lxmodulo for m in movimientos), dtype=np.int64, count=len(movimientos))
+    calcula = np.fromiter(
+        (m.licalcos == 'S' and m.lxpar == 'A' for m in movimientos), dtype=bool, count=len(movimientos)
+    )
+    exacto = ok_canact & ok_cosact & ok_cosest & ok_cannue & (np.abs(modulo) <= 1)
+    return LoteCosto(canact, cosact, cosest, cannue, modulo, calcula), exacto
+
+
+def fcostea_enteros(
+    lote: LoteCosto,
+    config: Optional[CostosConfig] = None
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    Núcleo vectorizado: mismas reglas que fcalcula_costo en aritmética entera.
+    El redondeo ROUND_HALF_UP de n/d (d > 0, n >= 0) es (2n + d) // (2d), sobre
+    el cociente exacto: coincide con fcostea_exacto y con fcalcula_costo salvo
+    el doble redondeo de este último (ver fcosto_exacto).
+
+    Returns:
+        (lxcosnue en centésimas, nueva cantidad escalada, exacto). Las filas con
+        exacto = False (desborde de int64 o división por cero) deben
+        calcularse con fcalcula_costo.
+    """
+    config = config or get_costos_config()
+    canact, cosact, cosest, cannue, modulo, calcula = lote
+
+    nueva = canact + cannue * modulo
+
+    # 4. Reglas de costos (grconcos)
+    if config.COP_TCOS_TIPO_S == "S":
+        costo = cosest
+    elif config.COP_ICOC_USA_ESTIMADO == "S":
+        costo = np.where(canact == 0, cosest, cosact)
+    else:
+        costo = cosact
+
+    # 5. Costo promedio: (lxcosact * lxcanact) / (lxcanact + lxcannue)
+    promedio = calcula & (nueva > 0)
+    costo = np.where(calcula & ~promedio, cosact, costo)
+
+    # Fracción n/d en centésimas: sin promedio d = 10^(escala-2); con promedio
+    # las escalas de cantidad se cancelan
+    divisor_centesimas = 10 ** (ESCALA_COSTO - DECIMALES_COSTO)
+    base = canact + cannue
+    producto_grande = np.abs(cosact.astype(np.float64)) * np.abs(canact.astype(np.float64)) >= LIMITE_PRODUCTO
+    exacto = ~(promedio & (producto_grande | (base == 0)))
+    seguro = exacto & promedio
+
+    n = np.where(seguro, cosact * np.where(seguro, canact, 0), costo)
+    d = np.where(seguro, base * divisor_centesimas, divisor_centesimas)
+    d = np.where(d == 0, 1, d)
+
+    # 6. Negativos a cero (antes de redondear) y ROUND_HALF_UP
+    negativo = (n != 0) & ((n < 0) != (d < 0))
+    n, d = np.abs(n), np.abs(d)
+    centesimas = np.where(negativo, 0, (2 * n + d) // (2 * d))
+
+    return centesimas, nueva, exacto
+
+
+def fcostea_numpy(
+    movimientos: Sequence[MovimientoCosto],
+    config: Optional[CostosConfig] = None
+) -> List[ResultadoCosto]:
+    """
+    Motor vectorizado sobre movimientos Decimal. Las filas que no caben en el
+    punto fijo (escala, int64 o división por cero) se delegan a fcalcula_costo,
+    que así lanza el mismo error que finvpro.
+    """
+    if np is None:
+        return fcostea_decimal(movimientos, config)
+
+    config = config or get_costos_config()
+    if not movimientos:
+        return []
+
+    lote, exacto = flote_movimientos(movimientos)
+    centesimas, nueva, exacto_calculo = fcostea_enteros(lote, config)
+    exacto &= exacto_calculo
+
+    resultado = [
+        ResultadoCosto(Decimal(c).scaleb(-DECIMALES_COSTO), Decimal(q).scaleb(-ESCALA_CANTIDAD))
+        for c, q in zip(centesimas.tolist(), nueva.tolist())
+    ]
+
+    # Filas fuera del rango del punto fijo: motor Decimal
+    for i in np.flatnonzero(~exacto).tolist():
+        resultado[i] = ResultadoCosto(*fcalcula_costo(*movimientos[i], config=config))
+
+    return resultado
+
+
+def fverifica_motores(
+    movimientos: Sequence[MovimientoCosto],
+    config: Optional[CostosConfig] = None
+) -> List[DiferenciaCosto]:
+    """
+    Compara el motor vectorizado con el de finvpro (fcostea_decimal), que deben
+    coincidir al centavo, y devuelve las filas cuyo costo o cantidad no coincide.
+    """
+    config = config or get_costos_config()
+    return _fdiferencias(movimientos, fcostea_decimal(movimientos, config), fcostea_numpy(movimientos, config))
+
+
+def _fdiferencias(
+    movimientos: Sequence[MovimientoCosto],
+    finvpro: List[ResultadoCosto],
+    vectorizado: List[ResultadoCosto]
+) -> List[DiferenciaCosto]:
+    return [
+        DiferenciaCosto(i, movimientos[i], esperado, obtenido)
+        for i, (esperado, obtenido) in enumerate(zip(finvpro, vectorizado))
+        if esperado.lxcosnue != obtenido.lxcosnue or esperado.cantidad != obtenido.cantidad
+    ]
+
+
+def fcostea_lote(
+    movimientos: Sequence[MovimientoCosto],
+    config: Optional[CostosConfig] = None,
+    motor: Optional[Literal['numpy', 'decimal', 'verificar']] = None
+) -> List[ResultadoCosto]:
+    """
+    Costeo por lotes (recosteo nocturno, reproceso de ventas del día).
+    motor='verificar' ejecuta ambos motores, registra las filas en que difieren
+    (y, aparte, cuántas de finvpro difieren del cociente exacto por su doble
+    redondeo) y devuelve el resultado Decimal (el de finvpro).
+    """
+    motor = motor or settings.COSTEO_MOTOR
+    if motor == 'decimal':
+        return fcostea_decimal(movimientos, config)
+    if motor == 'numpy':
+        return fcostea_numpy(movimientos, config)
+
+    config = config or get_costos_config()
+    resultado = fcostea_decimal(movimientos, config)
+    diferencias = _fdiferencias(movimientos, resultado, fcostea_numpy(movimientos, config))
+    for diferencia in diferencias[:20]:
+        logger.error(f"Costeo: diferencia entre motores en la fila {diferencia.posicion}: {diferencia}")
+    if diferencias:
+        logger.error(f"Costeo: {len(diferencias)} de {len(movimientos)} filas difieren entre motores")
+
+    doble_redondeo = sum(
+        1 for finvpro, exacto in zip(resultado, fcostea_exacto(movimientos, config))
+        if finvpro.lxcosnue != exacto.lxcosnue
+    )
+    if doble_redondeo:
+        logger.warning(f"Costeo: {doble_redondeo} filas difieren del cociente exacto por el doble redondeo de finvpro")
+    return resultado
@@ -0,0 +1,149 @@
+from sqlalchemy.sql import text
+from app.db.database import AsyncSessionLocal
+from app.services.transac_service import CAMPOS_TRANIN
+from app.utils.json_rapido import fjson_bytes
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Literal, Optional, Sequence
+import csv
+import io
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+FormatoExportacion = Literal['ndjson', 'csv']
+
+# Filas por viaje al servidor (cursor del lado del servidor) y tamaño de cada
+# fragmento enviado al cliente
+FILAS_POR_LOTE = 2000
+BYTES_POR_FRAGMENTO = 64 * 1024
+
+CAMPOS_INVENTARIO = ("ppp_calm", "ppp_cpro", "ppp_dpro", "ppp_qinv", "ppp_vcos", "ppp_tippro")
+
+TRANSACCIONES_QUERY = text(f"""
+    SELECT {', '.join(CAMPOS_TRANIN)}
+    FROM trp_tranin
+    WHERE (CAST(:desde AS DATE) IS NULL OR trp_ftra >= :desde)
+    AND (CAST(:hasta AS DATE) IS NULL OR trp_ftra <= :hasta)
+    AND (CAST(:almacen AS INTEGER) IS NULL OR trp_calm = :almacen)
+    ORDER BY trp_ftra, trp_horrec, trp_nlin
+""")
+
+INVENTARIO_QUERY = text(f"""
+    SELECT {', '.join(CAMPOS_INVENTARIO)}
+    FROM ppp_propvt
+    WHERE (CAST(:almacen AS INTEGER) IS NULL OR ppp_calm = :almacen)
+    ORDER BY ppp_calm, ppp_cpro
+""")
+
+MEDIA_TYPES = {
+    'ndjson': "application/x-ndjson",
+    'csv': "text/csv; charset=utf-8",
+}
+
+
+def fvalor_json(valor):
+    """Decimal y fechas con la misma representación que jsonable_encoder."""
+    if isinstance(valor, Decimal):
+        return int(valor) if valor.as_tuple().exponent >= 0 else float(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+async def ffilas(consulta, params: dict) -> AsyncIterator[Sequence]:
+    """
+    Filas de la consulta a medida que llegan del servidor. Abre su propia sesión:
+    la respuesta se sigue enviando después de que el endpoint retorna.
+    """
+    async with AsyncSessionLocal() as db:
+        resultado = await db.stream(consulta.execution_options(yield_per=FILAS_POR_LOTE), params)
+        async for particion in resultado.partitions():
+            for row in particion:
+                yield row
+
+
+async def flineas(
+    filas: AsyncIterator[Sequence],
+    campos: Sequence[str],
+    formato: FormatoExportacion
+) -> AsyncIterator[str]:
+    """Serializa las filas como NDJSON o CSV (con encabezado), en bloques de ~BYTES_POR_FRAGMENTO."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n") if formato == 'csv' else None
+    if escritor:
+        escritor.writerow(campos)
+
+    async for row in filas:
+        if escritor:
+            escritor.writerow(row)
+        else:
+            buffer.write(fjson_bytes(dict(zip(campos, row)), default=fvalor_json).decode("utf-8"))
+            buffer.write("\n")
+
+        if buffer.tell() >= BYTES_POR_FRAGMENTO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def fgzip(fragmentos: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Comprime al vuelo (formato gzip). Cada fragmento se vacía para que el cliente lo reciba enseguida."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for fragmento in fragmentos:
+        datos = compresor.compress(fragmento.encode("utf-8")) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+async def fbytes(fragmentos: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    async for fragmento in fragmentos:
+        yield fragmento.encode("utf-8")
+
+
+async def fexporta(
+    consulta,
+    params: dict,
+    campos: Sequence[str],
+    formato: FormatoExportacion,
+    comprimir: bool
+) -> AsyncIterator[bytes]:
+    """
+    Cuerpo de la respuesta de exportación: filas -> líneas -> (gzip) -> bytes.
+    Un error a mitad del envío ya no puede cambiar el código HTTP: se registra
+    y la respuesta queda truncada.
+    """
+    fragmentos = flineas(ffilas(consulta, params), campos, formato)
+    cuerpo = fgzip(fragmentos) if comprimir else fbytes(fragmentos)
+    try:
+        async for datos in cuerpo:
+            yield datos
+    except Exception:
+        logger.exception(f"Exportación interrumpida ({', '.join(f'{k}={v}' for k, v in params.items())})")
+        raise
+
+
+def fexporta_transacciones(
+    formato: FormatoExportacion,
+    comprimir: bool,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    almacen: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Líneas de trp_tranin (todas las columnas de TranInLine) en orden cronológico."""
+    params = {'desde': desde, 'hasta': hasta, 'almacen': almacen}
+    return fexporta(TRANSACCIONES_QUERY, params, CAMPOS_TRANIN, formato, comprimir)
+
+
+def fexporta_inventario(
+    formato: FormatoExportacion,
+    comprimir: bool,
+    almacen: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Existencias y costo de ppp_propvt por almacén y producto."""
+    return fexporta(INVENTARIO_QUERY, {'almacen': almacen}, CAMPOS_INVENTARIO, formato, comprimir)
@@ -0,0 +1,402 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.unidad_trabajo import fobtiene_uow
+from app.models.pos_models import TranInLine
+from app.utils.json_rapido import fjson_bytes
+from typing import List, Optional, Set, Tuple
+import asyncio
+import fcntl
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+COLA_DDL = """
+    CREATE TABLE IF NOT EXISTS cola_trt (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        token TEXT NOT NULL,
+        encolado REAL NOT NULL,
+        fila TEXT NOT NULL,
+        estado INTEGER NOT NULL DEFAULT 0
+    )
+"""
+COLA_INDICE_DDL = "CREATE INDEX IF NOT EXISTS cola_trt_estado ON cola_trt (estado, id)"
+
+# Tokens de PostgreSQL (crear con este DDL; también en benchmarks/esquema.sql).
+# Cada llamada a diferir inserta su token en la transacción de la solicitud:
+# existe si y solo si esa transacción se confirmó, y el vaciador lo borra en la
+# misma transacción en que inserta sus filas en trt_tranin.
+HISTORIAL_DDL = """
+    CREATE TABLE IF NOT EXISTS hdt_tokens (
+        hdt_token   VARCHAR(32) PRIMARY KEY,
+        hdt_creado  TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+INSERTA_TOKEN_QUERY = text("INSERT INTO hdt_tokens (hdt_token) VALUES (:token)")
+
+EXISTEN_TOKENS_QUERY = text(
+    "SELECT hdt_token FROM hdt_tokens WHERE hdt_token = ANY(CAST(:tokens AS VARCHAR[]))"
+)
+
+# Reclama los tokens del lote: solo los que devuelve (aún no vaciados) se insertan
+RECLAMA_TOKENS_QUERY = text(
+    "DELETE FROM hdt_tokens WHERE hdt_token = ANY(CAST(:tokens AS VARCHAR[])) RETURNING hdt_token"
+)
+
+# Estado de una fila del diario
+PENDIENTE = 0       # escrita antes del COMMIT en PostgreSQL; aún no se sabe si se confirmó
+CONFIRMADA = 1      # la transacción se confirmó: el vaciador la inserta
+DESCARTADA = 2      # sin token pasado el plazo; se revive si llega el COMMIT
+
+# Espera entre intentos de tomar el turno de vaciado (otro worker lo tiene)
+ESPERA_TURNO_SEGUNDOS = 5
+
+# Tiempo máximo del último vaciado al apagar el worker
+ESPERA_CIERRE_SEGUNDOS = 5
+
+# Pendientes más viejas que esto son de un worker que cayó entre el diario y
+# el COMMIT (o antes de marcarlas): se resuelven buscando su token en hdt_tokens
+PLAZO_PENDIENTE_SEGUNDOS = 120
+
+# Las descartadas se conservan este tiempo por si su transacción aún se confirma
+PLAZO_DESCARTADA_SEGUNDOS = 24 * 3600
+
+
+class HistorialDiferido:
+    """
+    Escritura diferida de trt_tranin (HISTORIAL_DIFERIDO).
+
+    ftransac inserta trp_tranin en la transacción de la solicitud como siempre;
+    la copia para trt_tranin se escribe ANTES del COMMIT en un diario SQLite
+    local (WAL) como pendiente, con un token que se inserta en hdt_tokens en la
+    misma transacción de PostgreSQL. Un vaciador en segundo plano inserta en
+    lotes las filas confirmadas.
+
+    - Después del COMMIT la fila se marca confirmada; si la transacción (o su
+      SAVEPOINT) se deshace, se borra. Ambas marcas van en un hilo, fuera del
+      event loop.
+    - Recuperación: si el worker cae entre el diario y la marca, la fila queda
+      pendiente; pasado PLAZO_PENDIENTE_SEGUNDOS el vaciador busca su token en
+      hdt_tokens: si existe la transacción se confirmó, si no la descarta.
+    - Exactamente una vez: el vaciador borra los tokens del lote en la misma
+      transacción en que inserta sus filas en trt_tranin, y solo inserta las de
+      los tokens que borró. Si cae antes de borrarlas del diario, el lote
+      repetido no inserta nada. Con synchronous=NORMAL el diario sobrevive a la
+      caída del proceso, no a la del sistema operativo.
+    - Contrapresión: con HISTORIAL_COLA_MAX filas en el diario (o sin unidad de
+      trabajo activa, o si el diario falla) ftransac vuelve a insertar
+      trt_tranin en la misma transacción. El conteo se lleva en memoria y se
+      actualiza desde el diario en cada vuelta del vaciador (límite blando).
+    - Varios workers comparten el diario; un bloqueo de archivo deja vaciar a
+      uno solo a la vez (si ese worker muere, otro toma el turno).
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._turno = None              # archivo con el bloqueo de vaciado
+        self._marcas: Set[asyncio.Task] = set()
+        self._pendientes = 0            # filas en el diario (aprox., todos los workers)
+        self._mas_antigua: Optional[float] = None
+        self.encoladas = 0
+        self.sincronas = 0
+        self.vaciadas = 0
+        self.descartadas = 0
+        self.recuperadas = 0
+        self.lotes = 0
+        self.errores = 0
+        self.ultimo_error: Optional[str] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            # NORMAL en WAL: lo confirmado sobrevive a la caída del proceso
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute(COLA_DDL)
+            conexion.execute(COLA_INDICE_DDL)
+            self._conexion = conexion
+        return self._conexion
+
+    # --- Diario (se llama desde hilos, nunca en el event loop) ---
+
+    def _contar(self) -> Tuple[int, Optional[float]]:
+        """(filas pendientes o confirmadas en el diario, fecha de encolado de la más antigua)."""
+        with self._lock:
+            total, encolado = self._db().execute(
+                f"SELECT COUNT(*), MIN(encolado) FROM cola_trt WHERE estado <> {DESCARTADA}"
+            ).fetchone()
+        return total, encolado
+
+    def _anotar(self, token: str, textos: List[str]) -> List[int]:
+        """Escribe las filas como pendientes en una transacción SQLite (id consecutivos). Devuelve sus id."""
+        ahora = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [
+                    db.execute(
+                        "INSERT INTO cola_trt (token, encolado, fila) VALUES (?, ?, ?)", (token, ahora, texto)
+                    ).lastrowid
+                    for texto in textos
+                ]
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def _marcar(self, ids: List[int], confirmada: bool) -> None:
+        marcas = ",".join("?" * len(ids))
+        with self._lock:
+            if confirmada:
+                # También revive una descartada: su transacción sí se confirmó
+                self._db().execute(f"UPDATE cola_trt SET estado = {CONFIRMADA} WHERE id IN ({marcas})", ids)
+            else:
+                self._db().execute(f"DELETE FROM cola_trt WHERE id IN ({marcas})", ids)
+
+    # --- Encolado (ruta de la solicitud) ---
+
+    async def diferir(self, db: AsyncSession, filas: List[dict]) -> bool:
+        """
+        Difiere la inserción en trt_tranin de 'filas' (parámetros de TranInLine):
+        las anota en el diario y registra su token en la transacción de la
+        solicitud. False = insertarlas ahora.
+        """
+        if not settings.HISTORIAL_DIFERIDO:
+            return False
+        uow = fobtiene_uow(db)
+        if not uow.activa:
+            return False
+        if self._pendientes + len(filas) > settings.HISTORIAL_COLA_MAX:
+            self.sincronas += len(filas)
+            return False
+
+        token = secrets.token_hex(16)
+        textos = [fjson_bytes(fila).decode("utf-8") for fila in filas]
+        try:
+            ids = await asyncio.to_thread(self._anotar, token, textos)
+        except sqlite3.Error as e:
+            self._registra_error("diario no disponible", e)
+            self.sincronas += len(filas)
+            return False
+
+        self._pendientes += len(ids)
+        self.encoladas += len(ids)
+        uow.al_confirmar(lambda: self._marcar_en_hilo(ids, confirmada=True))
+        uow.al_deshacer(lambda: self._marcar_en_hilo(ids, confirmada=False))
+        await db.execute(INSERTA_TOKEN_QUERY, {'token': token})
+        return True
+
+    def _marcar_en_hilo(self, ids: List[int], confirmada: bool) -> None:
+        """Acción de COMMIT/ROLLBACK: marca las filas en un hilo sin esperar."""
+        if not confirmada:
+            self._pendientes -= len(ids)
+        tarea = asyncio.get_running_loop().create_task(self._marcar_async(ids, confirmada))
+        self._marcas.add(tarea)
+        tarea.add_done_callback(self._marcas.discard)
+
+    async def _marcar_async(self, ids: List[int], confirmada: bool) -> None:
+        try:
+            await asyncio.to_thread(self._marcar, ids, confirmada)
+        except sqlite3.Error as e:
+            # Quedan pendientes: el vaciador las resuelve pasado el plazo
+            self._registra_error("no se pudo marcar", e)
+
+    # --- Vaciado (tarea de fondo) ---
+
+    def _tomar_turno(self) -> bool:
+        if self._turno is not None:
+            return True
+        archivo = open(f"{self.ruta}.vaciado", "a")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._turno = archivo
+        logger.info(f"Historial diferido: este worker (pid {os.getpid()}) vacía {self.ruta}")
+        return True
+
+    def _soltar_turno(self) -> None:
+        if self._turno is not None:
+            self._turno.close()     # cerrar el archivo libera el flock
+            self._turno = None
+
+    def _leer_lote(self, limite: int) -> List[Tuple[int, str, str]]:
+        """Hasta 'limite' filas confirmadas, completando las del último token (un token no se parte entre lotes)."""
+        with self._lock:
+            db = self._db()
+            lote = db.execute(
+                f"SELECT id, token, fila FROM cola_trt WHERE estado = {CONFIRMADA} ORDER BY id LIMIT ?", (limite,)
+            ).fetchall()
+            if lote:
+                ultimo_id, ultimo_token, _ = lote[-1]
+                lote += db.execute(
+                    f"SELECT id, token, fila FROM cola_trt WHERE estado = {CONFIRMADA} AND token = ? AND id > ? "
+                    f"ORDER BY id", (ultimo_token, ultimo_id)
+                ).fetchall()
+            return lote
+
+    def _borrar(self, ids: List[int]) -> None:
+        with self._lock:
+            self._db().executemany("DELETE FROM cola_trt WHERE id = ?", [(id_,) for id_ in ids])
+
+    def _leer_vencidas(self, limite: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._db().execute(
+                f"SELECT id, token FROM cola_trt WHERE estado = {PENDIENTE} AND encolado < ? ORDER BY id LIMIT ?",
+                (time.time() - PLAZO_PENDIENTE_SEGUNDOS, limite)
+            ).fetchall()
+
+    def _resolver(self, confirmadas: List[int], descartadas: List[int]) -> None:
+        with self._lock:
+            db = self._db()
+            for estado, ids in ((CONFIRMADA, confirmadas), (DESCARTADA, descartadas)):
+                db.executemany(
+                    f"UPDATE cola_trt SET estado = {estado} WHERE id = ? AND estado = {PENDIENTE}",
+                    [(id_,) for id_ in ids]
+                )
+            db.execute(
+                f"DELETE FROM cola_trt WHERE estado = {DESCARTADA} AND encolado < ?",
+                (time.time() - PLAZO_DESCARTADA_SEGUNDOS,)
+            )
+
+    async def resolver_pendientes(self) -> int:
+        """
+        Pendientes vencidas (worker caído antes de marcarlas): se confirman si
+        su token está en hdt_tokens y se descartan si no. Devuelve cuántas resolvió.
+        """
+        vencidas = await asyncio.to_thread(self._leer_vencidas, settings.HISTORIAL_LOTE)
+        if not vencidas:
+            return 0
+        tokens = sorted({token for _, token in vencidas})
+        async with AsyncSessionLocal() as db:
+            existen = set((await db.execute(EXISTEN_TOKENS_QUERY, {'tokens': tokens})).scalars())
+        confirmadas, descartadas = [], []
+        for id_, token in vencidas:
+            (confirmadas if token in existen else descartadas).append(id_)
+        await asyncio.to_thread(self._resolver, confirmadas, descartadas)
+        self.recuperadas += len(confirmadas)
+        self.descartadas += len(descartadas)
+        self._pendientes -= len(descartadas)
+        logger.warning(
+            f"Historial diferido: {len(confirmadas)} pendientes vencidas confirmadas "
+            f"y {len(descartadas)} descartadas (sin token en hdt_tokens)"
+        )
+        return len(vencidas)
+
+    async def vaciar_lote(self) -> int:
+        """
+        Inserta en trt_tranin el lote confirmado más antiguo del diario y lo borra.
+        Solo inserta las filas de los tokens que reclama en la misma transacción:
+        un lote ya insertado (caída antes de borrarlo del diario) no se repite.
+        Devuelve las filas vaciadas.
+        """
+        from app.services.transac_service import INSERT_TRT_BULK
+
+        lote = await asyncio.to_thread(self._leer_lote, settings.HISTORIAL_LOTE)
+        if not lote:
+            return 0
+        tokens = sorted({token for _, token, _ in lote})
+        async with AsyncSessionLocal() as db:
+            reclamados = set((await db.execute(RECLAMA_TOKENS_QUERY, {'tokens': tokens})).scalars())
+            params = [
+                TranInLine.model_validate_json(fila).model_dump()
+                for _, token, fila in lote if token in reclamados
+            ]
+            if params:
+                await db.execute(INSERT_TRT_BULK, params)
+            await db.commit()
+        if len(params) < len(lote):
+            logger.warning(f"Historial diferido: {len(lote) - len(params)} filas ya vaciadas se omiten")
+        await asyncio.to_thread(self._borrar, [id_ for id_, _, _ in lote])
+        self._pendientes -= len(lote)
+        self.vaciadas += len(lote)
+        self.lotes += 1
+        return len(lote)
+
+    async def _actualiza_conteo(self) -> None:
+        """Conteo del diario (de todos los workers) para la contrapresión y las estadísticas."""
+        try:
+            self._pendientes, self._mas_antigua = await asyncio.to_thread(self._contar)
+        except sqlite3.Error as e:
+            self._registra_error("conteo del diario", e)
+
+    async def ciclo_vaciado(self) -> None:
+        """
+        Tarea de fondo de cada worker: actualiza el conteo del diario y, si tiene
+        el turno, resuelve pendientes vencidas y vacía mientras haya filas
+        confirmadas; espera HISTORIAL_INTERVALO_MS si no hay.
+        """
+        try:
+            while True:
+                await self._actualiza_conteo()
+                if not self._tomar_turno():
+                    await asyncio.sleep(ESPERA_TURNO_SEGUNDOS)
+                    continue
+                try:
+                    await self.resolver_pendientes()
+                    vaciadas = await self.vaciar_lote()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._registra_error("vaciado fallido", e)
+                    await asyncio.sleep(ESPERA_TURNO_SEGUNDOS)
+                    continue
+                if vaciadas < settings.HISTORIAL_LOTE:
+                    await asyncio.sleep(settings.HISTORIAL_INTERVALO_MS / 1000)
+        finally:
+            self._soltar_turno()
+
+    async def _vaciar_todo(self) -> None:
+        while await self.vaciar_lote():
+            pass
+
+    async def cerrar(self) -> None:
+        """Al apagar: espera las marcas en curso y hace un último vaciado (acotado) si este worker tiene el turno."""
+        if self._marcas:
+            await asyncio.gather(*self._marcas, return_exceptions=True)
+        if not self._tomar_turno():
+            return
+        try:
+            await asyncio.wait_for(self._vaciar_todo(), ESPERA_CIERRE_SEGUNDOS)
+        except Exception as e:
+            self._registra_error("vaciado al cerrar", e)
+        finally:
+            self._soltar_turno()
+
+    def _registra_error(self, contexto: str, e: BaseException) -> None:
+        self.errores += 1
+        self.ultimo_error = f"{contexto}: {e}"
+        logger.error(f"Historial diferido: {contexto}: {e}")
+
+    def estadisticas(self) -> dict:
+        """Sin consultar el diario: el conteo es el de la última vuelta del vaciador."""
+        return {
+            "activo": settings.HISTORIAL_DIFERIDO,
+            "diario": self.ruta,
+            "vaciador": self._turno is not None,
+            "pendientes": max(self._pendientes, 0),
+            "retraso_s": round(time.time() - self._mas_antigua, 3) if self._mas_antigua else 0.0,
+            "encoladas": self.encoladas,
+            "sincronas": self.sincronas,
+            "vaciadas": self.vaciadas,
+            "recuperadas": self.recuperadas,
+            "descartadas": self.descartadas,
+            "lotes": self.lotes,
+            "errores": self.errores,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+historial_diferido = HistorialDiferido(settings.HISTORIAL_COLA_RUTA)
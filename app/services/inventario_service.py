@@ -1,11 +1,16 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text
 from app.utils.api_helpers import raise_api_error
 from fastapi import status
-from typing import Literal, Optional, Tuple
+from typing import Dict, List, Literal, Optional, Tuple
 from decimal import Decimal, ROUND_HALF_UP, getcontext
+from functools import lru_cache
 
 from app.models.pos_models import InvProResult 
+from app.services.receta_service import receta_cache
+from app.core.config import settings
+from app.db.unidad_trabajo import fobtiene_uow
+from app.core.instrumentacion import fmide_bloqueo
 
 # Configuración de precisión decimal alta
 getcontext().prec = 28 
@@ -21,9 +26,59 @@ def get_costos_config():
     """Simula la carga de configuración de costos (grconcos)."""
     return CostosConfig()
 
+@lru_cache(maxsize=None)
+def fcuantizador(precision: int) -> Decimal:
+    """Decimal de referencia para quantize (0.01 para 2 decimales), construido una sola vez."""
+    return Decimal(f'0.{"0" * precision}')
+
 def round_decimal(value: Decimal, precision: int = 2) -> Decimal:
     """Redondeo para manejar precisión financiera (simulando ROUND1)."""
-    return value.quantize(Decimal(f'0.{"0" * precision}'), rounding=ROUND_HALF_UP)
+    return value.quantize(fcuantizador(precision), rounding=ROUND_HALF_UP)
+
+
+def fcalcula_costo(
+    lxcanact: Decimal,
+    lxcosact: Decimal,
+    lxcosest: Decimal,
+    lxcannue: Decimal,
+    lxmodulo: int,
+    lxpar: Literal['A', 'E'] = 'A',
+    licalcos: Literal['S', 'N'] = 'S',
+    config: Optional[CostosConfig] = None
+) -> Tuple[Decimal, Decimal]:
+    """
+    Cálculo de finvpro sin acceso a la BD (pasos 4 a 6).
+    Lo usan finvpro_service y, como referencia, el motor por lotes de costeo_service.
+
+    Returns:
+        (lxcosnue redondeado, nueva cantidad de inventario)
+    """
+    config = config or get_costos_config()
+    nueva_cantidad_total = lxcanact + (lxcannue * lxmodulo)
+
+    # 4. Aplicar Reglas de Costos (Grconcos)
+    lxcosnue = lxcosact 
+    lxcosnue_input = Decimal('0.00') 
+
+    if config.COP_TCOS_TIPO_S == "S":
+        lxcosnue = lxcosest
+    elif config.COP_ICOC_USA_ESTIMADO == "S" and lxcanact == Decimal('0.00'):
+        lxcosnue = lxcosest
+
+    # 5. Cálculo del Nuevo Costo Promedio (solo si licalcos = 'S')
+    if licalcos == 'S':
+        if lxpar == 'A': 
+            if nueva_cantidad_total > Decimal('0.00'):
+                lxcosnue = ((lxcosact * lxcanact) + (lxcosnue_input * lxcannue)) / (lxcanact + lxcannue)
+            else:
+                lxcosnue = lxcosact
+
+
+    # 6. Validación final y Redondeo (ROUND1)
+    if lxcosnue is None or lxcosnue < 0:
+        lxcosnue = Decimal('0.00')
+    
+    return round_decimal(lxcosnue), nueva_cantidad_total
 
 
 async def finvpro_service(
@@ -31,7 +86,7 @@ async def finvpro_service(
     lxcannue: Decimal,
     lxmodulo: int,       # -1 para Salida (Venta/Consumo), 1 para Entrada (Compra/Ajuste)
     rgp_calm: int,       # Código de almacén (grgenera.rgp_calm)
-    db: Session,
+    db: AsyncSession,
     lxpar: Literal['A', 'E'] = 'A', # A=Adicionando, E=Eliminando
     licalcos: Literal['S', 'N'] = 'S' # S=Sí calcula/actualiza costo promedio
 ) -> InvProResult:
@@ -51,7 +106,8 @@ async def finvpro_service(
             WHERE ppp_calm = :rgp_calm AND ppp_cpro = :lxcpro
             FOR UPDATE
         """)
-        inv_result = db.execute(inv_query, {'rgp_calm': rgp_calm, 'lxcpro': lxcpro}).fetchone()
+        with fmide_bloqueo("finvpro"):
+            inv_result = (await db.execute(inv_query, {'rgp_calm': rgp_calm, 'lxcpro': lxcpro})).fetchone()
         
         # 2. Inicialización y conversión de Decimal (LECTURA SEGURA DE LA BD)
         if inv_result is None:
@@ -71,33 +127,13 @@ async def finvpro_service(
             FROM cop_costos
             WHERE cop_calm = :rgp_calm AND cop_cpro = :lxcpro
         """)
-        costo_est_result = db.execute(costo_est_query, {'rgp_calm': rgp_calm, 'lxcpro': lxcpro}).scalar_one_or_none()
+        costo_est_result = (await db.execute(costo_est_query, {'rgp_calm': rgp_calm, 'lxcpro': lxcpro})).scalar_one_or_none()
         lxcosest = Decimal(str(costo_est_result)) if costo_est_result is not None else Decimal('0.00')
 
-        # 4. Aplicar Reglas de Costos (Grconcos)
-        lxcosnue = lxcosact 
-        lxcosnue_input = Decimal('0.00') 
-
-        if config.COP_TCOS_TIPO_S == "S":
-            lxcosnue = lxcosest
-        elif config.COP_ICOC_USA_ESTIMADO == "S" and lxcanact == Decimal('0.00'):
-            lxcosnue = lxcosest
-
-        # 5. Cálculo del Nuevo Costo Promedio (solo si licalcos = 'S')
-        if licalcos == 'S':
-            if lxpar == 'A': 
-                nueva_cantidad_total = lxcanact + (lxcannue * lxmodulo)
-                if nueva_cantidad_total > Decimal('0.00'):
-                    lxcosnue = ((lxcosact * lxcanact) + (lxcosnue_input * lxcannue)) / (lxcanact + lxcannue)
-                else:
-                    lxcosnue = lxcosact
-
-
-        # 6. Validación final y Redondeo (ROUND1)
-        if lxcosnue is None or lxcosnue < 0:
-            lxcosnue = Decimal('0.00')
-        
-        lxcosnue = round_decimal(lxcosnue)
+        # 4 a 6. Reglas de costos, costo promedio y redondeo (ROUND1)
+        lxcosnue, _ = fcalcula_costo(
+            lxcanact, lxcosact, lxcosest, lxcannue, lxmodulo, lxpar, licalcos, config
+        )
         
         # 7. Actualización de la BD (UPDATE ppp_propvt)
         update_query = text("""
@@ -109,13 +145,13 @@ async def finvpro_service(
         
         cantidad_modificada = lxcannue * lxmodulo 
         
-        db.execute(update_query, {
+        await db.execute(update_query, {
             'cantidad_modificada': cantidad_modificada,
             'lxcosnue': lxcosnue,
             'rgp_calm': rgp_calm,
             'lxcpro': lxcpro
         })
-        
+
         # OJO: SIN db.commit() AQUÍ. Lo hace la función superior
         
         # Devolver el resultado
@@ -127,96 +163,210 @@ async def finvpro_service(
         raise e 
 
 
-async def fdesglos_recursive(
-    db: Session,
+# --- Desglose masivo (explosión de la receta completa en una sola consulta) ---
+
+# Profundidad máxima de anidación de recetas (inp_itpr = 21). Si se alcanza,
+# la receta es cíclica o está mal definida en fop_compro.
+MAX_NIVEL_RECETA = 32
+
+# Consulta recursiva que resuelve toda la lista de materiales (fop_compro) y
+# devuelve la cantidad total por ingrediente hoja, ya multiplicada por licantid.
+# Los componentes con fop_icom = 'S' se omiten en cualquier nivel si lxincsum = 'N',
+# igual que el 'continue' de fdesglos en 4GL.
+DESGLOSE_QUERY = text("""
+    WITH RECURSIVE desglose (fop_cfor, cantidad, inp_itpr, nivel) AS (
+        SELECT T1.fop_cfor, CAST(:licantid AS NUMERIC) * T1.fop_qfor, T2.inp_itpr, 1
+        FROM fop_compro AS T1
+        JOIN inp_produc AS T2 ON T1.fop_cfor = T2.inp_cpro
+        WHERE T1.fop_cpro = :lxcpro AND T1.fop_tven = :lxtven
+        AND (:lxincsum = 'S' OR COALESCE(T1.fop_icom, '') <> 'S')
+      UNION ALL
+        SELECT T1.fop_cfor, D.cantidad * T1.fop_qfor, T2.inp_itpr, D.nivel + 1
+        FROM desglose AS D
+        JOIN fop_compro AS T1 ON T1.fop_cpro = D.fop_cfor AND T1.fop_tven = :lxtven
+        JOIN inp_produc AS T2 ON T1.fop_cfor = T2.inp_cpro
+        WHERE D.inp_itpr = 21 AND D.nivel < :max_nivel
+        AND (:lxincsum = 'S' OR COALESCE(T1.fop_icom, '') <> 'S')
+    )
+    SELECT fop_cfor, SUM(cantidad) AS cantidad,
+           MAX(CASE WHEN inp_itpr = 21 THEN nivel ELSE 0 END) AS nivel_receta
+    FROM desglose
+    GROUP BY fop_cfor, inp_itpr
+""")
+
+# Costo estimado (cop_costos) de todos los ingredientes en una sola lectura.
+COSTOS_ESTIMADOS_QUERY = text("""
+    SELECT cop_cpro, cop_vcos
+    FROM cop_costos
+    WHERE cop_calm = :rgp_calm AND cop_cpro = ANY(CAST(:productos AS INTEGER[]))
+""")
+
+# Bloqueo de todas las filas de inventario afectadas, en orden de ppp_cpro.
+BLOQUEO_INVENTARIO_QUERY = text("""
+    SELECT ppp_cpro, ppp_qinv, ppp_vcos, ppp_tippro
+    FROM ppp_propvt
+    WHERE ppp_calm = :rgp_calm AND ppp_cpro = ANY(CAST(:productos AS INTEGER[]))
+    ORDER BY ppp_cpro
+    FOR UPDATE
+""")
+
+# Descuento de inventario y costo de todos los ingredientes en un solo UPDATE.
+ACTUALIZA_INVENTARIO_QUERY = text("""
+    UPDATE ppp_propvt AS P
+    SET ppp_qinv = P.ppp_qinv + V.cantidad_modificada,
+        ppp_vcos = V.lxcosnue
+    FROM (
+        SELECT UNNEST(CAST(:productos AS INTEGER[])) AS ppp_cpro,
+               UNNEST(CAST(:cantidades AS NUMERIC[])) AS cantidad_modificada,
+               UNNEST(CAST(:costos AS NUMERIC[])) AS lxcosnue
+    ) AS V
+    WHERE P.ppp_calm = :rgp_calm AND P.ppp_cpro = V.ppp_cpro
+""")
+
+
+async def fexplota_receta(
+    db: AsyncSession,
     lxcpro: int,
     licantid: Decimal,
     lxtven: int,
-    lxincsum: Literal['S', 'N'],
+    lxincsum: Literal['S', 'N'] = 'S'
+) -> Dict[int, Decimal]:
+    """
+    Resuelve la receta completa de lxcpro desde la caché de recetas compiladas
+    (o en una sola consulta recursiva si la caché está desactivada).
+    Devuelve la cantidad total a mover por ingrediente hoja {fop_cfor: cantidad}.
+    """
+    if settings.RECETAS_CACHE_TTL > 0:
+        receta = await receta_cache.obtener(db, lxcpro, lxtven)
+        return receta.cantidades(licantid, lxincsum)
+
+    filas = (await db.execute(DESGLOSE_QUERY, {
+        'lxcpro': lxcpro,
+        'licantid': licantid,
+        'lxtven': lxtven,
+        'lxincsum': lxincsum,
+        'max_nivel': MAX_NIVEL_RECETA
+    })).fetchall()
+
+    cantidades: Dict[int, Decimal] = {}
+    for row in filas:
+        if row.nivel_receta:
+            # Sub-receta: solo verificamos que no se haya cortado por profundidad
+            if row.nivel_receta >= MAX_NIVEL_RECETA:
+                raise_api_error(
+                    f"La receta del producto {lxcpro} es cíclica o supera {MAX_NIVEL_RECETA} niveles.",
+                    status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            continue
+        cantidades[row.fop_cfor] = Decimal(str(row.cantidad))
+
+    return cantidades
+
+
+async def fcostos_desglose(
+    db: AsyncSession,
     rgp_calm: int,
-    # Variables de salida para costos (lxcospro1, 2, 3)
-    costo_totales: Optional[Tuple[Decimal, Decimal, Decimal]] = None 
-) -> Tuple[Decimal, Decimal, Decimal]:
+    productos: List[int]
+) -> Dict[int, InvProResult]:
     """
-    Migración de FUNCTION fdesglos() - Lógica recursiva de desglose de recetas.
+    Bloquea (FOR UPDATE, en orden de ppp_cpro) las filas de inventario de los
+    ingredientes y obtiene su costo según las reglas de finvpro con licalcos = 'N'.
+    Devuelve {ppp_cpro: InvProResult}.
     """
+    productos = sorted(productos)
 
-    if costo_totales is None:
-        costo_totales = (Decimal('0.00'), Decimal('0.00'), Decimal('0.00'))
-    
-    lxcospro1, lxcospro2, lxcospro3 = costo_totales
+    with fmide_bloqueo("desglose"):
+        bloqueo_result = await db.execute(BLOQUEO_INVENTARIO_QUERY, {'rgp_calm': rgp_calm, 'productos': productos})
+    inventario = {row.ppp_cpro: row for row in bloqueo_result}
 
-    # 1. Obtener Componentes de la Receta
-    query_componentes = text("""
-        SELECT fop_cfor, fop_qfor, fop_icom, T2.inp_itpr
-        FROM fop_compro AS T1
-        JOIN inp_produc AS T2 ON T1.fop_cfor = T2.inp_cpro
-        WHERE T1.fop_cpro = :lxcpro AND T1.fop_tven = :lxtven
-    """)
-    componentes_result = db.execute(query_componentes, {'lxcpro': lxcpro, 'lxtven': lxtven}).fetchall()
-    
-    if not componentes_result:
-        return costo_totales
-
-    # 2. Iterar sobre los Componentes
-    for row in componentes_result:
-        comp_cpro = row.fop_cfor
-        comp_qfor = Decimal(str(row.fop_qfor))
-        comp_icom = row.fop_icom
-        comp_itpr = row.inp_itpr 
-        
-        # Cantidad a mover (siempre debe ser Decimal)
-        cantidad_a_mover = licantid * comp_qfor
-        
-        if comp_icom == 'S' and lxincsum == 'N':
-            continue 
-
-        # Condición de Recursión (Receta dentro de Receta)
-        if comp_itpr == 21:
-            costos_recursivos = await fdesglos_recursive(
-                db=db,
-                lxcpro=comp_cpro,
-                licantid=cantidad_a_mover, 
-                lxtven=lxtven,
-                lxincsum=lxincsum,
-                rgp_calm=rgp_calm,
-                costo_totales=costo_totales 
-            )
-            lxcospro1 += costos_recursivos[0]
-            lxcospro2 += costos_recursivos[1]
-            lxcospro3 += costos_recursivos[2]
-            
+    costos_result = await db.execute(COSTOS_ESTIMADOS_QUERY, {'rgp_calm': rgp_calm, 'productos': productos})
+    costos_estimados = {row.cop_cpro: row.cop_vcos for row in costos_result}
+
+    config = get_costos_config()
+    resultado: Dict[int, InvProResult] = {}
+    for lxcpro in productos:
+        inv_row = inventario.get(lxcpro)
+        if inv_row is None:
+            lxcanact = Decimal('0.00')
+            lxcosact = Decimal('0.00')
+            lxtippro = 1
         else:
-            # Lógica de Actualización de Inventario (finvpro)
-            finvpro_result = await finvpro_service(
-                lxcpro=comp_cpro,
-                lxcannue=cantidad_a_mover,
-                lxmodulo=-1, 
-                rgp_calm=rgp_calm,
-                db=db,
-                lxpar='E', 
-                licalcos='N'
-            )
-            
-            # 4. Acumulación de Costos (¡El arreglo del costo cero!)
-            # FORZAMOS LA CONVERSIÓN A DECIMAL ANTES DE LA SUMA
-            lxcospro = finvpro_result.lxcosnue * cantidad_a_mover
-            
-            # Acumulación por Tipo de Producto (lxtippro)
-            match finvpro_result.lxtippro:
-                case 1: # Materia Prima (lxcospro1)
-                    lxcospro1 += lxcospro
-                case 2: # Suministro (lxcospro2)
-                    lxcospro2 += lxcospro
-                case 3: # Mano de Obra (lxcospro3)
-                    lxcospro3 += lxcospro
-    
-    # 5. Devolver Costos Totales de esta rama
+            lxcanact = Decimal(str(inv_row.ppp_qinv)) if inv_row.ppp_qinv is not None else Decimal('0.00')
+            lxcosact = Decimal(str(inv_row.ppp_vcos)) if inv_row.ppp_vcos is not None else Decimal('0.00')
+            lxtippro = inv_row.ppp_tippro
+
+        costo_est = costos_estimados.get(lxcpro)
+        lxcosest = Decimal(str(costo_est)) if costo_est is not None else Decimal('0.00')
+
+        # Mismas reglas de grconcos que finvpro (salida con licalcos = 'N':
+        # el costo no depende de la cantidad movida)
+        lxcosnue, _ = fcalcula_costo(
+            lxcanact, lxcosact, lxcosest, Decimal('0.00'), -1, lxpar='E', licalcos='N', config=config
+        )
+        resultado[lxcpro] = InvProResult(lxcosnue=lxcosnue, lxtippro=lxtippro)
+    return resultado
+
+
+async def factualiza_desglose(
+    db: AsyncSession,
+    rgp_calm: int,
+    cantidades: Dict[int, Decimal],
+    costos: Dict[int, InvProResult]
+) -> None:
+    """Aplica la salida de inventario de todos los ingredientes en un solo UPDATE."""
+    productos = sorted(cantidades)
+    await db.execute(ACTUALIZA_INVENTARIO_QUERY, {
+        'rgp_calm': rgp_calm,
+        'productos': productos,
+        'cantidades': [-cantidades[lxcpro] for lxcpro in productos],
+        'costos': [costos[lxcpro].lxcosnue for lxcpro in productos]
+    })
+
+
+def fsuma_costos(
+    cantidades: Dict[int, Decimal],
+    costos: Dict[int, InvProResult]
+) -> Tuple[Decimal, Decimal, Decimal]:
+    """Acumula el costo por tipo de producto (lxcospro1, 2, 3) como fdesglos en 4GL."""
+    lxcospro1, lxcospro2, lxcospro3 = Decimal('0.00'), Decimal('0.00'), Decimal('0.00')
+
+    for lxcpro, cantidad in cantidades.items():
+        lxcospro = costos[lxcpro].lxcosnue * cantidad
+        match costos[lxcpro].lxtippro:
+            case 1: # Materia Prima (lxcospro1)
+                lxcospro1 += lxcospro
+            case 2: # Suministro (lxcospro2)
+                lxcospro2 += lxcospro
+            case 3: # Mano de Obra (lxcospro3)
+                lxcospro3 += lxcospro
+
     return (lxcospro1, lxcospro2, lxcospro3)
 
 
+async def fdesglos_masivo(
+    db: AsyncSession,
+    lxcpro: int,
+    licantid: Decimal,
+    lxtven: int,
+    lxincsum: Literal['S', 'N'],
+    rgp_calm: int
+) -> Tuple[Decimal, Decimal, Decimal]:
+    """
+    Migración de FUNCTION fdesglos() con un número constante de sentencias:
+    explosión recursiva, bloqueo, lectura de costos y un único UPDATE.
+    """
+    cantidades = await fexplota_receta(db, lxcpro, licantid, lxtven, lxincsum)
+    if not cantidades:
+        return (Decimal('0.00'), Decimal('0.00'), Decimal('0.00'))
+
+    costos = await fcostos_desglose(db, rgp_calm, list(cantidades))
+    await factualiza_desglose(db, rgp_calm, cantidades, costos)
+
+    return fsuma_costos(cantidades, costos)
+
+
 async def fdesglos_service(
-    db: Session,
+    db: AsyncSession,
     lxcpro: int,
     licantid: Decimal,
     lxtven: int,
@@ -225,15 +375,14 @@ async def fdesglos_service(
 ) -> Tuple[Decimal, Decimal, Decimal]:
     """
     Función de entrada para el desglose de recetas (simula la llamada inicial a fdesglos).
-    CONTIENE LA TRANSACCIÓN ÚNICA (db.begin() / db.commit()).
+    CONTIENE LA TRANSACCIÓN ÚNICA: COMMIT si todo es exitoso, ROLLBACK si algo falla.
+    Las filas de ppp_propvt se bloquean en orden de ppp_cpro en una sola sentencia,
+    y si la BD aborta por deadlock/serialización se repite toda la transacción.
     """
-    
-    try:
-        # INICIO DE LA TRANSACCIÓN ÚNICA (BEGIN WORK)
-        db.begin()
-        
-        # Llamamos a la función recursiva
-        costos = await fdesglos_recursive(
+
+    async def unidad():
+        # Desglose masivo (misma salida que el fdesglos recursivo de 4GL)
+        return await fdesglos_masivo(
             db=db,
             lxcpro=lxcpro,
             licantid=licantid,
@@ -242,12 +391,5 @@ async def fdesglos_service(
             rgp_calm=rgp_calm
         )
 
-        # COMMIT DE LA TRANSACCIÓN (COMMIT WORK) si todo es exitoso
-        db.commit()
-        return costos
-        
-    except Exception as e:
-        # ROLLBACK si algo falla en la recursión o el finvpro anidado
-        db.rollback()
-        # Esto lanzará el error 500 que vemos en el navegador
-        raise e
\ No newline at end of file
+    # Si algo falla, esto lanzará el error 500 que vemos en el navegador
+    return await fobtiene_uow(db).ejecutar(unidad, "fdesglos")
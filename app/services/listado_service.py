@@ -0,0 +1,393 @@
+from pydantic import BaseModel, ConfigDict, model_validator
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+from sqlalchemy.sql.elements import TextClause
+from app.utils.api_helpers import raise_api_error
+from app.services.catalogo_service import CatalogoAlmacen, catalogo_cache
+from app.core.config import settings
+from fastapi import status
+from functools import lru_cache
+from typing import Any, Literal, NamedTuple, Optional
+import base64
+import bisect
+import binascii
+import json
+import math
+
+# Estrategias de búsqueda sobre search_field
+#   contiene: ILIKE '%term%' (la original; usa índice trigram si existe)
+#   prefijo:  ILIKE 'term%'  (usa índice btree con text_pattern_ops)
+#   trigrama: operador % de pg_trgm (similitud, tolera errores de digitación)
+EstrategiaBusqueda = Literal['contiene', 'prefijo', 'trigrama']
+
+# Tipo de las columnas de orden (valida los valores que vuelven en los cursores)
+TipoColumna = Literal['int', 'str']
+
+
+class ListaDef(BaseModel):
+    """
+    Definición de un listado (equivalente a 'listsetup' de list.4gl).
+    Los nombres de tablas/columnas se interpolan en el SQL: solo se definen
+    aquí, nunca a partir de datos de la solicitud.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    nombre: str
+    tables: str
+    items: str                          # Debe incluir 'order', 'key' y las 'sort_keys'
+    search_field: str
+    order: str
+    key: Optional[str] = None           # Columna única de desempate (por defecto 'order')
+    base_filter: str = "1=1"
+    search_strategy: EstrategiaBusqueda = 'contiene'
+    sort_keys: tuple[str, ...] = ()     # Columnas de orden adicionales permitidas
+    column_types: dict[str, TipoColumna] = {}  # Tipo de 'order', 'key' y cada 'sort_keys'
+    # Se sirve desde el catálogo en memoria de este almacén (ver CatalogoCache):
+    # cambios de descripción y altas/bajas tardan hasta CATALOGO_REFRESCO_SEGUNDOS en verse
+    catalogo_almacen: Optional[int] = None
+
+    @model_validator(mode='after')
+    def _tipos_de_orden(self) -> "ListaDef":
+        faltan = {self.order, self.key or self.order, *self.sort_keys} - set(self.column_types)
+        if faltan:
+            raise ValueError(f"Listado '{self.nombre}': falta el tipo de {sorted(faltan)} en column_types")
+        return self
+
+
+# --- Registro de listados (se carga una sola vez al importar el módulo) ---
+
+LISTAS: dict[str, ListaDef] = {}
+
+def registrar_lista(lista: ListaDef) -> None:
+    """Agrega un listado al registro. Nuevas listas se registran aquí, sin tocar el endpoint."""
+    LISTAS[lista.nombre] = lista
+
+registrar_lista(ListaDef(
+    nombre="productos",
+    tables="ppp_propvt",
+    items="ppp_cpro, ppp_dpro", # (Asumimos que ppp_dpro es la descripción)
+    search_field="ppp_dpro",
+    order="ppp_cpro",
+    key="ppp_cpro",
+    base_filter="ppp_calm = 1", # (Ej: grgenera.rgp_calm)
+    sort_keys=("ppp_dpro",),
+    column_types={"ppp_cpro": "int", "ppp_dpro": "str"},
+    catalogo_almacen=1,
+))
+
+# (Puedes añadir más listas aquí)
+# registrar_lista(ListaDef(
+#     nombre="clientes",
+#     tables="clp_client",
+#     items="clp_ncli, clp_dnom",
+#     search_field="clp_dnom",
+#     order="clp_dnom",
+#     key="clp_ncli",
+#     column_types={"clp_dnom": "str", "clp_ncli": "int"},
+#     search_strategy="prefijo",
+# ))
+
+
+def fobtiene_lista(nombre: str) -> ListaDef:
+    lista = LISTAS.get(nombre)
+    if lista is None:
+        # Si la lista no está definida, devolvemos un error
+        raise_api_error(f"El listado '{nombre}' no está definido.", status.HTTP_404_NOT_FOUND)
+    return lista
+
+
+# --- Sentencias precompiladas por combinación de parámetros ---
+
+class SentenciasListado(NamedTuple):
+    conteo: TextClause
+    estimado: TextClause
+    pagina: TextClause       # LIMIT/OFFSET
+    primera: TextClause      # modo cursor, primera página
+    siguiente: TextClause    # modo cursor, WHERE (order, key) > (:cursor_key, :cursor_id)
+    siguiente_nulos: TextClause  # modo cursor, la última fila tenía 'order' NULL
+
+
+def ffiltro_busqueda(search_field: str, estrategia: EstrategiaBusqueda) -> str:
+    """Condición SQL de búsqueda según la estrategia (el valor va en :search)."""
+    match estrategia:
+        case 'trigrama':
+            return f"{search_field} % :search"
+        case _:
+            # Usamos ILIKE para búsquedas 'case-insensitive' en PostgreSQL;
+            # el término va escapado (fescapa_like): %, _ y \ son literales
+            return f"{search_field} ILIKE :search ESCAPE '\\'"
+
+
+def fescapa_like(texto: str) -> str:
+    """Escapa los comodines de LIKE para buscar el texto literal (como el catálogo en memoria)."""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def fvalor_busqueda(estrategia: EstrategiaBusqueda, search: str) -> str:
+    match estrategia:
+        case 'prefijo':
+            return f"{fescapa_like(search)}%"
+        case 'trigrama':
+            return search
+        case _:
+            return f"%{fescapa_like(search)}%"
+
+
+@lru_cache(maxsize=256)
+def fsentencias(
+    nombre: str,
+    con_busqueda: bool,
+    estrategia: EstrategiaBusqueda,
+    order: str
+) -> SentenciasListado:
+    """
+    Construye una sola vez las sentencias de conteo y de página para
+    (lista, con búsqueda, estrategia, orden). Cada solicitud solo enlaza parámetros.
+    """
+    lista = LISTAS[nombre]
+    key = lista.key or lista.order
+
+    sql_filter = lista.base_filter
+    if con_busqueda:
+        sql_filter += f" AND {ffiltro_busqueda(lista.search_field, estrategia)}"
+
+    # Si la columna de orden no es única, desempatamos por 'key'.
+    # PostgreSQL ordena los NULL de 'order' al final: después de una fila con
+    # valor siguen también las NULL, y después de una NULL solo las NULL con mayor 'key'.
+    if order == key:
+        order_by = order
+        keyset = f"{order} > :cursor_key"
+        keyset_nulos = "1=0"
+    else:
+        order_by = f"{order}, {key}"
+        keyset = f"(({order}, {key}) > (:cursor_key, :cursor_id) OR {order} IS NULL)"
+        keyset_nulos = f"{order} IS NULL AND {key} > :cursor_id"
+
+    select = f"SELECT {lista.items} FROM {lista.tables}"
+    return SentenciasListado(
+        conteo=text(f"SELECT COUNT(*) FROM {lista.tables} WHERE {sql_filter}"),
+        estimado=text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {lista.tables} WHERE {sql_filter}"),
+        pagina=text(f"{select} WHERE {sql_filter} ORDER BY {order_by} LIMIT :limit OFFSET :offset"),
+        primera=text(f"{select} WHERE {sql_filter} ORDER BY {order_by} LIMIT :limit"),
+        siguiente=text(f"{select} WHERE {sql_filter} AND {keyset} ORDER BY {order_by} LIMIT :limit"),
+        siguiente_nulos=text(f"{select} WHERE {sql_filter} AND {keyset_nulos} ORDER BY {order_by} LIMIT :limit"),
+    )
+
+
+def fcompila_listados() -> int:
+    """Precompila las sentencias más usadas de todas las listas (arranque)."""
+    for nombre, lista in LISTAS.items():
+        for con_busqueda in (False, True):
+            fsentencias(nombre, con_busqueda, lista.search_strategy, lista.order)
+    return len(LISTAS)
+
+
+# --- Paginación ---
+
+# Origen de las páginas: los cursores de la BD y los del catálogo en memoria no
+# son intercambiables (el orden de ppp_dpro en Python no es la intercalación de PostgreSQL)
+ORIGEN_BD = "bd"
+ORIGEN_CATALOGO = "catalogo"
+
+
+def fcodifica_cursor(orden: str, valor: Any, clave: Any = None, origen: str = ORIGEN_BD) -> str:
+    """Cursor opaco a partir del orden y los valores de orden (y desempate) de la última fila."""
+    return base64.urlsafe_b64encode(json.dumps({"r": orden, "f": origen, "o": valor, "k": clave}).encode()).decode()
+
+
+def fdecodifica_cursor(cursor: str, orden: str, origen: str = ORIGEN_BD) -> tuple[Any, Any]:
+    """(valor de orden, desempate) del cursor; 400 si está dañado o es de otro orden u origen."""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        valores = datos["o"], datos.get("k")
+        registrado = datos.get("r")
+        fuente = datos.get("f", ORIGEN_BD)
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise_api_error("El cursor de paginación no es válido.", status.HTTP_400_BAD_REQUEST)
+    if registrado != orden:
+        raise_api_error(
+            f"El cursor de paginación es de otro orden ('{registrado}'); pida de nuevo la primera página.",
+            status.HTTP_400_BAD_REQUEST
+        )
+    if fuente != origen:
+        raise_api_error(
+            "El cursor de paginación es de otra fuente de datos; pida de nuevo la primera página.",
+            status.HTTP_400_BAD_REQUEST
+        )
+    if any(isinstance(v, (list, dict)) for v in valores):
+        raise_api_error("El cursor de paginación no es válido.", status.HTTP_400_BAD_REQUEST)
+    return valores
+
+
+def fes_entero(valor: Any) -> bool:
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def fes_tipo(valor: Any, tipo: TipoColumna) -> bool:
+    return fes_entero(valor) if tipo == 'int' else isinstance(valor, str)
+
+
+def fvalida_cursor(lista: ListaDef, order: str, valor: Any, desempate: Any) -> None:
+    """
+    400 si los valores del cursor no son del tipo de sus columnas (column_types).
+    La columna de orden puede ser NULL si no es la clave; la clave nunca.
+    """
+    key = lista.key or lista.order
+    tipos = lista.column_types
+    if order == key:
+        valido = fes_tipo(valor, tipos[key])
+    else:
+        valido = (valor is None or fes_tipo(valor, tipos[order])) and fes_tipo(desempate, tipos[key])
+    if not valido:
+        raise_api_error("El cursor de paginación no es válido.", status.HTTP_400_BAD_REQUEST)
+
+
+async def flistado_service(
+    db: AsyncSession,
+    lista: ListaDef,
+    page: int,
+    limit: int,
+    search: Optional[str] = None,
+    modo: Literal['offset', 'cursor'] = 'offset',
+    cursor: Optional[str] = None,
+    conteo: Literal['exacto', 'estimado', 'ninguno'] = 'exacto',
+    estrategia: Optional[EstrategiaBusqueda] = None,
+    orden: Optional[str] = None
+) -> dict:
+    """
+    Lógica de 'listman' (búsqueda y paginación) sobre un listado registrado.
+    """
+    order = orden or lista.order
+    if order != lista.order and order not in lista.sort_keys:
+        raise_api_error(f"El listado '{lista.nombre}' no permite ordenar por '{order}'.", status.HTTP_400_BAD_REQUEST)
+
+    key = lista.key or lista.order
+    estrategia = estrategia or lista.search_strategy
+    sentencias = fsentencias(lista.nombre, bool(search), estrategia, order)
+
+    # Listas de productos: se sirven desde el catálogo en memoria (sin consultas a la BD)
+    if lista.catalogo_almacen is not None and settings.CATALOGO_CACHE and estrategia != 'trigrama':
+        catalogo = await catalogo_cache.obtener(db, lista.catalogo_almacen)
+        return fpagina_catalogo(lista, catalogo, page, limit, search, modo, cursor, conteo, estrategia, order)
+
+    # 1. PARÁMETROS (el filtro ya está en la sentencia)
+    params = {} # Parámetros seguros
+    if search:
+        params["search"] = fvalor_busqueda(estrategia, search)
+
+    # 2. CONTEO
+    total_rows = None
+    total_pages = None
+    if conteo == 'exacto':
+        total_rows = (await db.execute(sentencias.conteo, params)).scalar_one()
+    elif conteo == 'estimado':
+        # Conteo aproximado tomado del plan del optimizador, sin recorrer la tabla
+        plan = (await db.execute(sentencias.estimado, params)).scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        total_rows = int(plan[0]["Plan"]["Plan Rows"])
+    if total_rows is not None:
+        total_pages = math.ceil(total_rows / limit)
+
+    # 3. DATOS (Paginados)
+    next_cursor = None
+    if modo == 'cursor':
+        # Paginación por clave: sin OFFSET. Pedimos una fila extra para saber si hay siguiente.
+        params["limit"] = limit + 1
+        data_query = sentencias.primera
+        if cursor:
+            cursor_key, cursor_id = fdecodifica_cursor(cursor, order)
+            fvalida_cursor(lista, order, cursor_key, cursor_id)
+            if order == key:
+                params["cursor_key"] = cursor_key
+                data_query = sentencias.siguiente
+            elif cursor_key is None:
+                params["cursor_id"] = cursor_id
+                data_query = sentencias.siguiente_nulos
+            else:
+                params["cursor_key"], params["cursor_id"] = cursor_key, cursor_id
+                data_query = sentencias.siguiente
+
+        result_proxy = await db.execute(data_query, params)
+        columnas = tuple(result_proxy.keys())
+        items_list = [dict(zip(columnas, row)) for row in result_proxy]
+        if len(items_list) > limit:
+            items_list = items_list[:limit]
+            ultima = items_list[-1]
+            next_cursor = fcodifica_cursor(order, ultima[order], ultima[key] if order != key else None)
+    else:
+        params["limit"] = limit
+        params["offset"] = (page - 1) * limit
+        result_proxy = await db.execute(sentencias.pagina, params)
+
+        # Convertir resultados a JSON (lista de diccionarios)
+        columnas = tuple(result_proxy.keys())
+        items_list = [dict(zip(columnas, row)) for row in result_proxy]
+
+    return {
+        "total_rows": total_rows,
+        "total_pages": total_pages,
+        "current_page": page,
+        "items": items_list,
+        "next_cursor": next_cursor
+    }
+
+
+def fpagina_catalogo(
+    lista: ListaDef,
+    catalogo: CatalogoAlmacen,
+    page: int,
+    limit: int,
+    search: Optional[str],
+    modo: Literal['offset', 'cursor'],
+    cursor: Optional[str],
+    conteo: Literal['exacto', 'estimado', 'ninguno'],
+    estrategia: EstrategiaBusqueda,
+    order: str
+) -> dict:
+    """
+    Misma respuesta que flistado_service, calculada sobre el catálogo en memoria
+    (ppp_cpro, ppp_dpro). El orden por ppp_dpro es el de Python (por código de
+    carácter), no la intercalación de PostgreSQL, así que sus cursores no sirven
+    en la ruta SQL ni al revés (se rechazan con 400).
+    """
+    posiciones = catalogo.buscar(search, prefijo=estrategia == 'prefijo')
+
+    # Clave de orden de cada posición: ppp_cpro o (ppp_dpro, ppp_cpro)
+    if order == "ppp_dpro":
+        posiciones.sort(key=lambda i: catalogo.rango_dpro[i])
+        clave = catalogo.clave_dpro
+    else:
+        clave = lambda i: catalogo.codigos[i]
+
+    total_rows = len(posiciones) if conteo != 'ninguno' else None
+    total_pages = math.ceil(total_rows / limit) if total_rows is not None else None
+
+    next_cursor = None
+    if modo == 'cursor':
+        inicio = 0
+        if cursor:
+            valor, desempate = fdecodifica_cursor(cursor, order, ORIGEN_CATALOGO)
+            fvalida_cursor(lista, order, valor, desempate)
+            ultima = (valor is None, valor or "", desempate) if order == "ppp_dpro" else valor
+            inicio = bisect.bisect_right(posiciones, ultima, key=clave)
+        pagina = posiciones[inicio:inicio + limit]
+        if inicio + limit < len(posiciones):
+            i = pagina[-1]
+            if order == "ppp_dpro":
+                next_cursor = fcodifica_cursor(order, catalogo.descripciones[i], catalogo.codigos[i], ORIGEN_CATALOGO)
+            else:
+                next_cursor = fcodifica_cursor(order, catalogo.codigos[i], origen=ORIGEN_CATALOGO)
+    else:
+        offset = (page - 1) * limit
+        pagina = posiciones[offset:offset + limit]
+
+    return {
+        "total_rows": total_rows,
+        "total_pages": total_pages,
+        "current_page": page,
+        "items": [
+            {"ppp_cpro": catalogo.codigos[i], "ppp_dpro": catalogo.descripciones[i]} for i in pagina
+        ],
+        "next_cursor": next_cursor
+    }
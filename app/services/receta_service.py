@@ -0,0 +1,176 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+from app.utils.api_helpers import raise_api_error
+from app.core.config import settings
+from fastapi import status
+from typing import Dict, FrozenSet, List, Literal, Optional, Tuple
+from decimal import Decimal
+import threading
+import time
+
+# --- Caché de recetas compiladas (fop_compro + inp_produc.inp_itpr) ---
+
+# Carga todas las líneas de receta alcanzables desde lxcpro para un tipo de venta.
+# El CTE recorre solo los códigos de sub-receta (inp_itpr = 21) con UNION, así que
+# termina aunque la receta sea cíclica; el ciclo se detecta al compilar.
+ARISTAS_RECETA_QUERY = text("""
+    WITH RECURSIVE recetas (fop_cpro) AS (
+        SELECT CAST(:lxcpro AS INTEGER)
+      UNION
+        SELECT T1.fop_cfor
+        FROM recetas AS R
+        JOIN fop_compro AS T1 ON T1.fop_cpro = R.fop_cpro AND T1.fop_tven = :lxtven
+        JOIN inp_produc AS T2 ON T1.fop_cfor = T2.inp_cpro
+        WHERE T2.inp_itpr = 21
+    )
+    SELECT T1.fop_cpro, T1.fop_cfor, T1.fop_qfor, T1.fop_icom, T2.inp_itpr
+    FROM fop_compro AS T1
+    JOIN inp_produc AS T2 ON T1.fop_cfor = T2.inp_cpro
+    JOIN recetas AS R ON T1.fop_cpro = R.fop_cpro
+    WHERE T1.fop_tven = :lxtven
+""")
+
+
+class RecetaCompilada:
+    """
+    Receta aplanada por unidad vendida: cantidad por ingrediente hoja, separando
+    lo que se alcanza a través de un componente de suministro (fop_icom = 'S').
+    """
+
+    def __init__(self, hojas: Dict[Tuple[int, bool], Decimal], recetas: FrozenSet[int]):
+        # {(fop_cfor, via_suministro): cantidad por unidad}
+        self.hojas = hojas
+        # Códigos de receta/sub-receta usados (para invalidar en cascada)
+        self.recetas = recetas
+        # Códigos de los ingredientes hoja (fop_cfor)
+        self.ingredientes = frozenset(cfor for cfor, _ in hojas)
+        self.creada = time.monotonic()
+
+    def cantidades(self, licantid: Decimal, lxincsum: Literal['S', 'N'] = 'S') -> Dict[int, Decimal]:
+        """Devuelve {fop_cfor: cantidad a mover} para licantid unidades vendidas."""
+        resultado: Dict[int, Decimal] = {}
+        for (comp_cpro, via_suministro), cantidad in self.hojas.items():
+            if via_suministro and lxincsum == 'N':
+                continue
+            resultado[comp_cpro] = resultado.get(comp_cpro, Decimal('0')) + cantidad * licantid
+        return resultado
+
+
+def findexa_aristas(aristas: List) -> Dict[int, List]:
+    """Líneas de receta agrupadas por receta (fop_cpro)."""
+    componentes: Dict[int, List] = {}
+    for row in aristas:
+        componentes.setdefault(row.fop_cpro, []).append(row)
+    return componentes
+
+
+def fcompila_receta(lxcpro: int, aristas: List = (), componentes: Optional[Dict[int, List]] = None) -> RecetaCompilada:
+    """
+    Aplana el grafo de la receta de lxcpro (mismo recorrido que fdesglos en 4GL).
+    Recibe las líneas de receta o, si ya están indexadas, 'componentes'
+    (findexa_aristas). Lanza un error si encuentra un ciclo.
+    """
+    if componentes is None:
+        componentes = findexa_aristas(aristas)
+
+    memo: Dict[int, Dict[Tuple[int, bool], Decimal]] = {}
+    en_curso: List[int] = []
+
+    def aplanar(cpro: int) -> Dict[Tuple[int, bool], Decimal]:
+        if cpro in memo:
+            return memo[cpro]
+        if cpro in en_curso:
+            ciclo = " -> ".join(str(c) for c in en_curso[en_curso.index(cpro):] + [cpro])
+            raise_api_error(f"La receta del producto {lxcpro} es cíclica ({ciclo}).", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        en_curso.append(cpro)
+        hojas: Dict[Tuple[int, bool], Decimal] = {}
+        for row in componentes.get(cpro, []):
+            comp_qfor = Decimal(str(row.fop_qfor))
+            suministro = row.fop_icom == 'S'
+
+            if row.inp_itpr == 21:
+                for (hoja, via_suministro), cantidad in aplanar(row.fop_cfor).items():
+                    clave = (hoja, suministro or via_suministro)
+                    hojas[clave] = hojas.get(clave, Decimal('0')) + comp_qfor * cantidad
+            else:
+                clave = (row.fop_cfor, suministro)
+                hojas[clave] = hojas.get(clave, Decimal('0')) + comp_qfor
+        en_curso.pop()
+
+        memo[cpro] = hojas
+        return hojas
+
+    hojas = aplanar(lxcpro)
+    return RecetaCompilada(hojas=hojas, recetas=frozenset(memo))
+
+
+class RecetaCache:
+    """
+    Caché en memoria de recetas compiladas por (producto, fop_tven), con
+    expiración por TTL, invalidación explícita y contadores de aciertos/fallos.
+    """
+
+    def __init__(self, ttl_segundos: int):
+        self.ttl_segundos = ttl_segundos
+        self._recetas: Dict[Tuple[int, int], RecetaCompilada] = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expiradas = 0
+        self.invalidadas = 0
+
+    def _vigente(self, receta: RecetaCompilada) -> bool:
+        return time.monotonic() - receta.creada < self.ttl_segundos
+
+    async def obtener(self, db: AsyncSession, lxcpro: int, lxtven: int) -> RecetaCompilada:
+        clave = (lxcpro, lxtven)
+        with self._lock:
+            receta = self._recetas.get(clave)
+            if receta is not None:
+                if self._vigente(receta):
+                    self.aciertos += 1
+                    return receta
+                del self._recetas[clave]
+                self.expiradas += 1
+            self.fallos += 1
+
+        aristas = (await db.execute(ARISTAS_RECETA_QUERY, {'lxcpro': lxcpro, 'lxtven': lxtven})).fetchall()
+        receta = fcompila_receta(lxcpro, aristas)
+
+        with self._lock:
+            self._recetas[clave] = receta
+        return receta
+
+    def invalidar(self, lxcpro: Optional[int] = None, lxtven: Optional[int] = None) -> int:
+        """
+        Invalida las recetas que usan lxcpro (como producto, sub-receta o
+        ingrediente hoja) y/o el tipo de venta lxtven. Sin argumentos vacía la caché. Devuelve cuántas borró.
+        """
+        with self._lock:
+            claves = [
+                clave for clave, receta in self._recetas.items()
+                if (lxcpro is None or clave[0] == lxcpro or lxcpro in receta.recetas
+                    or lxcpro in receta.ingredientes)
+                and (lxtven is None or clave[1] == lxtven)
+            ]
+            for clave in claves:
+                del self._recetas[clave]
+            self.invalidadas += len(claves)
+        return len(claves)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._recetas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expiradas": self.expiradas,
+                "invalidadas": self.invalidadas,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "ttl_segundos": self.ttl_segundos,
+            }
+
+
+receta_cache = RecetaCache(ttl_segundos=settings.RECETAS_CACHE_TTL)
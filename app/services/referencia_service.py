@@ -0,0 +1,101 @@
+from sqlalchemy.sql import text
+from app.db.database import AsyncSessionLocal
+from app.utils.http_cache import invalidar_tablas
+from datetime import datetime
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Datos de referencia en memoria (tip_tipven, dep_descri) ---
+
+TIP_TIPVEN_QUERY = text("""
+    SELECT tip_tven, tip_clis
+    FROM tip_tipven
+""")
+
+DEP_DESCRI_QUERY = text("""
+    SELECT dep_tdes, dep_cdes
+    FROM dep_descri
+""")
+
+
+class ReferenciaSnapshot:
+    """Foto inmutable de las tablas de referencia; nunca se modifica después de creada."""
+
+    def __init__(self, version: int, tip_tipven: Mapping[int, Optional[int]], dep_descri: FrozenSet[Tuple[str, int]]):
+        self.version = version
+        self.cargado = datetime.now()
+        self.tip_tipven = tip_tipven    # {tip_tven: tip_clis}
+        self.dep_descri = dep_descri    # {(dep_tdes, dep_cdes)}
+
+
+class ReferenciaStore:
+    """
+    Mantiene la foto vigente de los datos de referencia. Cada recarga arma una
+    foto nueva y la reemplaza en una sola asignación (copy-on-write), así las
+    solicitudes en curso siguen leyendo una versión consistente. Si los datos no
+    cambiaron se conserva la foto vigente y no se invalida la caché HTTP.
+    Mientras no haya foto cargada, los servicios consultan la BD como antes.
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[ReferenciaSnapshot] = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+        self.comprobado: Optional[datetime] = None   # última recarga (cambie o no la foto)
+
+    async def recargar(self) -> ReferenciaSnapshot:
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                tip_result = await db.execute(TIP_TIPVEN_QUERY)
+                tip_tipven = {row.tip_tven: row.tip_clis for row in tip_result}
+                dep_result = await db.execute(DEP_DESCRI_QUERY)
+                dep_descri = frozenset((row.dep_tdes, row.dep_cdes) for row in dep_result)
+
+            self.comprobado = datetime.now()
+            actual = self.snapshot
+            if actual is not None and actual.tip_tipven == tip_tipven and actual.dep_descri == dep_descri:
+                logger.debug(f"Datos de referencia sin cambios (versión {actual.version}).")
+                return actual
+
+            self._version += 1
+            self.snapshot = ReferenciaSnapshot(
+                version=self._version,
+                tip_tipven=MappingProxyType(tip_tipven),
+                dep_descri=dep_descri
+            )
+
+        invalidar_tablas("tip_tipven", "dep_descri")
+        logger.info(f"Datos de referencia cargados (versión {self._version}): "
+                    f"{len(tip_tipven)} tipos de venta, {len(dep_descri)} descripciones.")
+        return self.snapshot
+
+    async def ciclo_refresco(self, intervalo_segundos: int, carga_inicial: bool = True) -> None:
+        """Tarea de fondo: carga inicial (opcional) y recarga periódica."""
+        if not carga_inicial:
+            await asyncio.sleep(intervalo_segundos)
+        while True:
+            try:
+                await self.recargar()
+            except Exception as e:
+                logger.warning(f"No se pudieron recargar los datos de referencia: {e}")
+            await asyncio.sleep(intervalo_segundos)
+
+    def estado(self) -> dict:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"cargado": False, "version": 0}
+        return {
+            "cargado": True,
+            "version": snapshot.version,
+            "fecha_carga": snapshot.cargado.isoformat(timespec="seconds"),
+            "fecha_comprobacion": self.comprobado.isoformat(timespec="seconds") if self.comprobado else None,
+            "tip_tipven": len(snapshot.tip_tipven),
+            "dep_descri": len(snapshot.dep_descri),
+        }
+
+
+referencia_store = ReferenciaStore()
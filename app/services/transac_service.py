@@ -1,13 +1,37 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text, table, column, insert
 from app.utils.api_helpers import raise_api_error
 from fastapi import status
 from app.models.pos_models import TranInLine
+from app.services.historial_service import historial_diferido
+from typing import List
+
+
+# --- Sentencias de inserción (se construyen una sola vez al importar el módulo) ---
+
+# Los 29 campos de la línea, en el mismo orden del modelo TranInLine
+CAMPOS_TRANIN = tuple(TranInLine.model_fields)
+
+def _insert_tranin_query(tabla: str):
+    """SQL de inserción de una línea en trp_tranin o trt_tranin."""
+    return text(
+        f"INSERT INTO {tabla} ({', '.join(CAMPOS_TRANIN)}) "
+        f"VALUES ({', '.join(':' + campo for campo in CAMPOS_TRANIN)})"
+    )
+
+def _insert_tranin_bulk(tabla: str):
+    """INSERT de SQLAlchemy Core: con una lista de parámetros se envía como VALUES de varias filas."""
+    return insert(table(tabla, *(column(campo) for campo in CAMPOS_TRANIN)))
+
+INSERT_TRP_QUERY = _insert_tranin_query("trp_tranin")
+INSERT_TRT_QUERY = _insert_tranin_query("trt_tranin")
+INSERT_TRP_BULK = _insert_tranin_bulk("trp_tranin")
+INSERT_TRT_BULK = _insert_tranin_bulk("trt_tranin")
 
 
 async def ftransac_service(
     data: TranInLine,
-    db: Session
+    db: AsyncSession
 ) -> bool:
     """
     Migración de FUNCTION ftransac().
@@ -23,33 +47,16 @@ async def ftransac_service(
         # pero para seguridad en Python/SQLAlchemy, es mejor que las llamadas 
         # a este servicio estén envueltas en un db.begin() / db.commit().
         
-        # SQL para la inserción (los 26 campos)
-        insert_query = text("""
-            INSERT INTO trp_tranin (
-                trp_calm, trp_cald, trp_ctran, trp_ftra, trp_cdin, trp_ctor, 
-                trp_cdor, trp_cpro, trp_qtra, trp_vpro, trp_vcos, trp_iest, 
-                trp_tven, trp_desp, trp_tdes, trp_viva, trp_tiva, trp_nlin, 
-                trp_ccom, trp_cnit, trp_cmot, trp_lote, trp_vcto, trp_ccos, 
-                trp_cfac, trp_horrec, trp_cospro1, trp_cospro2, trp_cospro3
-            ) VALUES (
-                :trp_calm, :trp_cald, :trp_ctran, :trp_ftra, :trp_cdin, :trp_ctor, 
-                :trp_cdor, :trp_cpro, :trp_qtra, :trp_vpro, :trp_vcos, :trp_iest, 
-                :trp_tven, :trp_desp, :trp_tdes, :trp_viva, :trp_tiva, :trp_nlin, 
-                :trp_ccom, :trp_cnit, :trp_cmot, :trp_lote, :trp_vcto, :trp_ccos, 
-                :trp_cfac, :trp_horrec, :trp_cospro1, :trp_cospro2, :trp_cospro3
-            )
-        """)
-        
         # Convertimos el modelo Pydantic a un diccionario para usarlo como parámetros de SQL
         params = data.model_dump()
         
         # 1. Inserción en la tabla de transacciones actual (trp_tranin)
-        db.execute(insert_query, params)
+        await db.execute(INSERT_TRP_QUERY, params)
         
-        # 2. Inserción en la tabla de transacciones históricas (trt_tranin)
-        # Reutilizamos la misma consulta y parámetros, cambiando solo el nombre de la tabla
-        insert_query_hist = text(insert_query.text.replace("trp_tranin", "trt_tranin"))
-        db.execute(insert_query_hist, params)
+        # 2. Inserción en la tabla de transacciones históricas (trt_tranin),
+        #    diferida al vaciador en segundo plano con HISTORIAL_DIFERIDO
+        if not await historial_diferido.diferir(db, [params]):
+            await db.execute(INSERT_TRT_QUERY, params)
 
         # Nota: ftransac original hacía COMMIT/ROLLBACK fuera de la función; 
         # aquí el commit debe ser manejado por la función que llama a este servicio.
@@ -60,4 +67,33 @@ async def ftransac_service(
         # El 4GL tenía lógica de fibd(2,...) para manejar errores de inserción;
         # Aquí lanzamos una excepción para forzar el ROLLBACK en el nivel superior.
         print(f"Error fatal en ftransac al insertar línea {data.trp_nlin}: {e}")
-        raise e
\ No newline at end of file
+        raise e
+
+
+async def ftransac_bulk_service(
+    lineas: List[TranInLine],
+    db: AsyncSession
+) -> int:
+    """
+    Versión masiva de ftransac: inserta todas las líneas en trp_tranin y trt_tranin
+    con INSERTs de varias filas (executemany por lotes), dos sentencias por lote
+    en lugar de dos por línea. El commit lo hace la función que llama.
+
+    Returns:
+        Número de líneas insertadas.
+    """
+    if not lineas:
+        return 0
+
+    try:
+        params = [linea.model_dump() for linea in lineas]
+
+        await db.execute(INSERT_TRP_BULK, params)
+        if not await historial_diferido.diferir(db, params):
+            await db.execute(INSERT_TRT_BULK, params)
+
+        return len(params)
+
+    except Exception as e:
+        print(f"Error fatal en ftransac masivo al insertar {len(lineas)} líneas: {e}")
+        raise e
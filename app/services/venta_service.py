@@ -1,9 +1,16 @@
-from app.models.pos_models import VentaConfigResponse
-from sqlalchemy.orm import Session
+from app.models.pos_models import VentaConfigResponse, TicketVenta, TranInLine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text
 from app.utils.api_helpers import raise_api_error
+from app.services.inventario_service import (
+    fexplota_receta, fcostos_desglose, factualiza_desglose, fsuma_costos
+)
+from app.services.transac_service import ftransac_bulk_service
+from app.db.unidad_trabajo import fobtiene_uow
+from app.services.referencia_service import referencia_store
 from fastapi import status
-from typing import Literal
+from decimal import Decimal
+from typing import Dict, List, Literal, Tuple
 
 # --- Constantes para la lógica de ftitulff ---
 # Corresponde a grgener1.rgp_csoc
@@ -13,7 +20,7 @@ async def get_venta_config(
     par: int,
     gxprufac: str,
     rgp_csoc: int,
-    db: Session
+    db: AsyncSession
 ) -> VentaConfigResponse:
     """
     Migración de la lógica principal de FUNCTION ftitulff.
@@ -76,6 +83,18 @@ async def get_venta_config(
     # Nota: Tu código 4GL hace esta consulta tanto para rgp_csoc <> 3 como para rgp_csoc == 3
     # (Excepto para la lógica especial de lxindfac="3" y lxnumlis=0, que omitiremos por complejidad inicial)
     
+    # Si los datos de referencia ya están en memoria, no consultamos la BD
+    snapshot = referencia_store.snapshot
+    if snapshot is not None:
+        lxnumlis = snapshot.tip_tipven.get(lxitve)
+        return VentaConfigResponse(
+            lxitve=lxitve,
+            lxdes=lxdes,
+            lxdesfac=lxdesfac,
+            lxnumlis=lxnumlis if lxnumlis is not None else 0,
+            gxprufac=gxprufac
+        )
+
     try:
         query = text("""
             SELECT tip_clis
@@ -83,7 +102,7 @@ async def get_venta_config(
             WHERE tip_tven = :lxitve
         """)
         # Ejecutamos la consulta a la base de datos
-        result = db.execute(query, {'lxitve': lxitve}).scalar_one_or_none()
+        result = (await db.execute(query, {'lxitve': lxitve})).scalar_one_or_none()
         
         # Asignamos el valor, o 0 si no se encuentra
         lxnumlis = result if result is not None else 0
@@ -100,4 +119,70 @@ async def get_venta_config(
         lxdesfac=lxdesfac,
         lxnumlis=lxnumlis,
         gxprufac=gxprufac
-    )
\ No newline at end of file
+    )
+
+
+async def fticket_service(
+    ticket: TicketVenta,
+    db: AsyncSession
+) -> List[Tuple[TranInLine, Tuple[Decimal, Decimal, Decimal]]]:
+    """
+    Registra un ticket completo en una sola transacción:
+    desglosa todas las líneas, descuenta cada ingrediente de ppp_propvt una sola
+    vez (cantidades sumadas entre líneas), inserta las líneas en trp_tranin y
+    trt_tranin con sus costos, y hace un único COMMIT.
+
+    Returns:
+        Lista de (línea registrada, costos (lxcospro1, lxcospro2, lxcospro3)).
+    """
+    if not ticket.lineas:
+        raise_api_error("El ticket no tiene líneas.", status.HTTP_400_BAD_REQUEST)
+
+    rgp_calm = ticket.codigo_almacen
+    otros = sorted({linea.trp_calm for linea in ticket.lineas if linea.trp_calm != rgp_calm})
+    if otros:
+        raise_api_error(
+            f"Las líneas del ticket deben ser del almacén {rgp_calm} (trp_calm {', '.join(map(str, otros))}).",
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    async def unidad():
+        # 1. Desglose de cada línea (cantidades por ingrediente hoja)
+        desgloses: List[Dict[int, Decimal]] = []
+        for linea in ticket.lineas:
+            desgloses.append(await fexplota_receta(
+                db=db,
+                lxcpro=linea.trp_cpro,
+                licantid=linea.trp_qtra,
+                lxtven=linea.trp_tven,
+                lxincsum=ticket.incluir_suministros
+            ))
+
+        # 2. Sumamos los ingredientes de todo el ticket: cada fila se bloquea
+        #    (en orden de ppp_cpro) y se actualiza una sola vez
+        total: Dict[int, Decimal] = {}
+        for cantidades in desgloses:
+            for lxcpro, cantidad in cantidades.items():
+                total[lxcpro] = total.get(lxcpro, Decimal('0')) + cantidad
+
+        costos = {}
+        if total:
+            costos = await fcostos_desglose(db, rgp_calm, list(total))
+            await factualiza_desglose(db, rgp_calm, total, costos)
+
+        # 3. Costos por línea e inserción masiva en trp_tranin / trt_tranin
+        resultado = []
+        for linea, cantidades in zip(ticket.lineas, desgloses):
+            costo_linea = fsuma_costos(cantidades, costos)
+            linea_costeada = linea.model_copy(update={
+                'trp_cospro1': costo_linea[0],
+                'trp_cospro2': costo_linea[1],
+                'trp_cospro3': costo_linea[2],
+            })
+            resultado.append((linea_costeada, costo_linea))
+
+        await ftransac_bulk_service(lineas=[linea for linea, _ in resultado], db=db)
+        return resultado
+
+    # COMMIT ÚNICO del ticket (se repite completo si hay deadlock/serialización)
+    return await fobtiene_uow(db).ejecutar(unidad, "ticket")
@@ -1,34 +1,152 @@
 import os
-from functools import lru_cache
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+
+SYSTEM_DIR = os.environ.get("SYSTEMDIR", "textos")
+
+# Cada cuánto (segundos) se revisa el mtime del archivo para recargarlo
+REVISION_SEGUNDOS = 2.0
+
+# Búsquedas recordadas por tabla (se descartan al recargar el archivo)
+MAX_RESULTADOS = 4096
+
+# Mayor carácter posible: K + FIN_PREFIJO es mayor que cualquier línea que empiece con K
+FIN_PREFIJO = chr(0x10FFFF)
+
+
+class TablaTexto:
+    """
+    Índice de un archivo textos/*.tbl: las líneas ordenadas junto con su número
+    de línea original. Sirve claves de cualquier ancho desde la misma estructura:
+    las líneas que empiezan con la clave forman un rango contiguo (bisect) y,
+    como en la carga original, gana la última línea del archivo.
+    """
+
+    def __init__(self, ruta: str, lineas: List[str], mtime_ns: Optional[int]):
+        self.ruta = ruta
+        self.mtime_ns = mtime_ns
+        self.revisada = time.monotonic()
+        orden = sorted(range(len(lineas)), key=lineas.__getitem__)
+        self.lineas = [lineas[i] for i in orden]
+        self.posiciones = array('I', orden)
+        self._resultados: Dict[str, str] = {}
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "TablaTexto":
+        try:
+            mtime_ns = os.stat(ruta).st_mtime_ns
+            with open(ruta, 'r', encoding='utf-8') as f:
+                lineas = [line.rstrip('\n') for line in f]
+        except FileNotFoundError:
+            print(f"ADVERTENCIA: Archivo de tabla no encontrado: {ruta}")
+            return cls(ruta, [], None)
+        except Exception as e:
+            print(f"ERROR: No se pudo cargar la tabla {ruta}: {e}")
+            return cls(ruta, [], None)
+        return cls(ruta, lineas, mtime_ns)
+
+    def buscar(self, key: str) -> str:
+        """Texto de la clave (lo que sigue a los len(key) primeros caracteres), o ''."""
+        resultado = self._resultados.get(key)
+        if resultado is not None:
+            return resultado
+
+        # bisect_right: las líneas iguales a la clave (sin texto) no cuentan, como en la carga original
+        inicio = bisect_right(self.lineas, key)
+        fin = bisect_left(self.lineas, key + FIN_PREFIJO, inicio)
+
+        resultado = ""
+        if inicio < fin:
+            ultima = max(range(inicio, fin), key=self.posiciones.__getitem__)
+            resultado = self.lineas[ultima][len(key):]
+        if len(self._resultados) < MAX_RESULTADOS:
+            self._resultados[key] = resultado
+        return resultado
+
+    def como_dict(self, key_len: int) -> dict[str, str]:
+        """La tabla con claves de key_len caracteres (formato de la carga original)."""
+        table_data = {}
+        for i in sorted(range(len(self.lineas)), key=self.posiciones.__getitem__):
+            line = self.lineas[i]
+            if len(line) > key_len:
+                table_data[line[:key_len]] = line[key_len:]
+        return table_data
+
+
+class TablasTexto:
+    """Tablas cargadas por nombre; cada una se recarga cuando cambia el mtime de su archivo."""
+
+    def __init__(self, directorio: str, revision_segundos: float = REVISION_SEGUNDOS):
+        self.directorio = directorio
+        self.revision_segundos = revision_segundos
+        self._tablas: Dict[str, TablaTexto] = {}
+        self._lock = threading.Lock()
+        self.recargas = 0
+
+    def _mtime_ns(self, ruta: str) -> Optional[int]:
+        try:
+            return os.stat(ruta).st_mtime_ns
+        except OSError:
+            return None
+
+    def tabla(self, table_name: str) -> TablaTexto:
+        tabla = self._tablas.get(table_name)
+        ahora = time.monotonic()
+        if tabla is not None and ahora - tabla.revisada < self.revision_segundos:
+            return tabla
+
+        with self._lock:
+            tabla = self._tablas.get(table_name)
+            if tabla is not None and time.monotonic() - tabla.revisada < self.revision_segundos:
+                return tabla
+
+            ruta = os.path.join(self.directorio, table_name)
+            if tabla is not None and self._mtime_ns(ruta) == tabla.mtime_ns:
+                tabla.revisada = time.monotonic()
+                return tabla
+
+            if tabla is not None:
+                self.recargas += 1
+            tabla = TablaTexto.cargar(ruta)
+            self._tablas[table_name] = tabla
+            return tabla
+
+    def invalidar(self, table_name: Optional[str] = None) -> None:
+        with self._lock:
+            if table_name is None:
+                self._tablas.clear()
+            else:
+                self._tablas.pop(table_name, None)
+
+    def estadisticas(self) -> dict:
+        return {
+            "tablas": {nombre: len(tabla.lineas) for nombre, tabla in list(self._tablas.items())},
+            "recargas": self.recargas,
+        }
+
+
+tablas_texto = TablasTexto(SYSTEM_DIR)
 
-SYSTEM_DIR = os.environ.get("SYSTEMDIR", "textos") 
 
-@lru_cache(maxsize=128)
 def load_table(table_name: str, key_len: int) -> dict[str, str]:
-    table_data = {}
-    file_path = os.path.join(SYSTEM_DIR, table_name)
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.rstrip('\n')
-                if len(line) > key_len:
-                    key = line[:key_len]
-                    data = line[key_len:]
-                    table_data[key] = data
-    except FileNotFoundError:
-        print(f"ADVERTENCIA: Archivo de tabla no encontrado: {file_path}")
-    except Exception as e:
-        print(f"ERROR: No se pudo cargar la tabla {file_path}: {e}")
-
-    return table_data
+    return tablas_texto.tabla(table_name).como_dict(key_len)
 
 def gettxt(tab: str, key: str) -> str:
     table_name = tab.strip()
     if not table_name:
         return ""
 
-    key_len = len(key)
-    table_content = load_table(table_name, key_len)
-    
-    return table_content.get(key, "")
\ No newline at end of file
+    return tablas_texto.tabla(table_name).buscar(key)
+
+def gettxt_varios(tab: str, keys: Iterable[str]) -> List[str]:
+    """gettxt de muchas claves de la misma tabla (ej: todos los mensajes de un recibo)."""
+    table_name = tab.strip()
+    keys = list(keys)
+    if not table_name:
+        return [""] * len(keys)
+
+    tabla = tablas_texto.tabla(table_name)
+    return [tabla.buscar(key) for key in keys]
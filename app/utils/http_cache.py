@@ -0,0 +1,170 @@
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Type, Union
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.utils.json_rapido import fconstruye, fjson_bytes
+
+# Tablas de las que depende una respuesta: fijas o calculadas a partir de los
+# argumentos del endpoint (por ejemplo, la tabla del listado pedido).
+TablasRespuesta = Union[Iterable[str], Callable[[dict], Iterable[str]]]
+
+
+class EntradaCache:
+    def __init__(self, etag: str, cuerpo: bytes, tablas: frozenset, ttl: int):
+        self.etag = etag
+        self.cuerpo = cuerpo
+        self.tablas = tablas
+        self.expira = time.monotonic() + ttl
+
+
+class RespuestaCache:
+    """
+    Caché de respuestas JSON ya serializadas, por ruta + parámetros de consulta.
+    Cada entrada recuerda las tablas de las que depende para poder invalidarla
+    cuando esas tablas cambian.
+    """
+
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, EntradaCache]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.no_modificados = 0
+        self.invalidadas = 0
+
+    def obtener(self, clave: str) -> Optional[EntradaCache]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.expira <= time.monotonic():
+                self._entradas.pop(clave, None)
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada
+
+    def guardar(self, clave: str, entrada: EntradaCache) -> None:
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def contar_no_modificado(self) -> None:
+        with self._lock:
+            self.no_modificados += 1
+
+    def invalidar_tablas(self, *tablas: str) -> int:
+        """Borra las respuestas que dependen de alguna de las tablas (todas si no se indica)."""
+        with self._lock:
+            claves = [
+                clave for clave, entrada in self._entradas.items()
+                if not tablas or entrada.tablas.intersection(tablas)
+            ]
+            for clave in claves:
+                del self._entradas[clave]
+            self.invalidadas += len(claves)
+        return len(claves)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "no_modificados_304": self.no_modificados,
+                "invalidadas": self.invalidadas,
+            }
+
+
+respuesta_cache = RespuestaCache(max_entradas=settings.HTTP_CACHE_MAX_ENTRADAS)
+
+
+def invalidar_tablas(*tablas: str) -> int:
+    """Llamar después de confirmar (COMMIT) cambios en esas tablas."""
+    return respuesta_cache.invalidar_tablas(*tablas)
+
+
+def fetag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    etiquetas = [e.strip() for e in if_none_match.split(",")]
+    return "*" in etiquetas or etag in etiquetas or f"W/{etag}" in etiquetas
+
+
+def fserializa(resultado, modelo: Optional[Type[BaseModel]] = None) -> bytes:
+    """Cuerpo JSON del resultado de un endpoint, como lo serializaría FastAPI con response_model."""
+    if settings.JSON_RAPIDO:
+        # Resultado de un servicio propio: se serializa sin revalidar
+        if modelo is not None and resultado is not None:
+            resultado = fconstruye(modelo, resultado)
+        return fjson_bytes(resultado)
+    if modelo is not None and resultado is not None:
+        resultado = modelo.model_validate(resultado)
+    return json.dumps(
+        jsonable_encoder(resultado), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def cache_http(
+    tablas: TablasRespuesta,
+    modelo: Optional[Type[BaseModel]] = None,
+    ttl: Optional[int] = None,
+    max_age: int = 0
+):
+    """
+    Decorador para endpoints GET de solo lectura (el endpoint debe recibir
+    'request: Request'). Guarda la respuesta serializada en el servidor, calcula
+    un ETag fuerte sobre el cuerpo y responde 304 si coincide con If-None-Match.
+
+    Args:
+        tablas: Tablas de las que depende la respuesta (para invalidar).
+        modelo: response_model del endpoint; se valida antes de serializar
+                (con JSON_RAPIDO solo se completan sus valores por defecto).
+        ttl: Segundos de vida en el servidor (HTTP_CACHE_TTL por defecto);
+             0 = sin caché (se ejecuta el endpoint en cada solicitud).
+        max_age: Cache-Control max-age para el cliente; 0 = 'no-cache'
+                 (el cliente siempre revalida con el ETag).
+    """
+    vida = ttl if ttl is not None else settings.HTTP_CACHE_TTL
+
+    def decorador(func):
+        if vida <= 0:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs["request"]
+            clave = f"{request.url.path}?{'&'.join(sorted(f'{k}={v}' for k, v in request.query_params.multi_items()))}"
+
+            entrada = respuesta_cache.obtener(clave)
+            if entrada is None:
+                resultado = await func(*args, **kwargs)
+                if isinstance(resultado, Response):
+                    return resultado
+                cuerpo = fserializa(resultado, modelo)
+                etag = '"' + hashlib.sha256(cuerpo).hexdigest()[:32] + '"'
+                dependencias = tablas(kwargs) if callable(tablas) else tablas
+                entrada = EntradaCache(etag, cuerpo, frozenset(dependencias), vida)
+                respuesta_cache.guardar(clave, entrada)
+
+            headers = {
+                "ETag": entrada.etag,
+                "Cache-Control": f"private, max-age={max_age}" if max_age > 0 else "no-cache",
+            }
+            if fetag_coincide(request.headers.get("if-none-match"), entrada.etag):
+                respuesta_cache.contar_no_modificado()
+                return Response(status_code=304, headers=headers)
+            return Response(content=entrada.cuerpo, media_type="application/json", headers=headers)
+        return wrapper
+    return decorador
@@ -0,0 +1,300 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set, Type
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.unidad_trabajo import fobtiene_uow
+from app.utils.api_helpers import raise_api_error
+from app.utils.http_cache import fserializa
+
+logger = logging.getLogger(__name__)
+
+ENCABEZADO = "Idempotency-Key"
+ENCABEZADO_REPETIDA = "Idempotent-Replayed"
+
+# Tabla de PostgreSQL con las respuestas confirmadas (crear con este DDL; también
+# está en benchmarks/esquema.sql). La clave y la respuesta se guardan en la misma
+# transacción que la operación: o se confirman las tres cosas o ninguna.
+IDEMPOTENCIA_DDL = """
+    CREATE TABLE IF NOT EXISTS idp_claves (
+        idp_clave       VARCHAR(260) PRIMARY KEY,
+        idp_huella      CHAR(64) NOT NULL,
+        idp_codigo      INTEGER,
+        idp_cuerpo      BYTEA,
+        idp_media_type  VARCHAR(100),
+        idp_expira      TIMESTAMPTZ NOT NULL
+    )
+"""
+
+# Reclama la clave (o una vencida). Si otra transacción la tiene sin confirmar,
+# el INSERT espera a que termine: si confirma, no devuelve fila; si se deshace, reclama.
+RECLAMA_CLAVE_QUERY = text("""
+    INSERT INTO idp_claves (idp_clave, idp_huella, idp_expira)
+    VALUES (:clave, :huella, now() + CAST(:ttl AS INTEGER) * INTERVAL '1 second')
+    ON CONFLICT (idp_clave) DO UPDATE
+        SET idp_huella = EXCLUDED.idp_huella, idp_codigo = NULL, idp_cuerpo = NULL,
+            idp_media_type = NULL, idp_expira = EXCLUDED.idp_expira
+        WHERE idp_claves.idp_expira < now()
+    RETURNING idp_clave
+""")
+
+GUARDADA_QUERY = text("""
+    SELECT idp_huella, idp_codigo, idp_cuerpo, idp_media_type
+    FROM idp_claves
+    WHERE idp_clave = :clave
+""")
+
+GUARDA_RESPUESTA_QUERY = text("""
+    UPDATE idp_claves
+    SET idp_codigo = :codigo, idp_cuerpo = :cuerpo, idp_media_type = :media_type
+    WHERE idp_clave = :clave
+""")
+
+PURGA_QUERY = text("DELETE FROM idp_claves WHERE idp_expira < now()")
+
+# Claves en curso en esta máquina (SQLite compartido por los workers)
+EN_CURSO_DDL = """
+    CREATE TABLE IF NOT EXISTS en_curso (
+        clave TEXT PRIMARY KEY,
+        expira REAL NOT NULL
+    )
+"""
+
+# Cada cuánto (segundos) se borran las claves vencidas
+PURGA_SEGUNDOS = 300
+
+# Intervalo de consulta mientras otro worker procesa la misma clave
+SONDEO_SEGUNDOS = 0.1
+
+MAX_LARGO_CLAVE = 200
+
+
+class Guardada:
+    """Respuesta ya confirmada de una clave."""
+
+    def __init__(self, codigo: int, cuerpo: bytes, media_type: str):
+        self.codigo = codigo
+        self.cuerpo = cuerpo
+        self.media_type = media_type
+
+    def respuesta(self) -> Response:
+        return Response(
+            content=self.cuerpo, status_code=self.codigo, media_type=self.media_type,
+            headers={ENCABEZADO_REPETIDA: "true"}
+        )
+
+
+class AlmacenIdempotencia:
+    """
+    Claves de idempotencia. La respuesta confirmada vive en PostgreSQL
+    (idp_claves), escrita en la misma transacción que la operación, así que
+    una caída entre el COMMIT y el guardado no puede repetir la operación y
+    los reintentos que llegan a otra máquina también se reconocen.
+
+    Para no ocupar conexiones esperando, los duplicados concurrentes esperan
+    antes de tocar la BD: los del mismo worker en un asyncio.Event y los de
+    otros workers de la máquina consultando un SQLite local con las claves en
+    curso (solo 'en curso', sin respuestas). Las llamadas a SQLite van en un hilo.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._en_curso: Dict[str, asyncio.Event] = {}
+        self._purgas: Set[asyncio.Task] = set()
+        self._purgada = 0.0
+        self.ejecutadas = 0
+        self.repetidas = 0
+        self.esperas = 0
+        self.rechazadas = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute(EN_CURSO_DDL)
+            self._conexion = conexion
+        return self._conexion
+
+    # --- En curso en la máquina (SQLite, desde hilos) ---
+
+    def reclamar(self, clave: str) -> bool:
+        """Marca la clave en curso si está libre o si la marca venció (worker caído)."""
+        ahora = time.time()
+        with self._lock:
+            cursor = self._db().execute(
+                "INSERT INTO en_curso (clave, expira) VALUES (?, ?) "
+                "ON CONFLICT (clave) DO UPDATE SET expira = excluded.expira WHERE en_curso.expira < ?",
+                (clave, ahora + settings.IDEMPOTENCIA_EN_CURSO_SEGUNDOS, ahora)
+            )
+            return cursor.rowcount > 0
+
+    def liberar(self, clave: str) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM en_curso WHERE clave = ?", (clave,))
+
+    async def _esperar_turno(self, clave: str) -> None:
+        """Espera a que no haya otra solicitud con la clave en curso en esta máquina; 409 si no termina a tiempo."""
+        limite = time.monotonic() + settings.IDEMPOTENCIA_ESPERA_SEGUNDOS
+        while True:
+            evento = self._en_curso.get(clave)
+            if evento is not None:
+                # Duplicado concurrente en este worker: espera al que está en curso
+                self.esperas += 1
+                try:
+                    await asyncio.wait_for(evento.wait(), max(limite - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    break
+                continue
+
+            if await asyncio.to_thread(self.reclamar, clave):
+                return
+            # En curso en otro worker: consulta hasta que termine o venza
+            if time.monotonic() >= limite:
+                break
+            self.esperas += 1
+            await asyncio.sleep(SONDEO_SEGUNDOS)
+
+        raise_api_error(
+            "Hay una solicitud con la misma clave de idempotencia en curso; reintente más tarde.",
+            status.HTTP_409_CONFLICT
+        )
+
+    # --- Respuesta confirmada (PostgreSQL, dentro de la unidad de trabajo) ---
+
+    async def _unidad(self, db: AsyncSession, clave: str, huella: str, funcion) -> Response:
+        reclamada = (await db.execute(RECLAMA_CLAVE_QUERY, {
+            'clave': clave, 'huella': huella, 'ttl': settings.IDEMPOTENCIA_TTL
+        })).first()
+        if reclamada is None:
+            guardada = (await db.execute(GUARDADA_QUERY, {'clave': clave})).first()
+            if guardada is None:
+                raise_api_error(
+                    "La clave de idempotencia cambió durante la solicitud; reintente.", status.HTTP_409_CONFLICT
+                )
+            if guardada.idp_huella != huella:
+                self.rechazadas += 1
+                raise_api_error(
+                    f"La clave de idempotencia ya se usó con otra solicitud ({ENCABEZADO}: {clave.split(':', 1)[1]}).",
+                    422  # Unprocessable Content
+                )
+            self.repetidas += 1
+            return Guardada(guardada.idp_codigo, guardada.idp_cuerpo, guardada.idp_media_type).respuesta()
+
+        respuesta = await funcion()
+        await db.execute(GUARDA_RESPUESTA_QUERY, {
+            'clave': clave, 'codigo': respuesta.status_code,
+            'cuerpo': respuesta.body, 'media_type': respuesta.media_type
+        })
+        self.ejecutadas += 1
+        return respuesta
+
+    async def ejecutar(self, db: AsyncSession, nombre: str, clave: str, huella: str, funcion) -> Response:
+        """
+        Ejecuta 'funcion' (el endpoint) como transacción externa de la unidad de
+        trabajo de db, junto con el registro de la clave y su respuesta. Los
+        servicios del endpoint corren anidados (SAVEPOINT) y un deadlock repite todo.
+        """
+        await self._esperar_turno(clave)
+        evento = self._en_curso[clave] = asyncio.Event()
+        try:
+            respuesta = await fobtiene_uow(db).ejecutar(
+                lambda: self._unidad(db, clave, huella, funcion), f"idempotente:{nombre}"
+            )
+        finally:
+            del self._en_curso[clave]
+            try:
+                await asyncio.to_thread(self.liberar, clave)
+            except sqlite3.Error:
+                # La marca vence sola en IDEMPOTENCIA_EN_CURSO_SEGUNDOS
+                logger.exception(f"No se pudo liberar la clave en curso {clave}")
+            evento.set()
+        self._purgar()
+        return respuesta
+
+    def _purgar(self) -> None:
+        """Cada PURGA_SEGUNDOS borra de PostgreSQL las claves vencidas, en segundo plano."""
+        ahora = time.monotonic()
+        if ahora - self._purgada < PURGA_SEGUNDOS:
+            return
+        self._purgada = ahora
+        tarea = asyncio.get_running_loop().create_task(self._purgar_pg())
+        self._purgas.add(tarea)
+        tarea.add_done_callback(self._purgas.discard)
+
+    async def _purgar_pg(self) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(PURGA_QUERY)
+                await db.commit()
+        except Exception:
+            logger.exception("No se pudieron purgar las claves de idempotencia vencidas")
+
+    def estadisticas(self) -> dict:
+        return {
+            "en_curso_maquina": self.ruta,
+            "en_curso_worker": len(self._en_curso),
+            "ejecutadas": self.ejecutadas,
+            "repetidas": self.repetidas,
+            "esperas": self.esperas,
+            "rechazadas": self.rechazadas,
+        }
+
+
+almacen_idempotencia = AlmacenIdempotencia(settings.IDEMPOTENCIA_RUTA)
+
+
+def idempotente(nombre: str, modelo: Optional[Type[BaseModel]] = None):
+    """
+    Decorador para endpoints POST que mueven inventario o registran transacciones
+    (el endpoint debe recibir 'request: Request' y 'db'). Con el encabezado
+    Idempotency-Key, el endpoint y el registro de la clave con su respuesta
+    se confirman en una sola transacción; durante IDEMPOTENCIA_TTL segundos
+    los reintentos con la misma clave reciben esa respuesta sin volver a
+    ejecutar el endpoint (encabezado Idempotent-Replayed). La misma clave con
+    otro cuerpo o parámetros es un error 422. Sin el encabezado no cambia nada.
+
+    Args:
+        nombre: Espacio de claves del endpoint (la misma clave en otro endpoint es otra).
+        modelo: response_model del endpoint, para serializar como lo haría FastAPI.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs["request"]
+            clave_cliente = request.headers.get(ENCABEZADO)
+            if not clave_cliente:
+                return await func(*args, **kwargs)
+            if len(clave_cliente) > MAX_LARGO_CLAVE:
+                raise_api_error(f"{ENCABEZADO} demasiado larga (máximo {MAX_LARGO_CLAVE}).")
+
+            huella = hashlib.sha256()
+            huella.update(f"{request.method} {request.url.path}?".encode("utf-8"))
+            huella.update("&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items())).encode("utf-8"))
+            huella.update(b"\n")
+            huella.update(await request.body())
+
+            async def ejecutar() -> Response:
+                resultado = await func(*args, **kwargs)
+                if isinstance(resultado, Response):
+                    return resultado
+                return Response(content=fserializa(resultado, modelo), media_type="application/json")
+
+            return await almacen_idempotencia.ejecutar(
+                kwargs["db"], nombre, f"{nombre}:{clave_cliente}", huella.hexdigest(), ejecutar
+            )
+        return wrapper
+    return decorador
@@ -0,0 +1,68 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Callable, Optional, Type
+
+from fastapi import Response
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError: # orjson es opcional: sin él se usa json de la biblioteca estándar
+    orjson = None
+
+
+def fjson_default(valor: Any) -> Any:
+    """
+    Tipos que el serializador no maneja de forma nativa, con la misma salida que
+    FastAPI con response_model (pydantic en modo JSON): Decimal como texto
+    exacto ("12.50"), fechas en ISO 8601 y modelos como diccionario.
+    """
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, BaseModel):
+        return valor.model_dump()
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def fjson_bytes(contenido: Any, default: Callable[[Any], Any] = fjson_default) -> bytes:
+    """JSON compacto en UTF-8 (orjson si está instalado)."""
+    if orjson is not None:
+        return orjson.dumps(contenido, default=default)
+    return json.dumps(contenido, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fconstruye(modelo: Type[BaseModel], resultado: Any) -> Any:
+    """
+    Respuesta de un servicio propio lista para serializar sin volver a validarla:
+    los modelos se dejan como están y los diccionarios se completan con los
+    valores por defecto del modelo (model_construct no valida).
+    """
+    if isinstance(resultado, dict):
+        return modelo.model_construct(**resultado)
+    return resultado
+
+
+class RespuestaJSON(Response):
+    """JSONResponse con fjson_bytes: acepta modelos, Decimal y fechas directamente."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return fjson_bytes(content)
+
+
+def frespuesta(resultado: Any, modelo: Optional[Type[BaseModel]] = None) -> Any:
+    """
+    Con JSON_RAPIDO devuelve el resultado ya serializado: FastAPI no lo vuelve a
+    validar contra response_model ni pasa por jsonable_encoder. Sin JSON_RAPIDO
+    devuelve el resultado tal cual (ruta normal de FastAPI).
+    """
+    if not settings.JSON_RAPIDO:
+        return resultado
+    if modelo is not None:
+        resultado = fconstruye(modelo, resultado)
+    return RespuestaJSON(resultado)
@@ -0,0 +1,92 @@
+"""
+Prueba de carga simple: N terminales concurrentes golpean un endpoint durante
+un tiempo fijo y se reportan solicitudes/segundo y latencias.
+
+Uso (servidor corriendo con un solo worker de uvicorn):
+
+    python benchmarks/bench_carga.py --url http://localhost:8000/api/venta/configuracion?tipo_venta=961 \
+        --concurrencia 50 --duracion 30 --etiqueta despues
+
+Para comparar antes/después se corre contra el commit anterior a la capa
+asíncrona y contra este, con la misma etiqueta de endpoint y concurrencia.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+
+async def terminal(cliente: httpx.AsyncClient, metodo: str, url: str, fin: float,
+                   latencias: list[float], errores: list[int]):
+    """Simula una terminal que envía solicitudes una tras otra hasta 'fin'."""
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.request(metodo, url)
+            if respuesta.status_code >= 500:
+                errores.append(respuesta.status_code)
+        except httpx.HTTPError:
+            errores.append(0)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+
+async def correr(url: str, metodo: str, concurrencia: int, duracion: float) -> dict:
+    latencias: list[float] = []
+    errores: list[int] = []
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+
+    async with httpx.AsyncClient(limits=limites, timeout=30) as cliente:
+        inicio = time.perf_counter()
+        fin = inicio + duracion
+        await asyncio.gather(*(
+            terminal(cliente, metodo, url, fin, latencias, errores) for _ in range(concurrencia)
+        ))
+        transcurrido = time.perf_counter() - inicio
+
+    return {
+        "url": url,
+        "metodo": metodo,
+        "concurrencia": concurrencia,
+        "duracion_s": round(transcurrido, 2),
+        "solicitudes": len(latencias),
+        "errores": len(errores),
+        "rps": round(len(latencias) / transcurrido, 1),
+        "p50_ms": round(percentil(latencias, 50), 2),
+        "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+        "media_ms": round(statistics.fmean(latencias), 2) if latencias else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de un endpoint del POS.")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--metodo", default="GET")
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--duracion", type=float, default=30)
+    parser.add_argument("--etiqueta", default="", help="Ej: 'antes' / 'despues'")
+    parser.add_argument("--salida", help="Archivo JSON Lines donde se agrega el resultado")
+    args = parser.parse_args()
+
+    resultado = asyncio.run(correr(args.url, args.metodo.upper(), args.concurrencia, args.duracion))
+    resultado["etiqueta"] = args.etiqueta
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.salida:
+        with open(args.salida, "a", encoding="utf-8") as f:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Microbenchmark de serialización de respuestas: costo por solicitud de armar el
+cuerpo JSON de una página de listado y de un ticket, con la ruta normal de
+FastAPI (response_model: validación + serialización de pydantic), la ruta
+anterior de cache_http (model_validate + jsonable_encoder) y JSON_RAPIDO
+(model_construct + fjson_bytes). Verifica además que los tres cuerpos sean iguales.
+
+Uso (desde la raíz del proyecto, con las variables de entorno de la app):
+
+    python benchmarks/bench_json.py --filas 100 1000 10000 --repeticiones 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from app.api.endpoints.listados import PaginatedListResponse  # noqa: E402
+from app.api.endpoints.venta import TicketVentaResponse  # noqa: E402
+from app.models.pos_models import DesglosResult  # noqa: E402
+from app.utils import json_rapido  # noqa: E402
+
+
+def fpagina(filas: int) -> dict:
+    """Página de listado como la arma flistado_service (dicts con Decimal y fechas)."""
+    return {
+        "total_rows": filas * 10,
+        "total_pages": 10,
+        "current_page": 1,
+        "items": [
+            {
+                "ppp_cpro": i,
+                "ppp_dpro": f"PRODUCTO {i} ÑANDÚ",
+                "ppp_qinv": Decimal(i) / Decimal(8),
+                "ppp_vcos": Decimal("1234.50"),
+                "ppp_fult": date(2026, 1, 1 + i % 28),
+            }
+            for i in range(filas)
+        ],
+        "next_cursor": None,
+    }
+
+
+def fticket(filas: int) -> TicketVentaResponse:
+    return TicketVentaResponse(
+        success=True,
+        message="Ticket registrado correctamente.",
+        num_lineas=filas,
+        lineas=[
+            DesglosResult(
+                costo_materia_prima=1.25 * i, costo_suministros=0.1, costo_mano_obra=0.0,
+                cantidad_vendida=2.0, codigo_producto=i
+            )
+            for i in range(filas)
+        ],
+    )
+
+
+def ruta_fastapi(modelo, resultado) -> bytes:
+    """Endpoint con response_model: FastAPI valida y serializa con pydantic (dump_json)."""
+    campo = create_model_field(name="Response", type_=modelo, mode="serialization")
+    return asyncio.run(serialize_response(field=campo, response_content=resultado, dump_json=True))
+
+
+def ruta_cache_http(modelo, resultado) -> bytes:
+    """Ruta anterior de cache_http: model_validate + jsonable_encoder + json.dumps."""
+    return json.dumps(
+        jsonable_encoder(modelo.model_validate(resultado)), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def ruta_rapida(modelo, resultado) -> bytes:
+    return json_rapido.fjson_bytes(json_rapido.fconstruye(modelo, resultado))
+
+
+def medir(funcion, modelo, resultado, repeticiones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion(modelo, resultado)
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"orjson: {'sí' if json_rapido.orjson is not None else 'no (json estándar)'}")
+    print(f"{'respuesta':<10} {'filas':>7} {'fastapi ms':>11} {'cache_http ms':>14} {'rápida ms':>10}  iguales")
+    for filas in args.filas:
+        casos = (
+            ("listado", PaginatedListResponse, fpagina(filas)),
+            ("ticket", TicketVentaResponse, fticket(filas)),
+        )
+        for nombre, modelo, resultado in casos:
+            cuerpos = {ruta(modelo, resultado) for ruta in (ruta_fastapi, ruta_cache_http, ruta_rapida)}
+            tiempos = [medir(ruta, modelo, resultado, args.repeticiones) for ruta in (ruta_fastapi, ruta_cache_http, ruta_rapida)]
+            print(f"{nombre:<10} {filas:>7} {tiempos[0]:>11.2f} {tiempos[1]:>14.2f} {tiempos[2]:>10.2f}  {len(cuerpos) == 1}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Benchmark de los caminos calientes del POS contra una base cargada con
+benchmarks/semilla.py. Cada escenario pone N terminales concurrentes a
+enviar solicitudes durante un tiempo fijo y reporta solicitudes/segundo,
+latencias (p50/p95/p99/máx), errores y sentencias SQL / tiempo SQL por
+solicitud (tomados de /metrics).
+
+Por defecto la app corre en el mismo proceso (httpx.ASGITransport, con su
+lifespan y calentamiento): el resultado mide la app y la base, sin la red
+ni uvicorn. Con --url se mide un servidor ya levantado.
+
+Uso (desde la raíz del proyecto, con las variables de entorno de la app):
+
+    python benchmarks/bench_pos.py correr --etiqueta antes --salida antes.json
+    python benchmarks/bench_pos.py correr --escenarios ticket desglose --concurrencia 20 --duracion 30
+    python benchmarks/bench_pos.py comparar antes.json despues.json --tolerancia 10
+
+Los escenarios ticket y desglose descuentan inventario y escriben en
+trp_tranin/trt_tranin: para repetir una corrida en las mismas condiciones se
+vuelve a cargar la semilla.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semilla import PALABRAS, TIPOS_VENTA  # noqa: E402
+
+Solicitud = Tuple[str, str, Optional[dict]]  # (método, ruta, cuerpo JSON)
+
+# Series de /metrics que se comparan antes y después de cada escenario
+SERIE = re.compile(r'^(pos_solicitud_(?:sentencias_sql|sql_segundos)_(?:sum|count))\{endpoint="([^"]*)"\} (\S+)$')
+ENDPOINT_METRICAS = "GET /metrics"
+
+PRODUCTOS_QUERY = """
+    SELECT DISTINCT T1.fop_cpro
+    FROM fop_compro AS T1
+    JOIN inp_produc AS T2 ON T2.inp_cpro = T1.fop_cpro
+    WHERE T2.inp_itpr <> 21
+    ORDER BY T1.fop_cpro
+"""
+CAJAS_QUERY = "SELECT cjp_calm, cjp_ccaj FROM cjp_recaja WHERE cjp_iact = 'A' ORDER BY 1, 2"
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+class Datos:
+    """Códigos de la base sembrada que usan los escenarios."""
+
+    def __init__(self, productos: List[int], cajas: List[Tuple[int, int]]):
+        self.productos = productos
+        self.cajas = cajas
+
+    @classmethod
+    def cargar(cls) -> "Datos":
+        from sqlalchemy import text
+        from app.db.database import engine
+        with engine.connect() as conn:
+            productos = [row[0] for row in conn.execute(text(PRODUCTOS_QUERY))]
+            cajas = [tuple(row) for row in conn.execute(text(CAJAS_QUERY))]
+        if not productos:
+            raise SystemExit("La base no tiene recetas: cargarla con benchmarks/semilla.py")
+        return cls(productos, cajas)
+
+
+def flinea_ticket(azar: random.Random, datos: Datos, almacen: int, nlin: int) -> dict:
+    """Línea de ticket (TicketLinea, sin trp_cospro1..3) de un producto de venta al azar."""
+    hoy = date.today().isoformat()
+    vpro = round(azar.uniform(1000, 90000), 2)
+    return {
+        "trp_calm": almacen, "trp_cald": almacen, "trp_ctran": 10, "trp_ftra": hoy,
+        "trp_cdin": 1, "trp_ctor": 1, "trp_cdor": 1, "trp_cpro": azar.choice(datos.productos),
+        "trp_qtra": azar.randint(1, 3), "trp_vpro": vpro, "trp_vcos": 0, "trp_iest": "A",
+        "trp_tven": azar.choice(TIPOS_VENTA), "trp_desp": "N", "trp_tdes": 0,
+        "trp_viva": round(vpro * 0.19, 2), "trp_tiva": 19, "trp_nlin": nlin, "trp_ccom": "BENCH",
+        "trp_cnit": 222222222, "trp_cmot": 0, "trp_lote": 0, "trp_vcto": hoy, "trp_ccos": 0,
+        "trp_cfac": 0, "trp_horrec": datetime.now().strftime("%H:%M:%S"),
+    }
+
+
+def fticket(azar: random.Random, datos: Datos) -> Solicitud:
+    almacen = azar.choice(datos.cajas)[0] if datos.cajas else 1
+    lineas = [flinea_ticket(azar, datos, almacen, n + 1) for n in range(azar.randint(1, 6))]
+    return "POST", "/api/venta/ticket", {"codigo_almacen": almacen, "incluir_suministros": "S", "lineas": lineas}
+
+
+def fdesglose(azar: random.Random, datos: Datos) -> Solicitud:
+    producto = azar.choice(datos.productos)
+    return "POST", (
+        f"/api/inventario/desglose_venta?codigo_producto={producto}&cantidad={azar.randint(1, 3)}"
+        f"&tipo_venta={azar.choice(TIPOS_VENTA)}&codigo_almacen=1"
+    ), None
+
+
+def flistado(azar: random.Random, datos: Datos) -> Solicitud:
+    busqueda = azar.choice(PALABRAS)[:azar.randint(3, 5)]
+    return "GET", f"/api/listado/productos?search={busqueda}&page={azar.randint(1, 3)}&limit=20", None
+
+
+def flistado_cursor(azar: random.Random, datos: Datos) -> Solicitud:
+    return "GET", "/api/listado/productos?modo=cursor&conteo=ninguno&limit=50", None
+
+
+def fconfiguracion(azar: random.Random, datos: Datos) -> Solicitud:
+    return "GET", f"/api/venta/configuracion?tipo_venta={azar.choice(TIPOS_VENTA)}", None
+
+
+def fcaja(azar: random.Random, datos: Datos) -> Solicitud:
+    almacen, caja = azar.choice(datos.cajas) if datos.cajas else (1, 1)
+    return "GET", f"/api/caja/verificar_apertura?codigo_caja={caja}&codigo_almacen={almacen}", None
+
+
+# Mezcla de una terminal de venta: consulta de productos, verificación de caja y tickets
+MEZCLA_TERMINAL = ((flistado, 4), (fcaja, 2), (fconfiguracion, 1), (fticket, 3))
+
+
+def fmixto(azar: random.Random, datos: Datos) -> Solicitud:
+    generadores, pesos = zip(*MEZCLA_TERMINAL)
+    return azar.choices(generadores, pesos)[0](azar, datos)
+
+
+ESCENARIOS: Dict[str, Callable[[random.Random, Datos], Solicitud]] = {
+    "configuracion": fconfiguracion,
+    "caja": fcaja,
+    "listado": flistado,
+    "listado_cursor": flistado_cursor,
+    "desglose": fdesglose,
+    "ticket": fticket,
+    "mixto": fmixto,
+}
+
+
+async def fmetricas(cliente: httpx.AsyncClient) -> Dict[str, float]:
+    """Sumas de sentencias y tiempo SQL de todos los endpoints (menos /metrics)."""
+    totales: Dict[str, float] = {}
+    for linea in (await cliente.get("/metrics")).text.splitlines():
+        coincidencia = SERIE.match(linea)
+        if coincidencia and coincidencia.group(2) != ENDPOINT_METRICAS:
+            serie = coincidencia.group(1)
+            totales[serie] = totales.get(serie, 0.0) + float(coincidencia.group(3))
+    return totales
+
+
+async def terminal(cliente: httpx.AsyncClient, generador, datos: Datos, semilla: int, fin: float,
+                   latencias: List[float], errores: Dict[str, int]):
+    """Una terminal: envía solicitudes una tras otra hasta 'fin'."""
+    azar = random.Random(semilla)
+    while time.perf_counter() < fin:
+        metodo, ruta, cuerpo = generador(azar, datos)
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.request(metodo, ruta, json=cuerpo)
+            if respuesta.status_code >= 400:
+                errores[str(respuesta.status_code)] = errores.get(str(respuesta.status_code), 0) + 1
+        except httpx.HTTPError as e:
+            errores[type(e).__name__] = errores.get(type(e).__name__, 0) + 1
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+
+async def fescenario(cliente: httpx.AsyncClient, nombre: str, datos: Datos, args) -> dict:
+    generador = ESCENARIOS[nombre]
+
+    if args.calentamiento > 0:
+        fin = time.perf_counter() + args.calentamiento
+        await asyncio.gather(*(
+            terminal(cliente, generador, datos, args.semilla + 1000 + i, fin, [], {}) for i in range(args.concurrencia)
+        ))
+
+    antes = await fmetricas(cliente)
+    latencias: List[float] = []
+    errores: Dict[str, int] = {}
+    inicio = time.perf_counter()
+    fin = inicio + args.duracion
+    await asyncio.gather(*(
+        terminal(cliente, generador, datos, args.semilla + i, fin, latencias, errores) for i in range(args.concurrencia)
+    ))
+    transcurrido = time.perf_counter() - inicio
+    despues = await fmetricas(cliente)
+
+    def delta(serie: str) -> float:
+        return despues.get(serie, 0.0) - antes.get(serie, 0.0)
+
+    medidas = delta("pos_solicitud_sentencias_sql_count") or None
+    return {
+        "concurrencia": args.concurrencia,
+        "duracion_s": round(transcurrido, 2),
+        "solicitudes": len(latencias),
+        "errores": errores,
+        "rps": round(len(latencias) / transcurrido, 1),
+        "p50_ms": round(percentil(latencias, 50), 2),
+        "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+        "max_ms": round(max(latencias, default=0.0), 2),
+        "sentencias_por_solicitud": round(delta("pos_solicitud_sentencias_sql_sum") / medidas, 2) if medidas else None,
+        "sql_ms_por_solicitud": round(delta("pos_solicitud_sql_segundos_sum") * 1000 / medidas, 3) if medidas else None,
+    }
+
+
+def fcommit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def fcorrer(args) -> dict:
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    datos = Datos.cargar()
+    resultado = {
+        "etiqueta": args.etiqueta,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": fcommit(),
+        "python": platform.python_version(),
+        "destino": args.url or "en proceso",
+        "semilla": args.semilla,
+        "escenarios": {},
+    }
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60) as cliente:
+            for nombre in args.escenarios:
+                resultado["escenarios"][nombre] = await fescenario(cliente, nombre, datos, args)
+                print(f"{nombre}: {json.dumps(resultado['escenarios'][nombre], ensure_ascii=False)}")
+        return resultado
+
+    from app.main import app
+    from app.core.config import settings
+    from app.services.arranque_service import calentamiento
+    resultado["configuracion"] = {
+        campo: getattr(settings, campo) for campo in (
+            "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "JSON_RAPIDO", "CATALOGO_CACHE", "RECETAS_CACHE_TTL",
+            "HTTP_CACHE_TTL", "CAJA_CACHE_TTL", "SQL_PERFIL",
+        )
+    }
+    async with app.router.lifespan_context(app):
+        while not calentamiento.listo:
+            await asyncio.sleep(0.1)
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", limits=limites, timeout=60) as cliente:
+            for nombre in args.escenarios:
+                resultado["escenarios"][nombre] = await fescenario(cliente, nombre, datos, args)
+                print(f"{nombre}: {json.dumps(resultado['escenarios'][nombre], ensure_ascii=False)}")
+    return resultado
+
+
+def fcomparar(base: dict, nuevo: dict, tolerancia: float) -> bool:
+    """
+    Imprime la diferencia por escenario. Es regresión si rps baja o p95 sube más
+    de 'tolerancia' por ciento, o si aumentan las sentencias por solicitud.
+    """
+    regresion = False
+    print(f"{base.get('etiqueta') or 'base'} ({base.get('commit')}) -> {nuevo.get('etiqueta') or 'nuevo'} ({nuevo.get('commit')})")
+    print(f"{'escenario':<16} {'rps':>18} {'p95 ms':>20} {'sentencias':>14}")
+    for nombre, actual in nuevo["escenarios"].items():
+        anterior = base["escenarios"].get(nombre)
+        if anterior is None:
+            print(f"{nombre:<16} (sin base)")
+            continue
+
+        def cambio(campo: str) -> float:
+            return (actual[campo] - anterior[campo]) / anterior[campo] * 100 if anterior[campo] else 0.0
+
+        marcas = []
+        if cambio("rps") < -tolerancia:
+            marcas.append("rps")
+        if cambio("p95_ms") > tolerancia:
+            marcas.append("p95")
+        sentencias = (anterior.get("sentencias_por_solicitud"), actual.get("sentencias_por_solicitud"))
+        if None not in sentencias and sentencias[1] > sentencias[0]:
+            marcas.append("sentencias")
+        regresion |= bool(marcas)
+
+        print(
+            f"{nombre:<16} {anterior['rps']:>7} -> {actual['rps']:<7} {anterior['p95_ms']:>8} -> {actual['p95_ms']:<9}"
+            f" {sentencias[0]!s:>5} -> {sentencias[1]!s:<5}"
+            f" {'REGRESIÓN: ' + ', '.join(marcas) if marcas else ''}"
+        )
+    return regresion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    correr = subparsers.add_parser("correr", help="Corre los escenarios")
+    correr.add_argument("--escenarios", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    correr.add_argument("--concurrencia", type=int, default=20)
+    correr.add_argument("--duracion", type=float, default=20)
+    correr.add_argument("--calentamiento", type=float, default=3, help="Segundos sin medir antes de cada escenario")
+    correr.add_argument("--semilla", type=int, default=1)
+    correr.add_argument("--url", help="Servidor ya levantado (ej: http://localhost:8000); por defecto en proceso")
+    correr.add_argument("--etiqueta", default="")
+    correr.add_argument("--salida", help="Archivo JSON con el resultado")
+
+    comparar = subparsers.add_parser("comparar", help="Compara dos resultados")
+    comparar.add_argument("base")
+    comparar.add_argument("nuevo")
+    comparar.add_argument("--tolerancia", type=float, default=10, help="Por ciento")
+
+    args = parser.parse_args()
+
+    if args.comando == "comparar":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.nuevo, encoding="utf-8") as f:
+            nuevo = json.load(f)
+        return 1 if fcomparar(base, nuevo, args.tolerancia) else 0
+
+    resultado = asyncio.run(fcorrer(args))
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+-- Esquema mínimo para los benchmarks (benchmarks/semilla.py): solo las tablas y
+-- columnas que usa la API, con las claves e índices que sus consultas suponen.
+-- No reemplaza el esquema de producción.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DROP TABLE IF EXISTS ppp_propvt, inp_produc, fop_compro, cop_costos, trp_tranin, trt_tranin,
+    tip_tipven, dep_descri, cjp_recaja, prp_person, idp_claves, hdt_tokens CASCADE;
+
+CREATE TABLE inp_produc (
+    inp_cpro    INTEGER PRIMARY KEY,
+    inp_itpr    INTEGER NOT NULL            -- 21 = sub-receta
+);
+
+CREATE TABLE fop_compro (
+    fop_tven    INTEGER NOT NULL,
+    fop_cpro    INTEGER NOT NULL,           -- receta
+    fop_cfor    INTEGER NOT NULL,           -- componente
+    fop_qfor    NUMERIC(14, 4) NOT NULL,
+    fop_icom    CHAR(1),                    -- 'S' = suministro
+    PRIMARY KEY (fop_tven, fop_cpro, fop_cfor)
+);
+
+CREATE TABLE ppp_propvt (
+    ppp_calm    INTEGER NOT NULL,
+    ppp_cpro    INTEGER NOT NULL,
+    ppp_dpro    VARCHAR(60),
+    ppp_qinv    NUMERIC(14, 4),
+    ppp_vcos    NUMERIC(14, 2),
+    ppp_tippro  INTEGER,                    -- 1 materia prima, 2 suministro, 3 mano de obra
+    PRIMARY KEY (ppp_calm, ppp_cpro)
+);
+CREATE INDEX ppp_propvt_dpro_trgm ON ppp_propvt USING gin (ppp_dpro gin_trgm_ops);
+
+CREATE TABLE cop_costos (
+    cop_calm    INTEGER NOT NULL,
+    cop_cpro    INTEGER NOT NULL,
+    cop_vcos    NUMERIC(14, 2),
+    PRIMARY KEY (cop_calm, cop_cpro)
+);
+
+CREATE TABLE tip_tipven (
+    tip_tven    INTEGER PRIMARY KEY,
+    tip_clis    INTEGER
+);
+
+CREATE TABLE dep_descri (
+    dep_tdes    CHAR(1) NOT NULL,
+    dep_cdes    INTEGER NOT NULL,
+    PRIMARY KEY (dep_tdes, dep_cdes)
+);
+
+CREATE TABLE cjp_recaja (
+    cjp_calm    INTEGER NOT NULL,
+    cjp_ccaj    INTEGER NOT NULL,
+    cjp_iope    INTEGER NOT NULL,
+    cjp_iact    CHAR(1),
+    cjp_ccjr    INTEGER,
+    PRIMARY KEY (cjp_calm, cjp_ccaj, cjp_iope)
+);
+
+CREATE TABLE prp_person (
+    prp_calm    INTEGER NOT NULL,
+    prp_cper    INTEGER NOT NULL,
+    prp_dper    VARCHAR(60),
+    prp_ccar    INTEGER,
+    PRIMARY KEY (prp_calm, prp_cper)
+);
+
+CREATE TABLE trp_tranin (
+    trp_calm    INTEGER,
+    trp_cald    INTEGER,
+    trp_ctran   INTEGER,
+    trp_ftra    DATE,
+    trp_cdin    INTEGER,
+    trp_ctor    INTEGER,
+    trp_cdor    INTEGER,
+    trp_cpro    INTEGER,
+    trp_qtra    NUMERIC(14, 4),
+    trp_vpro    NUMERIC(14, 2),
+    trp_vcos    NUMERIC(14, 2),
+    trp_iest    CHAR(1),
+    trp_tven    INTEGER,
+    trp_desp    CHAR(1),
+    trp_tdes    NUMERIC(14, 2),
+    trp_viva    NUMERIC(14, 2),
+    trp_tiva    NUMERIC(14, 2),
+    trp_nlin    INTEGER,
+    trp_ccom    VARCHAR(20),
+    trp_cnit    NUMERIC(16, 0),
+    trp_cmot    INTEGER,
+    trp_lote    INTEGER,
+    trp_vcto    DATE,
+    trp_ccos    INTEGER,
+    trp_cfac    INTEGER,
+    trp_horrec  VARCHAR(8),
+    trp_cospro1 NUMERIC(14, 2),
+    trp_cospro2 NUMERIC(14, 2),
+    trp_cospro3 NUMERIC(14, 2)
+);
+CREATE INDEX trp_tranin_ftra ON trp_tranin (trp_ftra, trp_horrec, trp_nlin);
+
+CREATE TABLE trt_tranin (LIKE trp_tranin);
+CREATE INDEX trt_tranin_ftra ON trt_tranin (trp_ftra, trp_horrec, trp_nlin);
+
+-- Claves de idempotencia (app/utils/idempotencia.py, IDEMPOTENCIA_DDL)
+CREATE TABLE idp_claves (
+    idp_clave       VARCHAR(260) PRIMARY KEY,
+    idp_huella      CHAR(64) NOT NULL,
+    idp_codigo      INTEGER,
+    idp_cuerpo      BYTEA,
+    idp_media_type  VARCHAR(100),
+    idp_expira      TIMESTAMPTZ NOT NULL
+);
+
+-- Tokens del historial diferido (app/services/historial_service.py, HISTORIAL_DDL)
+CREATE TABLE hdt_tokens (
+    hdt_token   VARCHAR(32) PRIMARY KEY,
+    hdt_creado  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,227 @@
+"""
+Carga una base PostgreSQL local con datos sintéticos para los benchmarks
+(benchmarks/bench_pos.py). Crea el esquema de benchmarks/esquema.sql (borra
+esas tablas si ya existen) y genera, de forma reproducible con --semilla:
+
+- ingredientes (materia prima, suministros y mano de obra) con inventario y costo estimado
+- sub-recetas (inp_itpr = 21) anidadas hasta --niveles niveles
+- productos de venta con su receta para cada tipo de venta (960-964)
+- cajas abiertas con cajero (fverape) y tipos de venta / descripciones de referencia
+- --meses meses de historial en trt_tranin (el último mes también en trp_tranin)
+
+Uso (DATABASE_URL de una base desechable, nunca la de producción):
+
+    python benchmarks/semilla.py --productos 5000 --meses 6
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import psycopg2
+
+ESQUEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "esquema.sql")
+
+TIPOS_VENTA = (960, 961, 962, 963, 964)
+
+# Rangos de códigos: el benchmark los reconoce por inp_itpr, no por el rango
+BASE_SUBRECETA = 100000
+BASE_VENTA = 200000
+
+# trp_ctran del historial: 1 = compra (entrada), 10 = venta (desglose)
+CTRAN_COMPRA = 1
+CTRAN_VENTA = 10
+
+PALABRAS = (
+    "POLLO", "RES", "CERDO", "ARROZ", "PAPA", "YUCA", "QUESO", "TOMATE", "CEBOLLA", "AJO",
+    "LIMON", "MANGO", "FRESA", "LECHE", "CREMA", "HARINA", "AZUCAR", "SAL", "ACEITE", "MAIZ",
+    "FRIJOL", "HUEVO", "PAN", "SALSA", "CAFE", "TE", "CHOCOLATE", "VAINILLA", "NARANJA", "PIÑA",
+    "ÑAME", "PLATANO", "AGUACATE", "PEPINO", "LECHUGA", "ZANAHORIA", "PIMIENTA", "COMINO", "MIEL", "NUEZ",
+)
+PRESENTACIONES = ("KG", "LB", "UND", "LT", "GR", "PORCION", "BOLSA", "CAJA", "PAQ", "BANDEJA")
+
+
+class Generador:
+    def __init__(self, args):
+        self.args = args
+        self.azar = random.Random(args.semilla)
+        self.ingredientes = list(range(1, args.ingredientes + 1))
+        self.tippro = {}            # ppp_tippro de los ingredientes
+        self.subrecetas = []        # por nivel: [[códigos nivel 1], [nivel 2], ...]
+        self.ventas = []
+
+    def descripcion(self, codigo: int) -> str:
+        azar = self.azar
+        palabras = " ".join(azar.sample(PALABRAS, azar.randint(1, 3)))
+        return f"{palabras} {azar.choice(PRESENTACIONES)} {codigo}"[:60]
+
+    def productos(self):
+        """Filas de inp_produc y ppp_propvt (todos los almacenes) y cop_costos."""
+        azar = self.azar
+        inp, ppp, cop = [], [], []
+        for codigo in self.ingredientes:
+            tippro = 1 if azar.random() < 0.85 else (2 if azar.random() < 0.85 else 3)
+            self.tippro[codigo] = tippro
+            inp.append((codigo, 1))
+            descripcion = self.descripcion(codigo)
+            costo = round(azar.uniform(50, 50000), 2)
+            for almacen in range(1, self.args.almacenes + 1):
+                ppp.append((almacen, codigo, descripcion, round(azar.uniform(500, 100000), 4), costo, tippro))
+                cop.append((almacen, codigo, round(costo * azar.uniform(0.9, 1.1), 2)))
+
+        codigo = BASE_SUBRECETA
+        for _ in range(self.args.niveles):
+            nivel = []
+            for _ in range(self.args.subrecetas // self.args.niveles):
+                codigo += 1
+                nivel.append(codigo)
+                inp.append((codigo, 21))
+            self.subrecetas.append(nivel)
+
+        for i in range(self.args.productos):
+            codigo = BASE_VENTA + i + 1
+            self.ventas.append(codigo)
+            inp.append((codigo, 2))
+            descripcion = self.descripcion(codigo)
+            for almacen in range(1, self.args.almacenes + 1):
+                ppp.append((almacen, codigo, descripcion, 0, 0, 1))
+        return inp, ppp, cop
+
+    def componentes(self, nivel: int):
+        """Componentes de una receta: ingredientes y sub-recetas de niveles inferiores."""
+        azar = self.azar
+        elegidos = set(azar.sample(self.ingredientes, azar.randint(2, 8)))
+        for inferior in self.subrecetas[:nivel]:
+            if inferior and azar.random() < 0.6:
+                elegidos.update(azar.sample(inferior, min(len(inferior), azar.randint(1, 2))))
+        return sorted(elegidos)
+
+    def recetas(self):
+        """fop_compro: la misma estructura para todos los tipos de venta, con cantidades propias."""
+        azar = self.azar
+        estructura = []
+        for nivel, codigos in enumerate(self.subrecetas):
+            for codigo in codigos:
+                estructura.append((codigo, self.componentes(nivel)))
+        for codigo in self.ventas:
+            estructura.append((codigo, self.componentes(len(self.subrecetas))))
+
+        filas = []
+        for tven in TIPOS_VENTA:
+            for receta, componentes in estructura:
+                for componente in componentes:
+                    icom = 'S' if self.tippro.get(componente) == 2 else 'N'
+                    filas.append((tven, receta, componente, round(azar.uniform(0.01, 3), 4), icom))
+        return filas
+
+    def referencia(self):
+        tip = [(tven, i + 1) for i, tven in enumerate(TIPOS_VENTA)]
+        dep = [('C', 903)] + [('O', c) for c in range(1, 50)]
+        cajas, personas = [], []
+        for almacen in range(1, self.args.almacenes + 1):
+            for caja in range(1, self.args.cajas + 1):
+                cajas.append((almacen, caja, 903, 'A', caja))
+                personas.append((almacen, caja, f"CAJERO {almacen}-{caja}", 2))
+        return tip, dep, cajas, personas
+
+    def historia(self):
+        """Líneas de trt_tranin día por día: compras de ingredientes y ventas de productos."""
+        azar = self.azar
+        hoy = date.today()
+        inicio = hoy - timedelta(days=30 * self.args.meses)
+        dia = inicio
+        while dia < hoy:
+            nlin = 0
+            for _ in range(self.args.lineas_dia):
+                nlin += 1
+                segundos = azar.randint(6 * 3600, 23 * 3600)
+                horrec = f"{segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+                almacen = azar.randint(1, self.args.almacenes)
+                if azar.random() < 0.1:
+                    ctran, cpro, tven = CTRAN_COMPRA, azar.choice(self.ingredientes), 0
+                    qtra = round(azar.uniform(10, 500), 4)
+                else:
+                    ctran, cpro, tven = CTRAN_VENTA, azar.choice(self.ventas), azar.choice(TIPOS_VENTA)
+                    qtra = azar.randint(1, 4)
+                vpro = round(azar.uniform(1000, 90000), 2)
+                yield (
+                    almacen, almacen, ctran, dia, 1, 1, 1, cpro, qtra, vpro, round(vpro * 0.4, 2), 'A', tven,
+                    'N', 0, round(vpro * 0.19, 2), 19, nlin, f"B{dia:%y%m%d}", 222222222, 0, 0, dia, 0,
+                    nlin // 5 + 1, horrec, round(vpro * 0.3, 2), round(vpro * 0.05, 2), round(vpro * 0.05, 2),
+                )
+            dia += timedelta(days=1)
+
+
+def fcopia(cursor, tabla: str, filas, por_bloque: int = 50000) -> int:
+    """COPY ... FROM STDIN en bloques (sin cargar toda la tabla en memoria)."""
+    total = 0
+    buffer = io.StringIO()
+    for fila in filas:
+        buffer.write("\t".join("\\N" if v is None else str(v) for v in fila))
+        buffer.write("\n")
+        total += 1
+        if total % por_bloque == 0:
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {tabla} FROM STDIN", buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {tabla} FROM STDIN", buffer)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="Por defecto DATABASE_URL")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--almacenes", type=int, default=2)
+    parser.add_argument("--ingredientes", type=int, default=3000)
+    parser.add_argument("--subrecetas", type=int, default=600)
+    parser.add_argument("--niveles", type=int, default=3, help="Niveles de anidación de sub-recetas")
+    parser.add_argument("--productos", type=int, default=2000, help="Productos de venta")
+    parser.add_argument("--cajas", type=int, default=20)
+    parser.add_argument("--meses", type=int, default=6)
+    parser.add_argument("--lineas-dia", type=int, default=2000)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("Falta --dsn o DATABASE_URL")
+
+    generador = Generador(args)
+    inicio = time.perf_counter()
+    conexion = psycopg2.connect(args.dsn)
+    try:
+        with conexion, conexion.cursor() as cursor:
+            with open(ESQUEMA, encoding="utf-8") as f:
+                cursor.execute(f.read())
+
+            inp, ppp, cop = generador.productos()
+            tip, dep, cajas, personas = generador.referencia()
+            conteos = {
+                "inp_produc": fcopia(cursor, "inp_produc", inp),
+                "ppp_propvt": fcopia(cursor, "ppp_propvt", ppp),
+                "cop_costos": fcopia(cursor, "cop_costos", cop),
+                "fop_compro": fcopia(cursor, "fop_compro", generador.recetas()),
+                "tip_tipven": fcopia(cursor, "tip_tipven", tip),
+                "dep_descri": fcopia(cursor, "dep_descri", dep),
+                "cjp_recaja": fcopia(cursor, "cjp_recaja", cajas),
+                "prp_person": fcopia(cursor, "prp_person", personas),
+                "trt_tranin": fcopia(cursor, "trt_tranin", generador.historia()),
+            }
+            ultimo_mes = date.today() - timedelta(days=30)
+            cursor.execute("INSERT INTO trp_tranin SELECT * FROM trt_tranin WHERE trp_ftra >= %s", (ultimo_mes,))
+            conteos["trp_tranin"] = cursor.rowcount
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE")
+    finally:
+        conexion.close()
+
+    for tabla, conteo in conteos.items():
+        print(f"{tabla:<12} {conteo:>10}")
+    print(f"Semilla {args.semilla} cargada en {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())